@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 """Base class for api services."""
 
+import collections
 import contextlib
 import email.mime.multipart as mime_multipart
 import email.mime.nonmultipart as mime_nonmultipart
+import functools
 import httplib
+import itertools
 import logging
+import re
+import socket
+import threading
 import types
 import urllib
 import urlparse
@@ -15,17 +21,17 @@ from apiclient import errors as apiclient_errors
 from apiclient import http as apiclient_http
 from apiclient import mimeparse
 import apiclient.model
+from concurrent import futures
 import httplib2
 from protorpc import message_types
 from protorpc import messages
 
-import gflags as flags
-
+from apitools.base.py import batch
 from apitools.base.py import credentials_lib
 from apitools.base.py import encoding
 from apitools.base.py import exceptions
-
-FLAGS = flags.FLAGS
+from apitools.base.py import http_wrapper
+from apitools.base.py import list_pager
 
 # TODO(craigcitro): Remove this once we quiet the spurious logging in
 # oauth2client (or drop oauth2client).
@@ -95,6 +101,41 @@ class ApiMethodInfo(messages.Message):
 REQUEST_IS_BODY = '<request>'
 
 
+def _FrozenConfigType(message_type):
+  field_names = [field.name for field in sorted(
+      message_type.all_fields(), key=lambda field: field.number)]
+  return collections.namedtuple(
+      'Frozen%s' % message_type.__name__, field_names)
+
+
+_FROZEN_CONFIG_TYPES = dict(
+    (message_type, _FrozenConfigType(message_type))
+    for message_type in (ApiMethodInfo, ApiUploadInfo))
+
+
+def FreezeConfig(config):
+  """Return an immutable copy of an ApiMethodInfo or ApiUploadInfo.
+
+  The copy is a namedtuple with the same fields as config, in which
+  repeated fields are tuples and message fields are frozen in turn.
+  """
+  values = []
+  for field in config.all_fields():
+    value = getattr(config, field.name)
+    if field.repeated:
+      value = tuple(value)
+    elif value is not None and isinstance(field, messages.MessageField):
+      value = FreezeConfig(value)
+    values.append((field.name, value))
+  return _FROZEN_CONFIG_TYPES[type(config)](**dict(values))
+
+
+def FreezeConfigs(configs):
+  """Return a copy of a dict of configs, with every config frozen."""
+  return dict((name, FreezeConfig(config))
+              for name, config in configs.iteritems())
+
+
 def _LoadClass(name, messages_module):
   if name.startswith('message_types.'):
     _, _, classname = name.partition('.')
@@ -105,6 +146,14 @@ def _LoadClass(name, messages_module):
     raise exceptions.GeneratedClientError('Unknown class %s' % name)
 
 
+def _HasField(message_type, field_name):
+  try:
+    message_type.field_by_name(field_name)
+  except KeyError:
+    return False
+  return True
+
+
 def _RequireClassAttrs(obj, attrs):
   for attr in attrs:
     attr_name = attr.upper()
@@ -131,6 +180,126 @@ def NormalizeApiEndpoint(api_endpoint):
   return api_endpoint
 
 
+class _PathTemplate(object):
+  """A method URL, compiled from the client URL and a relative path.
+
+  The relative path is joined against the client URL once, and the
+  result is split into literal and parameter segments, so that
+  building a URL for a request is a single join over the segments.
+  """
+  _PARAM_RE = re.compile(r'{([^{}]*)}')
+
+  def __init__(self, base_url, relative_path, path_params):
+    url = urlparse.urljoin(base_url, relative_path)
+    literals = []
+    params = []
+    current = []
+    for i, segment in enumerate(self._PARAM_RE.split(url)):
+      if i % 2 == 0:
+        current.append(segment)
+      elif segment in path_params:
+        literals.append(''.join(current))
+        params.append(segment)
+        current = []
+      else:
+        # Leave unknown templates in the URL untouched.
+        current.append('{%s}' % segment)
+    literals.append(''.join(current))
+    for param in path_params:
+      if param not in params:
+        raise exceptions.InvalidUserInputError(
+            'Missing path parameter %s' % param)
+    self.__prefix = literals[0]
+    self.__segments = tuple(itertools.izip(params, literals[1:]))
+
+  def Expand(self, quoted_params):
+    """Return the URL, given a dict of already-quoted path parameters."""
+    pieces = [self.__prefix]
+    for param, literal in self.__segments:
+      pieces.append(quoted_params[param])
+      pieces.append(literal)
+    return ''.join(pieces)
+
+
+class _MethodCallPlan(collections.namedtuple('_MethodCallPlan', [
+    'request_type', 'response_type', 'body_type', 'request_field',
+    'query_params', 'path_params', 'path_template', 'global_param_names',
+    'model_class'])):
+  """Resolved per-method information needed to call an API method.
+
+  Fields:
+    request_type: message class of the request.
+    response_type: message class of the response.
+    body_type: message class of the request body, or None.
+    request_field: the request_field from the method config.
+    query_params: (tuple) query parameters for the method.
+    path_params: (tuple) path parameters for the method.
+    path_template: (_PathTemplate) compiled URL for the method.
+    global_param_names: (tuple) names of the StandardQueryParameters
+        fields.
+    model_class: the model class to use for non-download requests.
+  """
+  __slots__ = ()
+
+  def GetBodyValue(self, request):
+    if self.request_field == REQUEST_IS_BODY:
+      return request
+    elif self.request_field:
+      return getattr(request, self.request_field)
+    return None
+
+
+class CallResult(collections.namedtuple(
+    'CallResult', ['request', 'response', 'exception'])):
+  """The outcome of a single call made by BaseApiClient.Map.
+
+  Fields:
+    request: the request message for the call.
+    response: the response message, or None if the call failed.
+    exception: the exception raised by the call, or None.
+  """
+  __slots__ = ()
+
+  @property
+  def is_error(self):
+    return self.exception is not None
+
+  @classmethod
+  def FromFuture(cls, request, future):
+    exception = future.exception()
+    if exception is not None:
+      return cls(request, None, exception)
+    return cls(request, future.result(), None)
+
+
+def _DecodeResponse(response_type, unused_response_info, content):
+  """Decode the content of a successful response as response_type."""
+  if not content:
+    return response_type()
+  try:
+    return encoding.JsonToMessage(response_type, content)
+  except (exceptions.InvalidDataFromServerError, ValueError,
+          messages.ValidationError, messages.DecodeError) as e:
+    raise exceptions.InvalidDataFromServerError(
+        'Error decoding response "%s" as type %s: %s' % (
+            content, response_type, e))
+
+
+def _DecodePartialResponse(field_mask, unused_response_info, content):
+  """Decode the fields in field_mask of a successful response."""
+  try:
+    return field_mask.JsonToMessage(content)
+  except (exceptions.InvalidDataFromServerError, ValueError,
+          messages.ValidationError, messages.DecodeError) as e:
+    raise exceptions.InvalidDataFromServerError(
+        'Error decoding response "%s" as type %s: %s' % (
+            content, field_mask.message_type, e))
+
+
+def _ReturnContent(unused_response_info, content):
+  return content
+
+
 class BaseApiModel(apiclient.model.JsonModel):
   """Base model for generated clients."""
   alt_param = None
@@ -139,42 +308,14 @@ class BaseApiModel(apiclient.model.JsonModel):
                *args, **kwds):
     self.__request_type = request_type
     self.__response_type = response_type
-    self.__log_request = log_request
-    self.__log_response = log_response
+    # Request logging is handled by the client's request_logger; these
+    # are kept for compatibility with existing subclasses.
+    self.log_request = log_request
+    self.log_response = log_response
     # TODO(craigcitro): Remove this field when we switch to proto2.
     self.include_fields = None
     super(BaseApiModel, self).__init__(*args, **kwds)
 
-  # TODO(craigcitro): Delete these methods once we don't have to
-  # support both variations of apiclient.
-  @staticmethod
-  def _GetDumpFlag():
-    if hasattr(FLAGS, 'dump_request_response'):
-      return FLAGS.dump_request_response
-    else:
-      return apiclient.model.dump_request_response
-
-  @staticmethod
-  def _SetDumpFlag(value):
-    if hasattr(FLAGS, 'dump_request_response'):
-      FLAGS.dump_request_response = value
-    else:
-      apiclient.model.dump_request_response = value
-
-  def _log_request(self, *args, **kwds):
-    old_value = self._GetDumpFlag()
-    if self.__log_request:
-      self._SetDumpFlag(True)
-    super(BaseApiModel, self)._log_request(*args, **kwds)
-    self._SetDumpFlag(old_value)
-
-  def _log_response(self, *args, **kwds):
-    old_value = self._GetDumpFlag()
-    if self.__log_response:
-      self._SetDumpFlag(True)
-    super(BaseApiModel, self)._log_response(*args, **kwds)
-    self._SetDumpFlag(old_value)
-
   def serialize(self, body_value):
     """Serialize a message (which might involve ProtoRPC messages)."""
     _Typecheck(body_value, self.__request_type)
@@ -185,8 +326,8 @@ class BaseApiModel(apiclient.model.JsonModel):
     """Deserialize a message (which might involve ProtoRPC messages)."""
     try:
       message = encoding.JsonToMessage(self.__response_type, content)
-    except (exceptions.InvalidDataFromServerError,
-            messages.ValidationError) as e:
+    except (exceptions.InvalidDataFromServerError, ValueError,
+            messages.ValidationError, messages.DecodeError) as e:
       raise exceptions.InvalidDataFromServerError(
           'Error decoding response "%s" as type %s: %s' % (
               content, self.__response_type, e))
@@ -205,8 +346,50 @@ class BaseMediaDownloadModel(BaseApiModel):
     return ''
 
 
+class _PerMethodSetting(object):
+  """A client setting, with a value for the client and for single methods.
+
+  A value set for a method id, such as 'storage.objects.get', takes
+  precedence over the value set for the whole client.
+  """
+
+  def __init__(self, default=None):
+    self.__default = default
+    self.__method_values = {}
+
+  def Set(self, value, method_id=None):
+    if method_id is None:
+      self.__default = value
+    else:
+      self.__method_values[method_id] = value
+
+  def Get(self, method_id, service_value=None):
+    """Return the value for method_id.
+
+    Args:
+      method_id: (str) the id of the method.
+      service_value: (default: None) if not None, a value set for the
+          service of the method, which takes precedence over the value
+          for the client (but not over one for method_id).
+
+    Returns:
+      The value to use for method_id.
+    """
+    if method_id in self.__method_values:
+      return self.__method_values[method_id]
+    if service_value is not None:
+      return service_value
+    return self.__default
+
+
 class BaseApiClient(object):
-  """Base class for client libraries."""
+  """Base class for client libraries.
+
+  Retry policies, response caches, request compression, rate limiters
+  and request coalescing can be set for the whole client, or for a
+  single method by passing its method id (such as
+  'storage.objects.get'), which overrides the client-wide value.
+  """
   MESSAGES_MODULE = None
 
   _API_KEY = ''
@@ -218,15 +401,21 @@ class BaseApiClient(object):
 
   def __init__(self, url, credentials=None, get_credentials=True, http=None,
                model=None, log_request=False, log_response=False,
-               default_global_params=None):
+               default_global_params=None, http_pool_size=None):
     _RequireClassAttrs(self, (
         '_package', '_scopes', '_client_id', '_client_secret',
         'messages_module'))
+    self.__params_type = None
     if default_global_params is not None:
       _Typecheck(default_global_params, self.params_type)
     self.__default_global_params = default_global_params
+    self.__default_global_params_dict = None
     self.log_request = log_request
     self.log_response = log_response
+    self.__request_logger = None
+    self.__flag_request_loggers = {}
+    # A custom model only takes effect through apiclient.
+    self.apiclient_compatibility_mode = model is not None
     self._base_model_class = model or BaseApiModel
     self._url = url
     self._credentials = credentials
@@ -239,17 +428,71 @@ class BaseApiClient(object):
       self._credentials = credentials_lib.GetCredentials(
           self._PACKAGE, self._SCOPES, self._CLIENT_ID, self._CLIENT_SECRET,
           self._USER_AGENT, api_key=self._API_KEY, client=self)
-    self._http = http or httplib2.Http()
-    # Note that "no credentials" is totally possible.
-    if self._credentials is not None:
-      self._http = self._credentials.authorize(self._http)
+    if http_pool_size is not None:
+      if http is not None:
+        raise exceptions.ConfigurationValueError(
+            'Cannot specify both http and http_pool_size')
+      # Pooled connections are each authorized with our credentials.
+      self._http = http_wrapper.HttpPool(
+          max_size=http_pool_size, credentials=self._credentials)
+    else:
+      self._http = http or httplib2.Http()
+      # Note that "no credentials" is totally possible.
+      if self._credentials is not None:
+        self._http = self._credentials.authorize(self._http)
+    # Async calls can only create a pool of their own if we created
+    # our http object, since a custom one may carry its own credentials.
+    self.__custom_http = http is not None
     # TODO(craigcitro): Remove this field when we switch to proto2.
     self.__include_fields = None
+    self.__http_pool = None
+    self.async_pool_size = 10
+    # The number of threads calls are made on concurrently; None means
+    # one per connection in the http pool they use.
+    self.async_max_workers = None
+    self.__executor = None
+    self.__executor_lock = threading.Lock()
+    self.__retry_policies = _PerMethodSetting()
+    self.__response_caches = _PerMethodSetting()
+    self.__request_compressions = _PerMethodSetting()
+    self.__rate_limiters = _PerMethodSetting()
+    self.__circuit_breaker = None
+    self.__coalesce_requests = _PerMethodSetting(default=False)
+    self.__single_flight = http_wrapper.SingleFlight()
+    # Redirects are followed (and permanent ones cached) by the client,
+    # except in apiclient compatibility mode, where httplib2 follows them.
+    self.max_redirects = 5
+    # Ask the server for gzipped responses. (httplib2 decompresses
+    # them transparently.)
+    self.accept_gzip = True
+    self.redirect_cache = http_wrapper.RedirectCache()
 
   @property
   def base_model_class(self):
     return self._base_model_class
 
+  @property
+  def request_logger(self):
+    """The RequestLogger used for calls made by this client, or None.
+
+    Unless a logger has been set explicitly, this is built from the
+    current values of log_request and log_response, so changing those
+    takes effect on the next call.
+    """
+    if self.__request_logger is not None:
+      return self.__request_logger
+    flags = (bool(self.log_request), bool(self.log_response))
+    if not any(flags):
+      return None
+    if flags not in self.__flag_request_loggers:
+      self.__flag_request_loggers[flags] = http_wrapper.RequestLogger(
+          log_request=flags[0], log_response=flags[1])
+    return self.__flag_request_loggers[flags]
+
+  @request_logger.setter
+  def request_logger(self, value):
+    self.__request_logger = value
+
   @property
   def http(self):
     return self._http
@@ -258,13 +501,24 @@ class BaseApiClient(object):
   def url(self):
     return self._url
 
+  @property
+  def user_agent(self):
+    return self._USER_AGENT or '%s-generated/0.1' % self._PACKAGE
+
+  @property
+  def include_fields(self):
+    return self.__include_fields
+
   @classmethod
   def GetScopes(cls):
     return cls._SCOPES
 
   @property
   def params_type(self):
-    return _LoadClass('StandardQueryParameters', self.MESSAGES_MODULE)
+    if self.__params_type is None:
+      self.__params_type = _LoadClass(
+          'StandardQueryParameters', self.MESSAGES_MODULE)
+    return self.__params_type
 
   @property
   def _default_global_params(self):
@@ -275,11 +529,270 @@ class BaseApiClient(object):
   def AddGlobalParam(self, name, value):
     params = self._default_global_params
     setattr(params, name, value)
+    self.__default_global_params_dict = None
 
   @property
   def global_params(self):
     return encoding.CopyProtoMessage(self._default_global_params)
 
+  @property
+  def default_global_params_dict(self):
+    """The default global params, as a dict.
+
+    The dict maps each field of params_type to the value that would be
+    sent for it when not overridden on a given call, and omits fields
+    whose value is None. It is copied from a snapshot which is rebuilt
+    by AddGlobalParam, so callers may modify the returned dict.
+
+    Returns:
+      A dict of field name -> value.
+    """
+    if self.__default_global_params_dict is None:
+      params = self._default_global_params
+      snapshot = {}
+      for field in params.all_fields():
+        value = getattr(params, field.name)
+        if field.repeated:
+          value = tuple(value)
+        if value is not None:
+          snapshot[field.name] = value
+      self.__default_global_params_dict = snapshot
+    return dict(self.__default_global_params_dict)
+
+  def SetRetryPolicy(self, retry_policy, method_id=None):
+    """Set the retry policy for this client, or for a single method.
+
+    Args:
+      retry_policy: (http_wrapper.RetryPolicy) the policy to use, or
+          None to disable retries.
+      method_id: (str, default: None) the method to set the policy for.
+    """
+    self.__retry_policies.Set(retry_policy, method_id=method_id)
+
+  def GetRetryPolicy(self, method_id):
+    """Return the retry policy to use for method_id, or None."""
+    return self.__retry_policies.Get(method_id)
+
+  def SetResponseCache(self, response_cache, method_id=None):
+    """Cache GET responses for this client, or for a single method.
+
+    Args:
+      response_cache: (http_wrapper.ResponseCache) the cache to use, or
+          None to disable caching.
+      method_id: (str, default: None) the method to set the cache for.
+    """
+    self.__response_caches.Set(response_cache, method_id=method_id)
+
+  def GetResponseCache(self, method_id):
+    """Return the response cache to use for method_id, or None."""
+    return self.__response_caches.Get(method_id)
+
+  def SetRequestCompression(self, min_size, method_id=None):
+    """Gzip large request bodies for this client, or a single method.
+
+    Args:
+      min_size: (int) compress bodies of at least this many bytes, or
+          None to send bodies uncompressed.
+      method_id: (str, default: None) the method to set min_size for.
+    """
+    self.__request_compressions.Set(min_size, method_id=method_id)
+
+  def GetRequestCompression(self, method_id):
+    """Return the minimum body size to compress for method_id, or None."""
+    return self.__request_compressions.Get(method_id)
+
+  def SetRateLimiter(self, rate_limiter, method_id=None):
+    """Limit the rate of calls made by this client, or a single method.
+
+    Args:
+      rate_limiter: (http_wrapper.RateLimiter) the limiter to use, or
+          None for no limit.
+      method_id: (str, default: None) the method to set the limiter for.
+    """
+    self.__rate_limiters.Set(rate_limiter, method_id=method_id)
+
+  def GetRateLimiter(self, method_id, service_rate_limiter=None):
+    """Return the rate limiter to use for method_id, or None.
+
+    A limiter set for method_id takes precedence over
+    service_rate_limiter, which takes precedence over the limiter set
+    for the whole client.
+    """
+    return self.__rate_limiters.Get(
+        method_id, service_value=service_rate_limiter)
+
+  @property
+  def circuit_breaker(self):
+    return self.__circuit_breaker
+
+  def SetCircuitBreakers(self, circuit_breakers):
+    """Fail fast while this client's host is failing.
+
+    Args:
+      circuit_breakers: (http_wrapper.CircuitBreakerGroup) the group
+          holding the circuit breaker for each host, which may be
+          shared with other clients; or None to disable.
+    """
+    if circuit_breakers is None:
+      self.__circuit_breaker = None
+    else:
+      self.__circuit_breaker = circuit_breakers.Get(
+          urlparse.urlsplit(self.url).netloc)
+
+  @property
+  def single_flight(self):
+    return self.__single_flight
+
+  def SetRequestCoalescing(self, enabled, method_id=None):
+    """Coalesce identical concurrent GET calls, for all or one method.
+
+    When coalescing is enabled, a call whose URL matches a call which
+    is still in progress waits for it, and receives a copy of its
+    response instead of sending a request of its own.
+
+    Args:
+      enabled: (bool) whether to coalesce calls.
+      method_id: (str, default: None) the method to enable or disable
+          coalescing for.
+    """
+    self.__coalesce_requests.Set(enabled, method_id=method_id)
+
+  def GetRequestCoalescing(self, method_id):
+    """Return whether calls to method_id are coalesced."""
+    return self.__coalesce_requests.Get(method_id)
+
+  def NewBatchRequest(self, batch_url=None):
+    """Create a BatchApiRequest for sending calls on this client together.
+
+    Args:
+      batch_url: (str, default: None) URL of the batch endpoint;
+          defaults to /batch on the host of this client.
+
+    Returns:
+      A new, empty batch.BatchApiRequest.
+    """
+    batch_url = batch_url or urlparse.urljoin(self.url, '/batch')
+    return batch.BatchApiRequest(batch_url, http=self.http)
+
+  def __RequireHttpPool(self):
+    if not isinstance(self.http, http_wrapper.HttpPool):
+      raise exceptions.ConfigurationValueError(
+          'Concurrent calls require a thread-safe transport; '
+          'create the client with http_pool_size')
+    return self.http
+
+  def __GetExecutor(self, http_pool):
+    with self.__executor_lock:
+      if self.__executor is None:
+        self.__executor = futures.ThreadPoolExecutor(
+            max_workers=self.__MaxWorkers(http_pool))
+      return self.__executor
+
+  def __MaxWorkers(self, http_pool):
+    # A call holds its connection for as long as it holds its thread,
+    # so threads beyond the pool size would only wait for a connection.
+    return self.async_max_workers or http_pool.max_size
+
+  def _GetConcurrentHttp(self):
+    """Return the thread-safe http object used for async calls.
+
+    This is the client's http object, if it is an HttpPool. Otherwise a
+    pool of async_pool_size connections, authorized with the client's
+    credentials, is created on first use.
+
+    Raises:
+      exceptions.ConfigurationValueError: the client was created with
+          a custom http object, which can't be pooled; create it with
+          http_pool_size instead.
+    """
+    if isinstance(self.http, http_wrapper.HttpPool):
+      return self.http
+    if self.__custom_http:
+      raise exceptions.ConfigurationValueError(
+          'Async calls on a client with a custom http object require a '
+          'thread-safe transport; create the client with http_pool_size')
+    with self.__executor_lock:
+      if self.__http_pool is None:
+        self.__http_pool = http_wrapper.HttpPool(
+            max_size=self.async_pool_size, credentials=self._credentials)
+      return self.__http_pool
+
+  def _SubmitRequest(self, execute, http_request):
+    """Call execute(http_request) on the executor, over a pooled http."""
+    http_pool = self._GetConcurrentHttp()
+    http_request.http = http_pool
+    return self.__GetExecutor(http_pool).submit(execute, http_request)
+
+  def Submit(self, method, request, **kwds):
+    """Call a service method on the client's executor.
+
+    The executor is a thread pool: each call occupies one of its
+    threads, blocked on I/O, until the response is decoded. This keeps
+    calls on the same blocking transport as synchronous ones, at the
+    cost of a thread per call in flight. At most async_max_workers
+    calls (by default, the size of the client's http pool) run at
+    once; later ones wait in the executor's queue. The executor is
+    created on first use, so set async_max_workers before then.
+
+    Args:
+      method: a bound service method, such as client.objects.Get.
+      request: the request message for method.
+      **kwds: additional arguments for method, such as global_params.
+
+    Returns:
+      A concurrent.futures.Future for the response message.
+    """
+    executor = self.__GetExecutor(self.__RequireHttpPool())
+    return executor.submit(method, request, **kwds)
+
+  def Map(self, method, requests, max_workers=None, ordered=True, **kwds):
+    """Call a service method on each of requests concurrently.
+
+    Args:
+      method: a bound service method, such as client.objects.Get.
+      requests: an iterable of request messages for method.
+      max_workers: (int, default: None) maximum number of calls in
+          flight at once; defaults to the number of executor threads
+          (see Submit).
+      ordered: (boolean, default: True) If True, yield results in the
+          order of requests; otherwise, yield them as they complete.
+      **kwds: additional arguments for method, such as global_params.
+
+    Yields:
+      A CallResult for each request. A failed call does not stop the
+      others; its exception is recorded on its CallResult.
+    """
+    http_pool = self.__RequireHttpPool()
+    executor = self.__GetExecutor(http_pool)
+    max_workers = max_workers or http_pool.max_size
+    if ordered:
+      in_flight = collections.deque()
+      for request in requests:
+        if len(in_flight) >= max_workers:
+          yield CallResult.FromFuture(*in_flight.popleft())
+        in_flight.append(
+            (request, executor.submit(method, request, **kwds)))
+      while in_flight:
+        yield CallResult.FromFuture(*in_flight.popleft())
+    else:
+      in_flight = {}
+      for request in requests:
+        if len(in_flight) >= max_workers:
+          done, _ = futures.wait(
+              in_flight, return_when=futures.FIRST_COMPLETED)
+          for future in done:
+            yield CallResult.FromFuture(in_flight.pop(future), future)
+        in_flight[executor.submit(method, request, **kwds)] = request
+      for future in futures.as_completed(in_flight):
+        yield CallResult.FromFuture(in_flight[future], future)
+
+  def ShutdownExecutor(self, wait=True):
+    """Shut down the executor used by Submit and Map, if any."""
+    with self.__executor_lock:
+      executor, self.__executor = self.__executor, None
+    if executor is not None:
+      executor.shutdown(wait=wait)
+
   def ConfigureModel(self, model):
     model.include_fields = self.__include_fields
 
@@ -291,43 +804,123 @@ class BaseApiClient(object):
 
 
 class BaseApiService(object):
-  """Base class for generated API services."""
+  """Base class for generated API services.
+
+  Generated services record the configuration for each of their
+  methods in the class-level _METHOD_CONFIGS and _UPLOAD_CONFIGS
+  dicts. These configs are shared by every call (and every instance),
+  so they are frozen (see FreezeConfigs), and the information resolved
+  from a config is cached on its method_id.
+  """
+  _METHOD_CONFIGS = {}
+  _UPLOAD_CONFIGS = {}
 
   def __init__(self, client):
     self.__client = client
+    self.__call_plans = {}
+    self.__upload_path_templates = {}
+    self.__field_masks = {}
+    self.__rate_limiter = None
+    self.__thread_local = threading.local()
 
   @property
   def _client(self):
     return self.__client
 
-  def __CombineGlobalParams(self, global_params, default_params):
+  @classmethod
+  def GetMethodConfig(cls, method):
+    """Return the (shared, frozen) ApiMethodInfo for method, or None."""
+    return cls._METHOD_CONFIGS.get(method)
+
+  @classmethod
+  def GetUploadConfig(cls, method):
+    """Return the (shared, frozen) ApiUploadInfo for method, or None."""
+    return cls._UPLOAD_CONFIGS.get(method)
+
+  def SetRateLimiter(self, rate_limiter):
+    """Limit the rate of calls to the methods of this service.
+
+    Args:
+      rate_limiter: (http_wrapper.RateLimiter) the limiter to use, or
+          None to use the client's limiter.
+    """
+    self.__rate_limiter = rate_limiter
+
+  def __AcquireRateLimit(self, method_config):
+    rate_limiter = self.__client.GetRateLimiter(
+        method_config.method_id, service_rate_limiter=self.__rate_limiter)
+    if rate_limiter is not None:
+      rate_limiter.Acquire()
+
+  def SetResponseFields(self, method, field_paths):
+    """Request only the given fields in responses to method.
+
+    Every later call of method sends the partial response selector for
+    field_paths as the fields parameter (unless the call sets fields
+    itself), and decodes only those fields of the response. For a
+    method which pages (its request has a pageToken field and its
+    response a nextPageToken field), nextPageToken is always requested,
+    so that paging continues past the first page.
+
+    Args:
+      method: (str) the name of the method, such as 'List'.
+      field_paths: (list of str) dotted paths of the fields of the
+          response message to request, such as ['items.id'], or None
+          to request full responses again.
+
+    Returns:
+      The encoding.FieldMask for method, or None.
+    """
+    method_config = self.GetMethodConfig(method)
+    if method_config is None:
+      raise exceptions.InvalidUserInputError(
+          'No method %s found in service %s' % (
+              method, type(self).__name__))
+    if field_paths is None:
+      self.__field_masks.pop(method_config.method_id, None)
+      return None
+    call_plan = self._GetCallPlan(method_config)
+    if isinstance(field_paths, basestring):
+      field_paths = [field_paths]
+    if (_HasField(call_plan.request_type, 'pageToken') and
+        _HasField(call_plan.response_type, 'nextPageToken')):
+      field_paths = list(field_paths) + ['nextPageToken']
+    field_mask = encoding.FieldMask(call_plan.response_type, field_paths)
+    self.__field_masks[method_config.method_id] = field_mask
+    return field_mask
+
+  def GetResponseFields(self, method):
+    """Return the encoding.FieldMask set for method, or None."""
+    method_config = self.GetMethodConfig(method)
+    if method_config is None:
+      return None
+    return self.__field_masks.get(method_config.method_id)
+
+  def __CombineGlobalParams(self, global_params, call_plan):
+    """Merge global_params over the client defaults, as a new dict."""
     _Typecheck(global_params, (types.NoneType, self.__client.params_type))
-    result = self.__client.params_type()
-    global_params = global_params or self.__client.params_type()
-    for field in result.all_fields():
-      value = (global_params.get_assigned_value(field.name) or
-               default_params.get_assigned_value(field.name))
-      if value not in (None, [], ()):
-        setattr(result, field.name, value)
+    result = self.__client.default_global_params_dict
+    if global_params is not None:
+      for name in call_plan.global_param_names:
+        value = global_params.get_assigned_value(name)
+        if value not in (None, [], ()):
+          result[name] = value
     return result
 
-  def __ConstructQueryParams(self, query_params, request, global_params):
-    query_info = dict((field.name, getattr(global_params, field.name))
-                      for field in self.__client.params_type.all_fields())
+  def __ConstructQueryParams(self, call_plan, request, global_params):
+    query_info = global_params
     query_info.update(
-        (param, getattr(request, param, None)) for param in query_params)
+        (param, getattr(request, param, None))
+        for param in call_plan.query_params)
     query_info = dict((k, v) for k, v in query_info.iteritems()
                       if v is not None)
     return query_info
 
-  def __ConstructPathParams(self, method_config, request):
-    path = method_config.relative_path
+  def __ConstructUrl(self, path_template, call_plan, request):
+    """Fill in the path parameters from request in path_template."""
     path_params = {}
-    for param in method_config.path_params:
-      param_template = '{%s}' % param
-      if param_template not in path:
-        raise exceptions.InvalidUserInputError(
-            'Missing path parameter %s' % param)
+    quoted_params = {}
+    for param in call_plan.path_params:
       try:
         # TODO(craigcitro): Do we want to support some sophisticated
         # mapping here?
@@ -339,14 +932,13 @@ class BaseApiService(object):
         raise exceptions.InvalidUserInputError(
             'Request missing required parameter %s' % param)
       try:
-        path = path.replace(param_template,
-                            urllib.quote(value.encode('utf_8'), ''))
+        quoted_params[param] = urllib.quote(value.encode('utf_8'), '')
       except TypeError as e:
         raise exceptions.InvalidUserInputError(
             'Error setting required parameter %s to value %s: %s' % (
                 param, value, e))
       path_params[param] = value
-    return path, path_params
+    return path_template.Expand(quoted_params), path_params
 
   def __GetUploadStrategy(self, upload, upload_config):
     # Choose a protocol: We generally prefer resumable, unless the
@@ -378,6 +970,16 @@ class BaseApiService(object):
     _ = self.__GetUploadStrategy(upload, upload_config)
     return upload_config.simple_path
 
+  def __GetUploadPathTemplate(self, upload, upload_config, call_plan):
+    upload_path = self.__GetUploadPath(upload, upload_config)
+    key = (upload_path, call_plan.path_params)
+    path_template = self.__upload_path_templates.get(key)
+    if path_template is None:
+      path_template = _PathTemplate(
+          self.__client.url, upload_path, call_plan.path_params)
+      self.__upload_path_templates[key] = path_template
+    return path_template
+
   def __SimpleMediaBody(self, upload, headers, body_value):
     # Rewrite the body. (This section follows apiclient.discovery.)
     upload.stream.seek(0)
@@ -433,44 +1035,163 @@ class BaseApiService(object):
           upload.stream, upload.mime_type, resumable=True)
     return media_upload, headers, body_value
 
-  def __IsRetryable(self, exc):
+  def __MaybeCompressBody(self, method_config, headers, body):
+    """Gzip body, if compression is enabled and it is large enough."""
+    min_size = self.__client.GetRequestCompression(method_config.method_id)
+    if min_size is None or body is None or len(body) < min_size:
+      return body
+    headers['content-encoding'] = 'gzip'
+    return http_wrapper.GzipContent(body)
+
+  def __IsRedirect(self, exc):
     status = int(exc.resp.get('status'))
     # 308 doesn't have a name in httplib.
-    retryable_status = status in (
+    redirect_status = status in (
         httplib.MOVED_PERMANENTLY, httplib.FOUND, httplib.SEE_OTHER,
         httplib.TEMPORARY_REDIRECT, 308)
-    return retryable_status and 'location' in exc.resp
-
-  def __ExecuteRequest(self, request, url):
-    try:
-      return request.execute()
-    except apiclient_errors.HttpError as e:
-      if self.__IsRetryable(e):
-        logging.info('Got redirect for %s', request.uri)
-        request.uri = e.resp['location']
-        logging.info('Redirecting to %s', request.uri)
-        return self.__ExecuteRequest(request, request.uri)
-      e.content = e.content.decode('ascii', 'replace')
-      logging.error('Error making request to "%s": "%s", "%s"',
-                    url, e, e.content)
-      raise exceptions.HttpError.FromApiclientError(e)
-    except httplib2.HttpLib2Error as e:
-      raise exceptions.CommunicationError(
-          'Communication error making request to "%s": "%s"' % (url, e))
+    return redirect_status and 'location' in exc.resp
 
-  def _RunMethod(self, method_config, request, global_params=None,
-                 upload=None, upload_config=None, download=None):
-    """Call this method with request."""
-    global_params = self.__CombineGlobalParams(
-        global_params, self.__client.global_params)
-    request_type = _LoadClass(
-        method_config.request_type_name, self.__client.MESSAGES_MODULE)
+  @property
+  def last_call_attempts(self):
+    """Number of attempts made by the last call on this thread, or None.
+
+    A call which was coalesced with an identical call in progress made
+    no attempts of its own, so this is 0 after it.
+    """
+    return getattr(self.__thread_local, 'attempts', None)
+
+  def __CacheResponses(self, request, response_cache):
+    """Look up request in response_cache, and store its response there.
+
+    Returns:
+      The cache key and entry for request, or (key, None).
+    """
+    cache_key = response_cache.MakeKey(request.uri, request.headers)
+    cache_entry = response_cache.Lookup(cache_key)
+    if cache_entry is not None:
+      request.headers['if-none-match'] = cache_entry.etag
+    postproc = request.postproc
+
+    def CachingPostproc(response_info, content):
+      response_cache.RecordMiss()
+      result = postproc(response_info, content)
+      if (response_cache.IsStorable(response_info) and
+          isinstance(result, messages.Message)):
+        response_cache.Store(
+            cache_key, response_info['etag'], content, result=result)
+        result = encoding.CopyProtoMessage(result)
+      return result
+    request.postproc = CachingPostproc
+    return cache_key, cache_entry
+
+  def __CachedResponse(self, request, response_cache, cache_key,
+                       cache_entry, postproc):
+    """Answer a 304 response from cache_entry."""
+    response_cache.RecordHit()
+    result = cache_entry.result
+    if result is None:
+      result = postproc(httplib2.Response({'status': '200'}),
+                        cache_entry.content)
+      response_cache.Update(cache_key, result)
+    logging.info('Using cached response for %s', request.uri)
+    return encoding.CopyProtoMessage(result)
+
+  def __ExecuteRequest(self, request, url, method_config, cacheable=False):
+    retry_policy = self.__client.GetRetryPolicy(method_config.method_id)
+    redirect_cache = self.__client.redirect_cache
+    if redirect_cache is not None:
+      request.uri = redirect_cache.Lookup(request.uri)
+    response_cache = None
+    if cacheable and request.method == 'GET':
+      response_cache = self.__client.GetResponseCache(method_config.method_id)
+    cache_entry = None
+    if response_cache is not None:
+      postproc = request.postproc
+      cache_key, cache_entry = self.__CacheResponses(request, response_cache)
+    request_logger = self.__client.request_logger
+    log_call = request_logger is not None and request_logger.Sample()
+    if log_call:
+      request.postproc = request_logger.WrapPostproc(
+          request, request.postproc)
+    circuit_breaker = self.__client.circuit_breaker
+    attempts = 0
+    redirects = 0
+    while True:
+      attempts += 1
+      self.__thread_local.attempts = attempts
+      if circuit_breaker is not None:
+        circuit_breaker.Allow()
+      if log_call:
+        request_logger.LogRequest(request)
+      try:
+        response = request.execute()
+        if circuit_breaker is not None:
+          circuit_breaker.RecordSuccess()
+        if retry_policy is not None:
+          retry_policy.RecordSuccess()
+        return response
+      except apiclient_errors.HttpError as e:
+        if circuit_breaker is not None:
+          if e.resp.status >= 500:
+            circuit_breaker.RecordFailure()
+          else:
+            circuit_breaker.RecordSuccess()
+        if log_call:
+          request_logger.LogResponse(request, e.resp, e.content)
+        if (cache_entry is not None and
+            e.resp.status == httplib.NOT_MODIFIED):
+          if retry_policy is not None:
+            retry_policy.RecordSuccess()
+          return self.__CachedResponse(
+              request, response_cache, cache_key, cache_entry, postproc)
+        if self.__IsRedirect(e):
+          redirects += 1
+          if redirects > self.__client.max_redirects:
+            raise exceptions.CommunicationError(
+                'Too many redirects making request to "%s"' % url)
+          logging.info('Got redirect for %s', request.uri)
+          location = urlparse.urljoin(request.uri, e.resp['location'])
+          if (redirect_cache is not None and
+              e.resp.status in http_wrapper.PERMANENT_REDIRECT_STATUSES):
+            redirect_cache.Add(request.uri, location)
+          request.uri = location
+          if e.resp.status == httplib.SEE_OTHER:
+            # The result of any request is fetched with a GET.
+            request.method = 'GET'
+            request.body = None
+            request.headers.pop('content-type', None)
+            request.headers.pop('content-encoding', None)
+          logging.info('Redirecting to %s', request.uri)
+          attempts -= 1
+          continue
+        if retry_policy is not None and retry_policy.ShouldRetry(
+            request.method, e.resp.status, attempts):
+          logging.warning('Got status %s for %s, retrying',
+                          e.resp.status, request.uri)
+          retry_policy.Backoff(attempts, e.resp.get('retry-after'))
+          continue
+        e.content = e.content.decode('ascii', 'replace')
+        logging.error('Error making request to "%s": "%s", "%s"',
+                      url, e, e.content)
+        raise exceptions.HttpError.FromApiclientError(e)
+      except (httplib2.HttpLib2Error, socket.error) as e:
+        if circuit_breaker is not None:
+          circuit_breaker.RecordFailure()
+        if retry_policy is not None and retry_policy.ShouldRetry(
+            request.method, None, attempts):
+          logging.warning('Communication error for %s, retrying: %s',
+                          request.uri, e)
+          retry_policy.Backoff(attempts)
+          continue
+        raise exceptions.CommunicationError(
+            'Communication error making request to "%s": "%s"' % (url, e))
+
+  def __ComputeCallPlan(self, method_config):
+    """Resolve the types and parameters needed to call method_config."""
+    messages_module = self.__client.MESSAGES_MODULE
+    request_type = _LoadClass(method_config.request_type_name, messages_module)
     response_type = _LoadClass(
-        method_config.response_type_name, self.__client.MESSAGES_MODULE)
-    _Typecheck(request, request_type)
-    if self.__client.log_request:
-      logging.info('Request of type %s: %s',
-                   method_config.request_type_name, request)
+        method_config.response_type_name, messages_module)
     body_type = None
     if method_config.request_field == REQUEST_IS_BODY:
       body_type = request_type
@@ -478,31 +1199,103 @@ class BaseApiService(object):
       body_field = request_type.field_by_name(method_config.request_field)
       _Typecheck(body_field, messages.MessageField)
       body_type = body_field.type
+    global_param_names = tuple(
+        field.name for field in self.__client.params_type.all_fields())
+    path_params = tuple(method_config.path_params)
+    return _MethodCallPlan(
+        request_type=request_type,
+        response_type=response_type,
+        body_type=body_type,
+        request_field=method_config.request_field,
+        query_params=tuple(method_config.query_params),
+        path_params=path_params,
+        path_template=_PathTemplate(
+            self.__client.url, method_config.relative_path, path_params),
+        global_param_names=global_param_names,
+        model_class=self.__client.base_model_class)
+
+  def _GetCallPlan(self, method_config):
+    """Return the (cached) call plan for method_config."""
+    # Note that the cache is keyed on method_id, since callers other
+    # than generated methods may construct a fresh config on each call.
+    call_plan = self.__call_plans.get(method_config.method_id)
+    if call_plan is None:
+      call_plan = self.__ComputeCallPlan(method_config)
+      self.__call_plans[method_config.method_id] = call_plan
+    return call_plan
+
+  def PrepareHttpRequest(self, method_config, request, global_params=None,
+                         upload=None, upload_config=None, download=None,
+                         compress_body=True):
+    """Prepare the HTTP request for calling this method with request.
+
+    Args:
+      method_config: (ApiMethodInfo) configuration for the method.
+      request: the request message for the method.
+      global_params: (StandardQueryParameters, default: None) global
+          arguments for this call.
+      upload: (Upload, default: None) upload for this call, if any.
+      upload_config: (ApiUploadInfo, default: None) upload
+          configuration for the method.
+      download: (Download, default: None) download for this call, if any.
+      compress_body: (bool, default: True) gzip the request body, if
+          request compression is enabled for this method.
+
+    Returns:
+      A request ready to be executed, whose postproc decodes a
+      successful response into the response message. This is an
+      http_wrapper.Request, or an apiclient HttpRequest if the client
+      is in apiclient compatibility mode or for resumable uploads.
+    """
+    call_plan = self._GetCallPlan(method_config)
+    field_mask = self.__field_masks.get(method_config.method_id)
+    if download or getattr(global_params, 'fields', None):
+      field_mask = None
+    global_params = self.__CombineGlobalParams(global_params, call_plan)
+    if field_mask is not None:
+      global_params['fields'] = field_mask.selector
+    _Typecheck(request, call_plan.request_type)
+    body_value = call_plan.GetBodyValue(request)
+
+    query_params = self.__ConstructQueryParams(
+        call_plan, request, global_params)
+    path_template = call_plan.path_template
+    if upload:
+      query_params.update(self.__GetUploadParams(
+          upload, upload_config, body_value))
+      path_template = self.__GetUploadPathTemplate(
+          upload, upload_config, call_plan)
+    url, path_params = self.__ConstructUrl(path_template, call_plan, request)
+
+    # Resumable uploads are driven by apiclient, so they always use
+    # the compatibility path.
+    if (self.__client.apiclient_compatibility_mode or (
+        upload and self.__GetUploadStrategy(
+            upload, upload_config) == 'resumable')):
+      return self.__PrepareApiclientRequest(
+          method_config, call_plan, url, path_params, query_params,
+          body_value, upload=upload, upload_config=upload_config,
+          download=download, compress_body=compress_body)
+    return self.__PrepareDirectRequest(
+        method_config, call_plan, url, query_params, body_value,
+        upload=upload, upload_config=upload_config, download=download,
+        field_mask=field_mask, compress_body=compress_body)
+
+  def __PrepareApiclientRequest(self, method_config, call_plan, url,
+                                path_params, query_params, body_value,
+                                upload=None, upload_config=None,
+                                download=None, compress_body=True):
+    """Build the request with an apiclient model and HttpRequest."""
     # TODO(craigcitro): Make the http and model objects configurable.
     request_builder = apiclient_http.HttpRequest
-    model_class = self.__client.base_model_class
+    model_class = call_plan.model_class
     if download:
       model_class = BaseMediaDownloadModel
     api_model = model_class(
-        body_type, response_type,
+        call_plan.body_type, call_plan.response_type,
         self.__client.log_request, self.__client.log_response)
     self.__client.ConfigureModel(api_model)
 
-    body_value = None
-    if method_config.request_field == REQUEST_IS_BODY:
-      body_value = request
-    elif method_config.request_field:
-      body_value = getattr(request, method_config.request_field)
-
-    query_params = self.__ConstructQueryParams(
-        method_config.query_params, request, global_params)
-    if upload:
-      query_params.update(self.__GetUploadParams(
-          upload, upload_config, body_value))
-      method_config.relative_path = self.__GetUploadPath(upload, upload_config)
-    relative_path, path_params = self.__ConstructPathParams(
-        method_config, request)
-
     # Note that api_model.request side-effects the headers, so must
     # be threaded through.
     headers = {}
@@ -513,11 +1306,11 @@ class BaseApiService(object):
     if upload:
       resumable, headers, body = self.__CreateMediaUpload(
           upload, upload_config, headers, body)
+    if compress_body and not resumable:
+      body = self.__MaybeCompressBody(method_config, headers, body)
 
-    url = urlparse.urljoin(self.__client.url, ''.join((relative_path, query)))
-    if self.__client.log_request:
-      logging.info('%s %s', method_config.http_method, url)
-    request = request_builder(
+    url = ''.join((url, query))
+    return request_builder(
         self.__client.http,
         api_model.response,
         url,
@@ -527,6 +1320,59 @@ class BaseApiService(object):
         methodId=method_config.method_id,
         resumable=resumable)
 
+  def __PrepareDirectRequest(self, method_config, call_plan, url,
+                             query_params, body_value, upload=None,
+                             upload_config=None, download=None,
+                             field_mask=None, compress_body=True):
+    """Build the request directly from the call plan."""
+    headers = {
+        'accept': 'application/json',
+        'user-agent': self.__client.user_agent,
+        }
+    if self.__client.accept_gzip:
+      # Google APIs only compress responses to user agents which
+      # mention gzip.
+      headers['accept-encoding'] = 'gzip'
+      headers['user-agent'] += ' (gzip)'
+    body = None
+    if body_value is not None:
+      _Typecheck(body_value, call_plan.body_type)
+      body = encoding.MessageToJson(
+          body_value, include_fields=self.__client.include_fields)
+      headers['content-type'] = 'application/json'
+    if upload:
+      _, headers, body = self.__CreateMediaUpload(
+          upload, upload_config, headers, body)
+    if compress_body:
+      body = self.__MaybeCompressBody(method_config, headers, body)
+    if download:
+      query_params['alt'] = 'media'
+      postproc = _ReturnContent
+    elif field_mask is not None:
+      postproc = functools.partial(_DecodePartialResponse, field_mask)
+    else:
+      postproc = functools.partial(_DecodeResponse, call_plan.response_type)
+    query = http_wrapper.EncodeQuery(query_params)
+    if query:
+      url = '?'.join((url, query))
+    return http_wrapper.Request(
+        self.__client.http, postproc, url,
+        method=method_config.http_method, body=body, headers=headers)
+
+  def _RunMethod(self, method_config, request, global_params=None,
+                 upload=None, upload_config=None, download=None, http=None):
+    """Call this method with request.
+
+    If http is given, the request is sent with it instead of the
+    client's http object.
+    """
+    self.__AcquireRateLimit(method_config)
+    request = self.PrepareHttpRequest(
+        method_config, request, global_params=global_params,
+        upload=upload, upload_config=upload_config, download=download)
+    if http is not None:
+      request.http = http
+
     # If we're downloading media, we want to just get the new URL and
     # hand it back to the download object.
     if download:
@@ -542,8 +1388,99 @@ class BaseApiService(object):
         download.http = request.http
       return
 
-    response = self.__ExecuteRequest(request, url)
-    if self.__client.log_response:
-      logging.info('Response of type %s: %s',
-                   method_config.response_type_name, response)
-    return response
+    if (request.method == 'GET' and
+        self.__client.GetRequestCoalescing(method_config.method_id)):
+      # A caller which waits for an identical call makes no attempts of
+      # its own; the leader sets its count as it goes.
+      self.__thread_local.attempts = 0
+      # The key is the URL as built, before any redirects.
+      response, shared = self.__client.single_flight.Do(
+          request.uri, functools.partial(
+              self.__ExecuteRequest, request, request.uri, method_config,
+              cacheable=True))
+      if shared and isinstance(response, messages.Message):
+        response = encoding.CopyProtoMessage(response)
+      return response
+    return self.__ExecuteRequest(
+        request, request.uri, method_config, cacheable=True)
+
+  def _RunMethodStream(self, method_config, request, field_name,
+                       global_params=None):
+    """Call this method with request, decoding the response lazily.
+
+    Returns:
+      An encoding.JsonItemStream over the repeated field field_name
+      of the response.
+    """
+    self.__AcquireRateLimit(method_config)
+    call_plan = self._GetCallPlan(method_config)
+    http_request = self.PrepareHttpRequest(
+        method_config, request, global_params=global_params)
+    http_request.postproc = lambda unused_response_info, content: (
+        encoding.JsonItemStream(call_plan.response_type, field_name, content))
+    return self.__ExecuteRequest(
+        http_request, http_request.uri, method_config)
+
+  def StreamItems(self, method, request, field_name='items',
+                  global_params=None):
+    """Call method with request, and iterate over items of the response.
+
+    Unlike calling the method directly, the response is never decoded
+    into a single message: each item of the repeated field field_name
+    is decoded as the iteration reaches it, which keeps memory use low
+    for very large list responses.
+
+    Args:
+      method: (str) the name of the method, such as 'List'.
+      request: the request message for the method.
+      field_name: (str, default: 'items') the repeated field of the
+          response to iterate over.
+      global_params: (StandardQueryParameters, default: None) global
+          arguments for this call.
+
+    Returns:
+      An encoding.JsonItemStream, which yields the decoded items; its
+      envelope holds the other fields of the response once iteration
+      has finished.
+    """
+    method_config = self.GetMethodConfig(method)
+    if method_config is None:
+      raise exceptions.InvalidUserInputError(
+          'No method %s found in service %s' % (
+              method, type(self).__name__))
+    return self._RunMethodStream(
+        method_config, request, field_name, global_params=global_params)
+
+  def _RunMethodPaged(self, method_config, request, field,
+                      global_params=None, limit=None, prefetch=False,
+                      max_buffered_pages=1):
+    """Iterate over the items of every page of this method.
+
+    Returns:
+      A list_pager.ListPager over the repeated field field of each
+      response, following nextPageToken from page to page.
+    """
+    return list_pager.ListPager(
+        self, method_config, request, field, global_params=global_params,
+        limit=limit, prefetch=prefetch,
+        max_buffered_pages=max_buffered_pages)
+
+  def _RunMethodAsync(self, method_config, request, global_params=None):
+    """Call this method with request, without waiting for the response.
+
+    Any rate limit is waited for and the HTTP request is built (and
+    validated) on the calling thread; the request is sent from the
+    client's executor, over the client's concurrent http object.
+
+    Returns:
+      A concurrent.futures.Future for the response message.
+    """
+    # Fail before doing any work if async calls aren't possible.
+    self.__client._GetConcurrentHttp()  # pylint: disable=protected-access
+    self.__AcquireRateLimit(method_config)
+    http_request = self.PrepareHttpRequest(
+        method_config, request, global_params=global_params)
+    return self.__client._SubmitRequest(  # pylint: disable=protected-access
+        functools.partial(self.__ExecuteRequest, url=http_request.uri,
+                          method_config=method_config, cacheable=True),
+        http_request)
@@ -0,0 +1,1092 @@
+#!/usr/bin/env python
+"""Tests for base_api, against a local fake server."""
+
+import email.utils
+import gzip
+import json
+import logging
+import StringIO
+import threading
+import time
+import unittest
+import urlparse
+
+import httplib2
+
+from apitools.base.py import base_api
+from apitools.base.py import encoding
+from apitools.base.py import exceptions
+from apitools.base.py import http_wrapper
+from apitools.base.py.testing import fake_client
+from apitools.base.py.testing import fake_messages as messages
+from apitools.base.py.testing import fake_server
+
+
+class AsyncTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer(fake_server.EchoId)
+
+  def __NewClient(self, **kwds):
+    return self.NewClient(fake_client.FakeV1, self.server, **kwds)
+
+  def __GetAll(self, client, names):
+    return [future.result(timeout=5) for future in [
+        client.things.GetAsync(messages.FakeThingsGetRequest(
+            project='p', thing=name)) for name in names]]
+
+  def testDefaultClientCreatesPool(self):
+    client = self.__NewClient()
+    names = ['t%d' % i for i in range(5)]
+    self.assertEqual([messages.Thing(id=name) for name in names],
+                     self.__GetAll(client, names))
+    http_pool = client._GetConcurrentHttp()  # pylint: disable=protected-access
+    self.assertIsNot(client.http, http_pool)
+    self.assertEqual(client.async_pool_size, http_pool.max_size)
+    # The synchronous methods keep using the client's own http object.
+    self.assertEqual(messages.Thing(id='t9'), client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t9')))
+    self.assertEqual(5, http_pool.stats.hits + http_pool.stats.misses)
+
+  def testPooledClientUsesItsPool(self):
+    client = self.__NewClient(http_pool_size=2)
+    self.assertEqual([messages.Thing(id='a'), messages.Thing(id='b')],
+                     self.__GetAll(client, ['a', 'b']))
+    # pylint: disable=protected-access
+    self.assertIs(client.http, client._GetConcurrentHttp())
+
+  def testCustomHttpFailsBeforeSending(self):
+    client = self.__NewClient(http=httplib2.Http())
+    limiter = http_wrapper.RateLimiter(1, burst=1, block=False)
+    client.SetRateLimiter(limiter)
+    self.assertRaises(
+        exceptions.ConfigurationValueError, client.things.GetAsync,
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+    self.assertEqual([], self.server.requests)
+    # No rate limit token was spent on the failed call.
+    limiter.Acquire()
+
+  def testSubmitRequiresPool(self):
+    client = self.__NewClient()
+    self.assertRaises(
+        exceptions.ConfigurationValueError, client.Submit,
+        client.things.Get, messages.FakeThingsGetRequest(
+            project='p', thing='t'))
+
+
+class MapTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.release = threading.Event()
+    self.lock = threading.Lock()
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self.server = self.StartServer(self.__Respond)
+    # Don't leave a request waiting if a test fails.
+    self.addCleanup(self.release.set)
+    self.client = self.NewClient(
+        fake_client.FakeV1, self.server, http_pool_size=4)
+
+  def __Respond(self, request):
+    thing = request.path.split('?', 1)[0].rsplit('/', 1)[-1]
+    with self.lock:
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    try:
+      if thing == 'slow':
+        self.release.wait()
+      elif thing == 'missing':
+        return 404, {}, ''
+      else:
+        time.sleep(0.01)
+      return fake_server.EchoId(request)
+    finally:
+      with self.lock:
+        self.in_flight -= 1
+
+  def __Requests(self, names):
+    return [messages.FakeThingsGetRequest(project='p', thing=name)
+            for name in names]
+
+  def testSubmit(self):
+    future = self.client.Submit(
+        self.client.things.Get,
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+    self.assertEqual(messages.Thing(id='t'), future.result(timeout=5))
+
+  def testOrdered(self):
+    # The first call is answered only after the others.
+    threading.Timer(0.05, self.release.set).start()
+    requests = self.__Requests(['slow', 'a', 'b'])
+    results = list(self.client.Map(self.client.things.Get, requests))
+    self.assertEqual(requests, [result.request for result in results])
+    self.assertEqual(
+        [messages.Thing(id=name) for name in ('slow', 'a', 'b')],
+        [result.response for result in results])
+
+  def testAsCompleted(self):
+    requests = self.__Requests(['slow', 'a', 'b'])
+    results = self.client.Map(
+        self.client.things.Get, requests, ordered=False)
+    first_two = [next(results), next(results)]
+    self.assertEqual(set(['a', 'b']), set(
+        result.response.id for result in first_two))
+    self.release.set()
+    last, = list(results)
+    self.assertIs(requests[0], last.request)
+    self.assertEqual(messages.Thing(id='slow'), last.response)
+
+  def testMaxWorkers(self):
+    names = ['t%d' % i for i in range(8)]
+    for ordered in (True, False):
+      self.max_in_flight = 0
+      results = list(self.client.Map(
+          self.client.things.Get, self.__Requests(names), max_workers=2,
+          ordered=ordered))
+      self.assertEqual(sorted(names),
+                       sorted(result.response.id for result in results))
+      self.assertLessEqual(self.max_in_flight, 2)
+
+  def testAsyncMaxWorkers(self):
+    # The executor has fewer threads than the pool has connections.
+    self.client.async_max_workers = 2
+    names = ['t%d' % i for i in range(8)]
+    calls = [self.client.Submit(self.client.things.Get, request)
+             for request in self.__Requests(names)]
+    self.assertEqual(names, [call.result(timeout=5).id for call in calls])
+    self.assertLessEqual(self.max_in_flight, 2)
+
+  def testFailuresReturnedAsResults(self):
+    requests = self.__Requests(['a', 'missing', 'b'])
+    results = list(self.client.Map(self.client.things.Get, requests))
+    self.assertEqual([False, True, False],
+                     [result.is_error for result in results])
+    failed = results[1]
+    self.assertIs(requests[1], failed.request)
+    self.assertIsNone(failed.response)
+    self.assertIsInstance(failed.exception, exceptions.HttpError)
+    self.assertEqual(404, failed.exception.resp.status)
+    self.assertEqual(messages.Thing(id='b'), results[2].response)
+
+
+class _RecordingModel(base_api.BaseApiModel):
+  """A custom model which records the bodies it serializes."""
+
+  serialized = []
+
+  def serialize(self, body_value):
+    self.serialized.append(body_value)
+    return super(_RecordingModel, self).serialize(body_value)
+
+
+class CompatibilityModeTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer(fake_server.EchoId)
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+    self.client.apiclient_compatibility_mode = True
+
+  def testGet(self):
+    self.assertEqual(messages.Thing(id='t'), self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t')))
+    request, = self.server.requests
+    self.assertEqual('GET', request.method)
+    # The apiclient JsonModel asks for JSON with the alt parameter.
+    self.assertTrue(request.path.startswith('/projects/p/things/t?'))
+    self.assertIn('alt=json', request.path)
+
+  def testInsert(self):
+    self.server.AddResponse(body='{"id": "t", "size": "7"}')
+    response = self.client.things.Insert(messages.FakeThingsInsertRequest(
+        project='p', thing=messages.Thing(id='t', tags=['a'])))
+    self.assertEqual(messages.Thing(id='t', size=7), response)
+    request, = self.server.requests
+    self.assertEqual('POST', request.method)
+    self.assertEqual('application/json', request.headers['content-type'])
+    self.assertEqual({'id': 't', 'tags': ['a']}, json.loads(request.body))
+
+  def testHttpErrorConverted(self):
+    self.server.AddResponse(
+        status=404, body='{"error": {"message": "not found"}}')
+    with self.assertRaises(exceptions.HttpError) as context:
+      self.client.things.Get(
+          messages.FakeThingsGetRequest(project='p', thing='t'))
+    error = context.exception
+    self.assertEqual(404, error.resp.status)
+    self.assertEqual(u'{"error": {"message": "not found"}}', error.content)
+    self.assertIn('/projects/p/things/t?', error.uri)
+
+  def testCustomModelUsesApiclient(self):
+    self.addCleanup(setattr, _RecordingModel, 'serialized', [])
+    client = self.NewClient(
+        fake_client.FakeV1, self.server, model=_RecordingModel)
+    self.assertTrue(client.apiclient_compatibility_mode)
+    thing = messages.Thing(id='t')
+    client.things.Insert(
+        messages.FakeThingsInsertRequest(project='p', thing=thing))
+    self.assertEqual([thing], _RecordingModel.serialized)
+
+
+class RetryTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer()
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+    self.sleeps = []
+
+  def __SetRetryPolicy(self, **kwds):
+    kwds.setdefault('jitter', 0)
+    retry_policy = http_wrapper.RetryPolicy(sleep=self.sleeps.append, **kwds)
+    self.client.SetRetryPolicy(retry_policy)
+    return retry_policy
+
+  def __Get(self):
+    return self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+
+  def __AddThing(self):
+    self.server.AddResponse(body='{"id": "t"}')
+
+  def testRetriesUntilSuccess(self):
+    self.__SetRetryPolicy()
+    self.server.AddResponse(status=503)
+    self.server.AddResponse(status=429)
+    self.__AddThing()
+    self.assertEqual(messages.Thing(id='t'), self.__Get())
+    self.assertEqual(3, len(self.server.requests))
+    self.assertEqual([1.0, 2.0], self.sleeps)
+    self.assertEqual(3, self.client.things.last_call_attempts)
+
+  def testNoRetryWithoutPolicy(self):
+    self.server.AddResponse(status=503)
+    self.assertRaises(exceptions.HttpError, self.__Get)
+    self.assertEqual(1, self.client.things.last_call_attempts)
+
+  def testNonIdempotentNotRetried(self):
+    self.__SetRetryPolicy()
+    self.server.AddResponse(status=503)
+    request = messages.FakeThingsInsertRequest(
+        project='p', thing=messages.Thing(id='t'))
+    self.assertRaises(exceptions.HttpError, self.client.things.Insert,
+                      request)
+    self.assertEqual(1, len(self.server.requests))
+    self.assertEqual([], self.sleeps)
+    self.assertEqual(1, self.client.things.last_call_attempts)
+
+  def testNonIdempotentRetriedOnTooManyRequests(self):
+    self.__SetRetryPolicy()
+    self.server.AddResponse(status=429)
+    self.__AddThing()
+    request = messages.FakeThingsInsertRequest(
+        project='p', thing=messages.Thing(id='t'))
+    self.assertEqual(messages.Thing(id='t'),
+                     self.client.things.Insert(request))
+    self.assertEqual(2, self.client.things.last_call_attempts)
+
+  def testGivesUpAfterMaxRetries(self):
+    self.__SetRetryPolicy(max_retries=2)
+    for _ in range(3):
+      self.server.AddResponse(status=500)
+    self.assertRaises(exceptions.HttpError, self.__Get)
+    self.assertEqual(3, len(self.server.requests))
+    self.assertEqual(3, self.client.things.last_call_attempts)
+
+  def testRetryAfterSeconds(self):
+    self.__SetRetryPolicy()
+    self.server.AddResponse(status=503, headers={'retry-after': '7'})
+    self.__AddThing()
+    self.__Get()
+    self.assertEqual([7], self.sleeps)
+
+  def testRetryAfterDate(self):
+    self.__SetRetryPolicy()
+    retry_at = email.utils.formatdate(time.time() + 30, usegmt=True)
+    self.server.AddResponse(status=503, headers={'retry-after': retry_at})
+    self.__AddThing()
+    self.__Get()
+    delay, = self.sleeps
+    self.assertTrue(25 < delay <= 30, delay)
+
+  def testRetryAfterLimitedToMaxDelay(self):
+    self.__SetRetryPolicy(max_delay=60)
+    self.server.AddResponse(status=503, headers={'retry-after': '86400'})
+    self.__AddThing()
+    self.__Get()
+    self.assertEqual([60], self.sleeps)
+
+  def testLongGetRetried(self):
+    self.__SetRetryPolicy()
+    self.server.AddResponse(status=503)
+    self.server.AddResponse(body='{"items": [{"id": "t"}]}')
+    page_token = 'x' * (http_wrapper.MAX_URL_LENGTH + 1)
+    response = self.client.things.List(messages.FakeThingsListRequest(
+        project='p', pageToken=page_token))
+    self.assertEqual([messages.Thing(id='t')], response.items)
+    self.assertEqual(2, self.client.things.last_call_attempts)
+    # Both attempts were sent as a POST, with the query in the body.
+    for request in self.server.requests:
+      self.assertEqual(('POST', '/projects/p/things'),
+                       (request.method, request.path))
+      self.assertEqual('GET', request.headers['x-http-method-override'])
+      self.assertIn('pageToken=' + page_token, request.body)
+
+  def testExhaustedBudget(self):
+    # Retries are allowed while more than half of the tokens remain.
+    budget = http_wrapper.RetryBudget(max_tokens=4)
+    self.__SetRetryPolicy(budget=budget)
+    self.server.AddResponse(status=503)
+    self.server.AddResponse(status=503)
+    self.assertRaises(exceptions.HttpError, self.__Get)
+    self.assertEqual(2, len(self.server.requests))
+    self.assertEqual(2, self.client.things.last_call_attempts)
+    self.assertEqual(2, budget.tokens)
+    # Later calls fail on their first error, until successes refill
+    # the budget.
+    self.server.AddResponse(status=503)
+    self.assertRaises(exceptions.HttpError, self.__Get)
+    self.assertEqual(1, self.client.things.last_call_attempts)
+    self.__AddThing()
+    self.__Get()
+    self.assertAlmostEqual(1.1, budget.tokens)
+
+
+class RedirectTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer(self.__Redirect)
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+    self.redirects = {}
+
+  def __Redirect(self, request):
+    path = request.path.split('?', 1)[0]
+    if path in self.redirects:
+      status, location = self.redirects[path]
+      return status, {'location': location}, ''
+    return fake_server.EchoId(request)
+
+  def __Get(self, name):
+    return self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing=name))
+
+  def __Paths(self):
+    return [request.path.split('?', 1)[0]
+            for request in self.server.requests]
+
+  def testPermanentRedirectCached(self):
+    self.redirects['/projects/p/things/old'] = (
+        301, self.server.url + 'projects/p/things/new')
+    for _ in range(3):
+      self.assertEqual(messages.Thing(id='new'), self.__Get('old'))
+    self.assertEqual(
+        ['/projects/p/things/old'] + ['/projects/p/things/new'] * 3,
+        self.__Paths())
+    self.assertEqual(1, len(self.client.redirect_cache))
+
+  def testTemporaryRedirectNotCached(self):
+    # A relative location is resolved against the request URI.
+    self.redirects['/projects/p/things/old'] = (302, 'new')
+    for _ in range(2):
+      self.assertEqual(messages.Thing(id='new'), self.__Get('old'))
+    self.assertEqual(
+        ['/projects/p/things/old', '/projects/p/things/new'] * 2,
+        self.__Paths())
+    self.assertEqual(0, len(self.client.redirect_cache))
+
+  def testRedirectLoop(self):
+    self.client.max_redirects = 2
+    self.redirects['/projects/p/things/a'] = (302, 'b')
+    self.redirects['/projects/p/things/b'] = (302, 'a')
+    self.assertRaises(exceptions.CommunicationError, self.__Get, 'a')
+    self.assertEqual(['/projects/p/things/a', '/projects/p/things/b',
+                      '/projects/p/things/a'], self.__Paths())
+
+  def testSeeOtherFetchedWithGet(self):
+    self.redirects['/projects/p/things'] = (303, 'things/t')
+    request = messages.FakeThingsInsertRequest(
+        project='p', thing=messages.Thing(id='t'))
+    self.assertEqual(messages.Thing(id='t'),
+                     self.client.things.Insert(request))
+    post, get = self.server.requests
+    self.assertEqual('POST', post.method)
+    self.assertEqual(('GET', '/projects/p/things/t', ''),
+                     (get.method, get.path.split('?', 1)[0], get.body))
+    self.assertNotIn('content-type', get.headers)
+
+
+class GzipTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer()
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+
+  def __Insert(self, thing):
+    self.server.AddResponse(body='{"id": "t"}')
+    return self.client.things.Insert(
+        messages.FakeThingsInsertRequest(project='p', thing=thing))
+
+  def testLargeBodyCompressed(self):
+    self.client.SetRequestCompression(100)
+    thing = messages.Thing(id='t', tags=['tag%d' % i for i in range(50)])
+    self.__Insert(thing)
+    request, = self.server.requests
+    self.assertEqual('gzip', request.headers['content-encoding'])
+    self.assertEqual('application/json', request.headers['content-type'])
+    body = gzip.GzipFile(fileobj=StringIO.StringIO(request.body)).read()
+    self.assertEqual(thing, encoding.JsonToMessage(messages.Thing, body))
+
+  def testSmallBodyNotCompressed(self):
+    self.client.SetRequestCompression(100)
+    self.__Insert(messages.Thing(id='t'))
+    request, = self.server.requests
+    self.assertNotIn('content-encoding', request.headers)
+    self.assertEqual(messages.Thing(id='t'),
+                     encoding.JsonToMessage(messages.Thing, request.body))
+
+  def testNotCompressedByDefault(self):
+    self.__Insert(messages.Thing(tags=['tag%d' % i for i in range(50)]))
+    request, = self.server.requests
+    self.assertNotIn('content-encoding', request.headers)
+
+  def testPerMethodCompression(self):
+    self.client.SetRequestCompression(1)
+    self.client.SetRequestCompression(None, method_id='fake.things.insert')
+    self.__Insert(messages.Thing(tags=['tag%d' % i for i in range(50)]))
+    request, = self.server.requests
+    self.assertNotIn('content-encoding', request.headers)
+
+  def testGzipResponseDecoded(self):
+    self.server.AddResponse(
+        body=http_wrapper.GzipContent('{"id": "t"}'),
+        headers={'content-encoding': 'gzip'})
+    self.assertEqual(messages.Thing(id='t'), self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t')))
+    request, = self.server.requests
+    self.assertIn('gzip', request.headers['accept-encoding'])
+    self.assertTrue(request.headers['user-agent'].endswith('(gzip)'))
+
+
+class _CapturingHandler(logging.Handler):
+  """Keeps the messages logged to it."""
+
+  def __init__(self):
+    logging.Handler.__init__(self)
+    self.messages = []
+
+  def emit(self, record):
+    self.messages.append(record.getMessage())
+
+
+class RequestLoggingTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer(fake_server.EchoId)
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+    self.handler = _CapturingHandler()
+    logger = logging.getLogger('apitools.http')
+    self.addCleanup(logger.setLevel, logger.level)
+    self.addCleanup(logger.removeHandler, self.handler)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(self.handler)
+
+  def __Get(self):
+    return self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+
+  def testNotLoggedByDefault(self):
+    self.assertIsNone(self.client.request_logger)
+    self.__Get()
+    self.assertEqual([], self.handler.messages)
+
+  def testFlagsChangedAfterConstruction(self):
+    self.client.log_request = True
+    self.__Get()
+    request_message, = self.handler.messages
+    self.assertTrue(request_message.startswith('Request: GET '))
+    self.client.log_request = False
+    self.client.log_response = True
+    self.__Get()
+    self.assertEqual(2, len(self.handler.messages))
+    self.assertTrue(self.handler.messages[-1].startswith('Response: 200 '))
+    self.client.log_response = False
+    self.__Get()
+    self.assertEqual(2, len(self.handler.messages))
+
+  def testCustomRequestLogger(self):
+    self.client.request_logger = http_wrapper.RequestLogger(
+        log_request=False)
+    self.__Get()
+    response_message, = self.handler.messages
+    self.assertTrue(response_message.startswith('Response: 200 '))
+    self.client.request_logger = None
+    self.assertIsNone(self.client.request_logger)
+
+
+class StreamItemsTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer()
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+
+  def __Stream(self, **kwds):
+    return self.client.things.StreamItems(
+        'List', messages.FakeThingsListRequest(project='p', maxResults=2),
+        **kwds)
+
+  def testStreamItems(self):
+    self.server.AddResponse(
+        body='{"nextPageToken": "n", "items": [{"id": "a"}, {"id": "b"}]}')
+    stream = self.__Stream()
+    self.assertEqual([messages.Thing(id='a'), messages.Thing(id='b')],
+                     list(stream))
+    self.assertEqual(messages.ThingList(nextPageToken='n'), stream.envelope)
+    request, = self.server.requests
+    self.assertEqual('GET', request.method)
+    self.assertTrue(request.path.startswith('/projects/p/things?'))
+    self.assertIn('maxResults=2', request.path)
+
+  def testError(self):
+    self.server.AddResponse(status=404)
+    self.assertRaises(exceptions.HttpError, self.__Stream)
+
+  def testInvalidResponse(self):
+    self.server.AddResponse(body='{"items": [{"id": "a"}')
+    items = iter(self.__Stream())
+    self.assertEqual(messages.Thing(id='a'), next(items))
+    self.assertRaises(exceptions.InvalidDataFromServerError, next, items)
+
+  def testInvalidItem(self):
+    self.server.AddResponse(
+        body='{"items": [{"id": "a"}, {"color": "GREEN"}, {"id": "b"}]}')
+    items = iter(self.__Stream())
+    self.assertEqual(messages.Thing(id='a'), next(items))
+    self.assertRaises(exceptions.InvalidDataFromServerError, next, items)
+
+  def testInvalidResponsesRejectedAlike(self):
+    list_request = messages.FakeThingsListRequest(project='p')
+    for body in ['{"items": [{"color": "GREEN"}]}', '{"items": [{"id": }]}']:
+      self.server.AddResponse(body=body)
+      self.assertRaises(exceptions.InvalidDataFromServerError, list,
+                        self.__Stream())
+      self.server.AddResponse(body=body)
+      self.assertRaises(exceptions.InvalidDataFromServerError,
+                        self.client.things.List, list_request)
+      self.client.apiclient_compatibility_mode = True
+      self.server.AddResponse(body=body)
+      self.assertRaises(exceptions.InvalidDataFromServerError,
+                        self.client.things.List, list_request)
+      self.client.apiclient_compatibility_mode = False
+
+  def testUnknownMethod(self):
+    self.assertRaises(
+        exceptions.InvalidUserInputError, self.client.things.StreamItems,
+        'Missing', messages.FakeThingsListRequest(project='p'))
+
+
+class ResponseFieldsTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer()
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+
+  def __Get(self, global_params=None):
+    self.server.AddResponse(body='{"id": "t", "size": "3", "tags": ["a"]}')
+    response = self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'),
+        global_params=global_params)
+    query = urlparse.parse_qs(
+        urlparse.urlparse(self.server.requests[-1].path).query)
+    return response, query.get('fields')
+
+  def testSelectorSentAndResponsePruned(self):
+    mask = self.client.things.SetResponseFields('Get', ['id', 'size'])
+    self.assertIs(mask, self.client.things.GetResponseFields('Get'))
+    self.assertEqual(
+        (messages.Thing(id='t', size=3), ['id,size']), self.__Get())
+
+  def testPerCallFieldsWin(self):
+    self.client.things.SetResponseFields('Get', ['id'])
+    response, fields = self.__Get(
+        messages.StandardQueryParameters(fields='tags'))
+    self.assertEqual(['tags'], fields)
+    # The response is decoded in full, not pruned to the mask.
+    self.assertEqual(messages.Thing(id='t', size=3, tags=['a']), response)
+
+  def testCleared(self):
+    self.client.things.SetResponseFields('Get', ['id'])
+    self.assertIsNone(self.client.things.SetResponseFields('Get', None))
+    self.assertIsNone(self.client.things.GetResponseFields('Get'))
+    self.assertEqual(
+        (messages.Thing(id='t', size=3, tags=['a']), None), self.__Get())
+
+  def testPagedMethodKeepsNextPageToken(self):
+    mask = self.client.things.SetResponseFields('List', 'items.id')
+    self.assertEqual('items/id,nextPageToken', mask.selector)
+    # Other methods are masked as given.
+    mask = self.client.things.SetResponseFields('Get', 'id')
+    self.assertEqual('id', mask.selector)
+
+  def testUnknownMethodOrField(self):
+    self.assertRaises(exceptions.InvalidUserInputError,
+                      self.client.things.SetResponseFields, 'Missing', ['id'])
+    self.assertRaises(exceptions.InvalidUserInputError,
+                      self.client.things.SetResponseFields, 'Get', ['x'])
+
+
+class ResponseCacheTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer()
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+    self.cache = http_wrapper.ResponseCache()
+    self.client.SetResponseCache(self.cache)
+
+  def __Get(self):
+    return self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+
+  def __AddThing(self, headers=None, status=200):
+    self.server.AddResponse(status=status, body='{"id": "t"}',
+                            headers=headers)
+
+  def testNotModifiedServedFromCache(self):
+    self.__AddThing(headers={'etag': '"v1"'})
+    self.server.AddResponse(status=304)
+    self.server.AddResponse(status=304)
+    first = self.__Get()
+    second = self.__Get()
+    self.assertEqual(messages.Thing(id='t'), second)
+    self.assertIsNot(first, second)
+    # Callers get copies, so changing one doesn't change the cache.
+    second.id = 'changed'
+    self.assertEqual(messages.Thing(id='t'), self.__Get())
+    requests = self.server.requests
+    self.assertNotIn('if-none-match', requests[0].headers)
+    self.assertEqual(['"v1"', '"v1"'], [
+        request.headers['if-none-match'] for request in requests[1:]])
+    self.assertEqual(http_wrapper.ResponseCacheStats(
+        hits=2, misses=1, size=1), self.cache.stats)
+
+  def testChangedResponseReplacesEntry(self):
+    self.__AddThing(headers={'etag': '"v1"'})
+    self.server.AddResponse(body='{"id": "t2"}', headers={'etag': '"v2"'})
+    self.server.AddResponse(status=304)
+    self.__Get()
+    self.assertEqual(messages.Thing(id='t2'), self.__Get())
+    self.assertEqual(messages.Thing(id='t2'), self.__Get())
+    self.assertEqual('"v2"', self.server.requests[2].headers['if-none-match'])
+
+  def testNoStoreNotCached(self):
+    self.__AddThing(headers={'etag': '"v1"', 'cache-control': 'no-store'})
+    self.__AddThing()
+    self.__Get()
+    self.__Get()
+    self.assertNotIn('if-none-match', self.server.requests[1].headers)
+    self.assertEqual(0, self.cache.stats.size)
+
+  def testNonOkNotCached(self):
+    self.__AddThing(headers={'etag': '"v1"'}, status=203)
+    self.__AddThing()
+    self.__Get()
+    self.__Get()
+    self.assertNotIn('if-none-match', self.server.requests[1].headers)
+    self.assertEqual(0, self.cache.stats.size)
+
+  def testPostNotCached(self):
+    self.__AddThing(headers={'etag': '"v1"'})
+    self.client.things.Insert(messages.FakeThingsInsertRequest(
+        project='p', thing=messages.Thing(id='t')))
+    self.assertEqual(http_wrapper.ResponseCacheStats(
+        hits=0, misses=0, size=0), self.cache.stats)
+
+  def testLongGetCached(self):
+    self.server.AddResponse(body='{}', headers={'etag': '"v1"'})
+    self.server.AddResponse(status=304)
+    request = messages.FakeThingsListRequest(
+        project='p', pageToken='x' * http_wrapper.MAX_URL_LENGTH)
+    self.client.things.List(request)
+    self.client.things.List(request)
+    self.assertEqual('"v1"', self.server.requests[1].headers['if-none-match'])
+    self.assertEqual(1, self.cache.stats.hits)
+
+
+class CoalescingTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.release = threading.Event()
+    self.status = 200
+    self.server = self.StartServer(self.__Respond)
+    self.client = self.NewClient(
+        fake_client.FakeV1, self.server, http_pool_size=4)
+    self.client.SetRequestCoalescing(True)
+
+  def __Respond(self, request):
+    self.release.wait()
+    if self.status != 200:
+      return self.status, {}, ''
+    return fake_server.EchoId(request)
+
+  def __CallConcurrently(self, call, count, wait_for):
+    """Make count calls on their own threads, then release the server.
+
+    Returns:
+      A list of (result or exception, last_call_attempts) pairs.
+    """
+    outcomes = []
+
+    def Call():
+      try:
+        result = call()
+      except exceptions.Error as e:
+        result = e
+      outcomes.append((result, self.client.things.last_call_attempts))
+    threads = [threading.Thread(target=Call) for _ in range(count)]
+    for thread in threads:
+      thread.start()
+    fake_server.WaitFor(wait_for)
+    self.release.set()
+    for thread in threads:
+      thread.join()
+    return outcomes
+
+  def __Get(self):
+    return self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+
+  def __Coalesced(self):
+    return (len(self.server.requests) == 1 and
+            self.client.single_flight.waiting == 3)
+
+  def testIdenticalGetsSentOnce(self):
+    outcomes = self.__CallConcurrently(self.__Get, 4, self.__Coalesced)
+    self.assertEqual(1, len(self.server.requests))
+    responses = [response for response, _ in outcomes]
+    self.assertEqual([messages.Thing(id='t')] * 4, responses)
+    # Every caller gets its own copy of the response.
+    self.assertEqual(4, len(set(id(response) for response in responses)))
+    self.assertEqual([0, 0, 0, 1],
+                     sorted(attempts for _, attempts in outcomes))
+
+  def testErrorReachesWaiters(self):
+    self.status = 404
+    outcomes = self.__CallConcurrently(self.__Get, 4, self.__Coalesced)
+    self.assertEqual(1, len(self.server.requests))
+    for error, _ in outcomes:
+      self.assertIsInstance(error, exceptions.HttpError)
+      self.assertEqual(404, error.resp.status)
+
+  def testPostNotCoalesced(self):
+    request = messages.FakeThingsInsertRequest(
+        project='p', thing=messages.Thing(id='t'))
+    # The server only answers once all three requests have arrived.
+    outcomes = self.__CallConcurrently(
+        lambda: self.client.things.Insert(request), 3,
+        lambda: len(self.server.requests) == 3)
+    self.assertEqual([(messages.Thing(id='things'), 1)] * 3, outcomes)
+    self.assertEqual(0, self.client.single_flight.waiting)
+
+
+class PathTemplateTest(unittest.TestCase):
+
+  def __Expand(self, base_url, relative_path, path_params, quoted_params):
+    # pylint: disable=protected-access
+    return base_api._PathTemplate(
+        base_url, relative_path, path_params).Expand(quoted_params)
+
+  def testRelativePath(self):
+    self.assertEqual(
+        'http://h/fake/v1/projects/p/things/t',
+        self.__Expand('http://h/fake/v1/', 'projects/{project}/things/{thing}',
+                      ('project', 'thing'), {'project': 'p', 'thing': 't'}))
+
+  def testAbsoluteUploadPath(self):
+    self.assertEqual(
+        'http://h/upload/fake/v1/projects/p/things',
+        self.__Expand('http://h/fake/v1/', '/upload/fake/v1/projects/{project}'
+                      '/things', ('project',), {'project': 'p'}))
+
+  def testRepeatedParam(self):
+    self.assertEqual(
+        'http://h/a/x/b/x',
+        self.__Expand('http://h/', 'a/{name}/b/{name}', ('name',),
+                      {'name': 'x'}))
+
+  def testUnknownParamLeftAsLiteral(self):
+    self.assertEqual(
+        'http://h/a/x/{other}/b',
+        self.__Expand('http://h/', 'a/{name}/{other}/b', ('name',),
+                      {'name': 'x'}))
+
+  def testMissingParam(self):
+    # pylint: disable=protected-access
+    self.assertRaises(exceptions.InvalidUserInputError,
+                      base_api._PathTemplate, 'http://h/', 'a/{name}',
+                      ('name', 'other'))
+
+
+class ConstructUrlTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer(fake_server.EchoId)
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+
+  def testValuesQuoted(self):
+    self.client.things.Get(messages.FakeThingsGetRequest(
+        project=u'a/b c', thing=u'\xfc?#&=+%'))
+    request, = self.server.requests
+    self.assertEqual(
+        '/projects/a%2Fb%20c/things/%C3%BC%3F%23%26%3D%2B%25',
+        request.path.split('?', 1)[0])
+
+  def testMissingRequiredParam(self):
+    self.assertRaises(
+        exceptions.InvalidUserInputError, self.client.things.Get,
+        messages.FakeThingsGetRequest(project='p'))
+    self.assertEqual([], self.server.requests)
+
+
+class GlobalParamsTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer(fake_server.EchoId)
+    self.client = self.NewClient(
+        fake_client.FakeV1, self.server,
+        default_global_params=messages.StandardQueryParameters(key='k'))
+
+  def __Query(self, global_params=None):
+    """Make a Get, and return the query parameters it was sent with."""
+    self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'),
+        global_params=global_params)
+    path = self.server.requests[-1].path
+    return urlparse.parse_qs(urlparse.urlparse(path).query)
+
+  def testSnapshot(self):
+    self.assertEqual({
+        'alt': messages.StandardQueryParameters.AltValueValuesEnum.json,
+        'key': 'k',
+        'prettyPrint': True,
+        }, self.client.default_global_params_dict)
+    self.assertEqual({'alt': ['json'], 'key': ['k'], 'prettyPrint': ['True']},
+                     self.__Query())
+
+  def testAddGlobalParamRebuildsSnapshot(self):
+    self.assertNotIn('fields', self.client.default_global_params_dict)
+    self.client.AddGlobalParam('fields', 'id')
+    self.client.AddGlobalParam('key', 'k2')
+    snapshot = self.client.default_global_params_dict
+    self.assertEqual(('id', 'k2'), (snapshot['fields'], snapshot['key']))
+    query = self.__Query()
+    self.assertEqual((['id'], ['k2']), (query['fields'], query['key']))
+
+  def testSnapshotNotShared(self):
+    snapshot = self.client.default_global_params_dict
+    self.assertIsNot(snapshot, self.client.default_global_params_dict)
+    snapshot['key'] = 'changed'
+    self.assertEqual(['k'], self.__Query()['key'])
+    # Per-call overrides don't leak into the defaults.
+    self.__Query(messages.StandardQueryParameters(fields='id'))
+    self.assertNotIn('fields', self.client.default_global_params_dict)
+    self.assertNotIn('fields', self.__Query())
+
+  def testPerCallOverrides(self):
+    query = self.__Query(messages.StandardQueryParameters(
+        key='call', prettyPrint=False))
+    self.assertEqual((['call'], ['False']),
+                     (query['key'], query['prettyPrint']))
+    # Fields the call leaves unset keep their defaults.
+    self.assertEqual(['json'], query['alt'])
+    self.assertEqual('k', self.client.default_global_params_dict['key'])
+
+
+class RateLimitTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer(fake_server.EchoId)
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+
+  def __Limiter(self, burst):
+    """A fail-fast limiter whose burst tokens are never refilled."""
+    return http_wrapper.RateLimiter(
+        1, burst=burst, block=False, clock=lambda: 0)
+
+  def __Get(self):
+    return self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+
+  def __List(self):
+    return self.client.things.List(
+        messages.FakeThingsListRequest(project='p'))
+
+  def testFailFastBeforeSending(self):
+    self.client.SetRateLimiter(self.__Limiter(1))
+    self.__Get()
+    self.assertRaises(exceptions.RateLimitExceededError, self.__Get)
+    self.assertEqual(1, len(self.server.requests))
+
+  def testMethodLimiterTakesPrecedence(self):
+    self.client.things.SetRateLimiter(self.__Limiter(1))
+    self.client.SetRateLimiter(self.__Limiter(3), method_id='fake.things.get')
+    for _ in range(3):
+      self.__Get()
+    self.assertRaises(exceptions.RateLimitExceededError, self.__Get)
+    # The service limiter still applies to the other methods.
+    self.__List()
+    self.assertRaises(exceptions.RateLimitExceededError, self.__List)
+    self.assertEqual(4, len(self.server.requests))
+
+
+class CircuitBreakerTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.release = threading.Event()
+    self.server = self.StartServer()
+    self.addCleanup(self.release.set)
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+    self.client.SetCircuitBreakers(http_wrapper.CircuitBreakerGroup(
+        failure_threshold=2, reset_timeout=60))
+    self.breaker = self.client.circuit_breaker
+
+  def __Get(self, client=None):
+    return (client or self.client).things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+
+  def __Hang(self, request):
+    self.release.wait()
+    return fake_server.EchoId(request)
+
+  def testServerErrorsOpenCircuit(self):
+    self.server.AddResponse(status=500)
+    self.server.AddResponse(status=503)
+    self.assertRaises(exceptions.HttpError, self.__Get)
+    self.assertEqual(1, self.breaker.consecutive_failures)
+    self.assertRaises(exceptions.HttpError, self.__Get)
+    self.assertEqual(http_wrapper.CircuitBreaker.OPEN, self.breaker.state)
+    # Nothing is sent while the circuit is open.
+    self.assertRaises(exceptions.CircuitOpenError, self.__Get)
+    self.assertEqual(2, len(self.server.requests))
+
+  def testClientErrorsAreNotFailures(self):
+    for _ in range(3):
+      self.server.AddResponse(status=404)
+      self.assertRaises(exceptions.HttpError, self.__Get)
+    self.assertEqual(http_wrapper.CircuitBreaker.CLOSED, self.breaker.state)
+    self.assertEqual(0, self.breaker.consecutive_failures)
+
+  def testSuccessResetsFailures(self):
+    self.server.AddResponse(status=503)
+    self.server.AddResponse(body='{"id": "t"}')
+    self.server.AddResponse(status=503)
+    self.assertRaises(exceptions.HttpError, self.__Get)
+    self.__Get()
+    self.assertEqual(0, self.breaker.consecutive_failures)
+    self.assertRaises(exceptions.HttpError, self.__Get)
+    self.assertEqual(http_wrapper.CircuitBreaker.CLOSED, self.breaker.state)
+    self.assertEqual(1, self.breaker.consecutive_failures)
+
+  def testTimeoutIsFailure(self):
+    server = self.StartServer(self.__Hang)
+    client = self.NewClient(
+        fake_client.FakeV1, server, http=httplib2.Http(timeout=0.05))
+    client.SetCircuitBreakers(http_wrapper.CircuitBreakerGroup(
+        failure_threshold=2, reset_timeout=60))
+    for _ in range(2):
+      self.assertRaises(exceptions.CommunicationError, self.__Get, client)
+    self.assertEqual(http_wrapper.CircuitBreaker.OPEN,
+                     client.circuit_breaker.state)
+    sent = len(server.requests)
+    self.assertRaises(exceptions.CircuitOpenError, self.__Get, client)
+    self.assertEqual(sent, len(server.requests))
+
+  def testOpenCircuitStopsRetries(self):
+    sleeps = []
+    self.client.SetRetryPolicy(http_wrapper.RetryPolicy(
+        sleep=sleeps.append, jitter=0, max_retries=5))
+    for _ in range(5):
+      self.server.AddResponse(status=503)
+    self.assertRaises(exceptions.CircuitOpenError, self.__Get)
+    self.assertEqual(2, len(self.server.requests))
+    self.assertEqual(3, self.client.things.last_call_attempts)
+    self.assertEqual([1.0, 2.0], sleeps)
+
+
+class MethodConfigTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer(fake_server.EchoId)
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+
+  def __Get(self):
+    return self.client.things.Get(
+        messages.FakeThingsGetRequest(project='p', thing='t'))
+
+  def testConfigsAreFrozen(self):
+    config = self.client.things.GetMethodConfig('Get')
+    self.assertRaises(AttributeError, setattr, config, 'relative_path',
+                      u'v2/projects/{project}/things/{thing}')
+    self.assertEqual((u'project', u'thing'), config.path_params)
+    self.assertRaises(AttributeError, getattr, config.path_params, 'append')
+    self.__Get()
+    request, = self.server.requests
+    self.assertTrue(request.path.startswith('/projects/p/things/t?'))
+
+  def testFreezeUploadConfig(self):
+    config = base_api.FreezeConfig(base_api.ApiMethodInfo(
+        method_id=u'fake.things.upload',
+        upload_config=base_api.ApiUploadInfo(
+            accept=[u'image/*'], simple_path=u'/upload/things')))
+    self.assertEqual(u'', config.request_field)
+    self.assertFalse(config.supports_download)
+    self.assertEqual((u'image/*',), config.upload_config.accept)
+    self.assertRaises(AttributeError, setattr, config.upload_config,
+                      'simple_path', u'/upload/v2/things')
+
+  def testFreshConfigs(self):
+    config = self.client.things.GetMethodConfig('Get')
+    for thing in ('t1', 't2'):
+      # pylint: disable=protected-access
+      response = self.client.things._RunMethod(
+          base_api.ApiMethodInfo(**config._asdict()),
+          messages.FakeThingsGetRequest(project='p', thing=thing))
+      self.assertEqual(messages.Thing(id=thing), response)
+
+
+class PerMethodSettingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.client = fake_client.FakeV1('http://localhost/')
+
+  def testMethodOverridesClient(self):
+    client_policy = http_wrapper.RetryPolicy()
+    get_policy = http_wrapper.RetryPolicy()
+    self.assertIsNone(self.client.GetRetryPolicy('fake.things.get'))
+    self.client.SetRetryPolicy(client_policy)
+    self.client.SetRetryPolicy(get_policy, method_id='fake.things.get')
+    self.assertIs(get_policy, self.client.GetRetryPolicy('fake.things.get'))
+    self.assertIs(client_policy,
+                  self.client.GetRetryPolicy('fake.things.list'))
+    # A method can opt out of the client-wide value.
+    self.client.SetRetryPolicy(None, method_id='fake.things.get')
+    self.assertIsNone(self.client.GetRetryPolicy('fake.things.get'))
+
+  def testFalseOverride(self):
+    self.client.SetRequestCoalescing(True)
+    self.client.SetRequestCoalescing(False, method_id='fake.things.get')
+    self.assertFalse(self.client.GetRequestCoalescing('fake.things.get'))
+    self.assertTrue(self.client.GetRequestCoalescing('fake.things.list'))
+
+  def testRateLimiterPrecedence(self):
+    client_limiter = http_wrapper.RateLimiter(10)
+    service_limiter = http_wrapper.RateLimiter(10)
+    get_limiter = http_wrapper.RateLimiter(10)
+    self.client.SetRateLimiter(client_limiter)
+    self.assertIs(client_limiter,
+                  self.client.GetRateLimiter('fake.things.get'))
+    self.assertIs(service_limiter, self.client.GetRateLimiter(
+        'fake.things.get', service_rate_limiter=service_limiter))
+    self.client.SetRateLimiter(get_limiter, method_id='fake.things.get')
+    self.assertIs(get_limiter, self.client.GetRateLimiter(
+        'fake.things.get', service_rate_limiter=service_limiter))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""Batch (multipart/mixed) HTTP requests for apitools clients."""
+
+import email.generator as email_generator
+import email.mime.multipart as mime_multipart
+import email.mime.nonmultipart as mime_nonmultipart
+import email.parser as email_parser
+import StringIO
+import urllib
+import urlparse
+import uuid
+
+from apiclient import errors as apiclient_errors
+import httplib2
+from protorpc import messages
+
+from apitools.base.py import exceptions
+
+__all__ = [
+    'BatchApiRequest',
+    ]
+
+
+def _SerializeRequest(http_request):
+  """Serialize http_request as the body of an application/http part."""
+  parsed = urlparse.urlsplit(http_request.uri)
+  request_line = urlparse.urlunsplit(
+      (None, None, parsed.path, parsed.query, None))
+  status_line = '%s %s HTTP/1.1\n' % (http_request.method, request_line)
+  major, minor = http_request.headers.get(
+      'content-type', 'application/json').split('/', 1)
+  msg = mime_nonmultipart.MIMENonMultipart(major, minor)
+  for key, value in http_request.headers.iteritems():
+    if key == 'content-type':
+      continue
+    msg[key] = value
+  msg['Host'] = parsed.netloc
+  msg.set_unixfrom(None)
+  if http_request.body is not None:
+    msg.set_payload(http_request.body)
+  str_io = StringIO.StringIO()
+  # maxheaderlen=0 means don't line wrap headers.
+  gen = email_generator.Generator(str_io, maxheaderlen=0)
+  gen.flatten(msg, unixfrom=False)
+  body = str_io.getvalue()
+  # Strip off the \n\n that the MIME lib tacks onto the end of the
+  # headers when there is no payload.
+  if http_request.body is None:
+    body = body[:-2]
+  return status_line + body
+
+
+def _DeserializeResponse(payload):
+  """Convert an application/http part into (response_info, content)."""
+  status_line, _, payload = payload.partition('\n')
+  # The reason phrase is optional, as in "HTTP/1.1 204".
+  fields = status_line.split(None, 2)
+  if len(fields) < 2 or not fields[1].isdigit():
+    raise exceptions.InvalidDataFromServerError(
+        'Invalid status line in batch response: %r' % status_line)
+  status = fields[1]
+  msg = email_parser.Parser().parsestr(payload)
+  info = dict(msg)
+  info['status'] = status
+  return httplib2.Response(info), msg.get_payload()
+
+
+class BatchApiRequest(object):
+  """A collection of service method calls sent as one HTTP request.
+
+  Calls are added with Add, and sent together by Execute, which
+  returns one ApiCall per added call, in the order they were added.
+  """
+
+  class ApiCall(object):
+    """Holds the request and the result of a single call in a batch."""
+
+    def __init__(self, http_request):
+      self.__http_request = http_request
+      self.__response = None
+      self.__exception = None
+
+    @property
+    def http_request(self):
+      return self.__http_request
+
+    @property
+    def response(self):
+      return self.__response
+
+    @property
+    def exception(self):
+      return self.__exception
+
+    @property
+    def is_error(self):
+      return self.__exception is not None
+
+    def HandleResponse(self, response_info, content):
+      """Decode the response for this call, recording any error."""
+      if response_info.status >= 300:
+        self.__exception = exceptions.HttpError(
+            response_info, content, uri=self.__http_request.uri)
+        return
+      try:
+        self.__response = self.__http_request.postproc(
+            response_info, content)
+      except apiclient_errors.HttpError as e:
+        self.__exception = exceptions.HttpError.FromApiclientError(e)
+      except exceptions.Error as e:
+        self.__exception = e
+      except (ValueError, messages.Error) as e:
+        # Content that can't be decoded (such as invalid JSON) only
+        # fails this call, not the rest of the batch.
+        self.__exception = exceptions.InvalidDataFromServerError(
+            'Error decoding response for %s: %s' % (
+                self.__http_request.uri, e))
+
+    def HandleException(self, exception):
+      self.__exception = exception
+
+  def __init__(self, batch_url, http=None):
+    self.__batch_url = batch_url
+    self.__http = http
+    self.__base_id = uuid.uuid4()
+    self.__calls = []
+
+  @property
+  def batch_url(self):
+    return self.__batch_url
+
+  def Add(self, service, method, request, global_params=None):
+    """Add a call of service.method with request to this batch.
+
+    Args:
+      service: (BaseApiService) the service containing method.
+      method: (str) the name of the method, such as 'Get'.
+      request: the request message for the method.
+      global_params: (StandardQueryParameters, default: None) global
+          arguments for this call.
+
+    Returns:
+      The ApiCall that will hold the result of this call.
+    """
+    method_config = service.GetMethodConfig(method)
+    if method_config is None:
+      raise exceptions.InvalidUserInputError(
+          'No method %s found in service %s' % (
+              method, type(service).__name__))
+    # Parts of a multipart body can't be compressed individually.
+    http_request = service.PrepareHttpRequest(
+        method_config, request, global_params=global_params,
+        compress_body=False)
+    api_call = self.ApiCall(http_request)
+    self.__calls.append(api_call)
+    return api_call
+
+  def __ConvertIdToHeader(self, request_id):
+    return '<%s+%s>' % (self.__base_id, urllib.quote(str(request_id)))
+
+  @staticmethod
+  def __ConvertHeaderToId(header):
+    if header is None:
+      raise exceptions.InvalidDataFromServerError(
+          'Batch response part has no Content-ID')
+    if not (header.startswith('<') and header.endswith('>') and
+            '+' in header):
+      raise exceptions.InvalidDataFromServerError(
+          'Invalid value for Content-ID: %s' % header)
+    _, request_id = header[1:-1].rsplit('+', 1)
+    try:
+      return int(urllib.unquote(request_id))
+    except ValueError:
+      raise exceptions.InvalidDataFromServerError(
+          'Invalid value for Content-ID: %s' % header)
+
+  def __SerializeBatch(self):
+    message = mime_multipart.MIMEMultipart('mixed')
+    # The batch headers are sent as HTTP headers, not in the body.
+    setattr(message, '_write_headers', lambda self: None)
+    for request_id, api_call in enumerate(self.__calls):
+      msg = mime_nonmultipart.MIMENonMultipart('application', 'http')
+      msg['Content-Transfer-Encoding'] = 'binary'
+      msg['Content-ID'] = self.__ConvertIdToHeader(request_id)
+      msg.set_payload(_SerializeRequest(api_call.http_request))
+      message.attach(msg)
+    body = message.as_string()
+    headers = {
+        'content-type': ('multipart/mixed; boundary="%s"' %
+                         message.get_boundary()),
+        }
+    return headers, body
+
+  def __HandleBatchResponse(self, response_info, content):
+    content_type = response_info.get('content-type')
+    if content_type is None:
+      raise exceptions.InvalidDataFromServerError(
+          'Batch response has no content-type')
+    # Prepend the content type header so the MIME parser can find
+    # the boundary.
+    header = 'content-type: %s\r\n\r\n' % content_type
+    mime_response = email_parser.Parser().parsestr(header + content)
+    if not mime_response.is_multipart():
+      raise exceptions.InvalidDataFromServerError(
+          'Batch response is not a multipart message')
+    seen_ids = set()
+    for part in mime_response.get_payload():
+      request_id = self.__ConvertHeaderToId(part['Content-ID'])
+      if not 0 <= request_id < len(self.__calls):
+        raise exceptions.InvalidDataFromServerError(
+            'Unexpected Content-ID in batch response: %s' %
+            part['Content-ID'])
+      api_call = self.__calls[request_id]
+      try:
+        part_info, part_content = _DeserializeResponse(part.get_payload())
+      except exceptions.InvalidDataFromServerError as e:
+        api_call.HandleException(e)
+      else:
+        api_call.HandleResponse(part_info, part_content)
+      seen_ids.add(request_id)
+    for request_id, api_call in enumerate(self.__calls):
+      if request_id not in seen_ids:
+        api_call.HandleException(exceptions.InvalidDataFromServerError(
+            'No response for request %s in batch' %
+            api_call.http_request.uri))
+
+  def Execute(self, http=None):
+    """Send all calls in this batch as a single HTTP request.
+
+    Args:
+      http: (httplib2.Http, default: None) http object to use; defaults
+          to the one this batch was created with.
+
+    Returns:
+      The list of ApiCalls in this batch, in the order they were added.
+      Each holds either its decoded response or an exception.
+    """
+    http = http or self.__http
+    if http is None:
+      raise exceptions.ConfigurationValueError(
+          'No http object available to execute batch')
+    if not self.__calls:
+      return []
+    headers, body = self.__SerializeBatch()
+    try:
+      response_info, content = http.request(
+          self.__batch_url, method='POST', body=body, headers=headers)
+    except httplib2.HttpLib2Error as e:
+      raise exceptions.CommunicationError(
+          'Communication error making request to "%s": "%s"' % (
+              self.__batch_url, e))
+    if response_info.status >= 300:
+      raise exceptions.HttpError(response_info, content, uri=self.__batch_url)
+    self.__HandleBatchResponse(response_info, content)
+    return list(self.__calls)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""Tests for batch, against a local server speaking the batch format."""
+
+import unittest
+
+from apitools.base.py import exceptions
+from apitools.base.py.testing import fake_client
+from apitools.base.py.testing import fake_messages as messages
+from apitools.base.py.testing import fake_server
+
+_BOUNDARY = 'batch_boundary'
+
+
+def _Part(content_id, status_line, body='', content_type='application/json'):
+  headers = ['Content-Type: application/http']
+  if content_id is not None:
+    headers.append('Content-ID: <response-abc+%s>' % content_id)
+  return '%s\r\n\r\n%s\r\nContent-Type: %s\r\n\r\n%s' % (
+      '\r\n'.join(headers), status_line, content_type, body)
+
+
+def _BatchBody(*parts):
+  lines = []
+  for part in parts:
+    lines.append('--%s\r\n%s\r\n' % (_BOUNDARY, part))
+  lines.append('--%s--\r\n' % _BOUNDARY)
+  return ''.join(lines)
+
+
+class BatchTest(fake_server.FakeServerTestCase):
+
+  def setUp(self):
+    self.server = self.StartServer()
+    self.client = self.NewClient(fake_client.FakeV1, self.server)
+
+  def __NewBatch(self, count=2):
+    batch = self.client.NewBatchRequest()
+    for i in range(count):
+      batch.Add(self.client.things, 'Get', messages.FakeThingsGetRequest(
+          project='p', thing='t%d' % i))
+    return batch
+
+  def __AddBatchResponse(self, body, headers=None):
+    if headers is None:
+      headers = {'content-type': 'multipart/mixed; boundary=%s' % _BOUNDARY}
+    self.server.AddResponse(body=body, headers=headers)
+
+  def testMixedStatuses(self):
+    batch = self.__NewBatch()
+    self.__AddBatchResponse(_BatchBody(
+        _Part(1, 'HTTP/1.1 404 Not Found', '{"error": "missing"}'),
+        _Part(0, 'HTTP/1.1 200 OK', '{"id": "t0"}')))
+    first, second = batch.Execute()
+    self.assertFalse(first.is_error)
+    self.assertEqual(messages.Thing(id='t0'), first.response)
+    self.assertTrue(second.is_error)
+    self.assertIsInstance(second.exception, exceptions.HttpError)
+    self.assertEqual(404, second.exception.resp.status)
+    request, = self.server.requests
+    self.assertEqual(('POST', '/batch'), (request.method, request.path))
+    self.assertIn('GET /projects/p/things/t0', request.body)
+    self.assertIn('GET /projects/p/things/t1', request.body)
+
+  def testMissingPart(self):
+    batch = self.__NewBatch()
+    self.__AddBatchResponse(_BatchBody(
+        _Part(0, 'HTTP/1.1 200 OK', '{"id": "t0"}')))
+    first, second = batch.Execute()
+    self.assertEqual(messages.Thing(id='t0'), first.response)
+    self.assertIsInstance(
+        second.exception, exceptions.InvalidDataFromServerError)
+
+  def testStatusWithoutReason(self):
+    batch = self.__NewBatch()
+    self.__AddBatchResponse(_BatchBody(
+        _Part(0, 'HTTP/1.1 204'),
+        _Part(1, 'HTTP/1.1 404', '{"error": "missing"}')))
+    first, second = batch.Execute()
+    self.assertFalse(first.is_error)
+    self.assertEqual(messages.Thing(), first.response)
+    self.assertEqual(404, second.exception.resp.status)
+
+  def testUndecodablePartFailsOnlyItsCall(self):
+    batch = self.__NewBatch(count=4)
+    self.__AddBatchResponse(_BatchBody(
+        _Part(0, 'HTTP/1.1 200 OK', '{"id": '),
+        _Part(1, 'HTTP/1.1 200 OK', '{"id": "t1"}'),
+        _Part(2, 'HTTP/1.1 200 OK', '{"color": "PURPLE"}'),
+        _Part(3, 'HTTP/1.1', '{"id": "t3"}')))
+    first, second, third, fourth = batch.Execute()
+    self.assertEqual(messages.Thing(id='t1'), second.response)
+    for api_call in (first, third, fourth):
+      self.assertIsNone(api_call.response)
+      self.assertIsInstance(
+          api_call.exception, exceptions.InvalidDataFromServerError)
+
+  def testUnknownContentId(self):
+    batch = self.__NewBatch()
+    self.__AddBatchResponse(_BatchBody(
+        _Part(0, 'HTTP/1.1 200 OK', '{"id": "t0"}'),
+        _Part(7, 'HTTP/1.1 200 OK', '{"id": "t7"}')))
+    self.assertRaises(exceptions.InvalidDataFromServerError, batch.Execute)
+
+  def testMissingContentId(self):
+    batch = self.__NewBatch(count=1)
+    self.__AddBatchResponse(_BatchBody(
+        _Part(None, 'HTTP/1.1 200 OK', '{"id": "t0"}')))
+    self.assertRaises(exceptions.InvalidDataFromServerError, batch.Execute)
+
+  def testMissingContentType(self):
+    batch = self.__NewBatch(count=1)
+    self.__AddBatchResponse(_BatchBody(
+        _Part(0, 'HTTP/1.1 200 OK', '{"id": "t0"}')), headers={})
+    self.assertRaises(exceptions.InvalidDataFromServerError, batch.Execute)
+
+  def testBatchError(self):
+    batch = self.__NewBatch()
+    self.server.AddResponse(status=503, body='unavailable')
+    self.assertRaises(exceptions.HttpError, batch.Execute)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -3,15 +3,20 @@
 
 import base64
 import json
+import logging
+import threading
 
-
+from protorpc import message_types
 from protorpc import messages
 from protorpc import protojson
+from protorpc import util
 
 from apitools.base.py import exceptions
 
 __all__ = [
     'CopyProtoMessage',
+    'FieldMask',
+    'JsonItemStream',
     'JsonToMessage',
     'MessageToJson',
     'DictToMessage',
@@ -19,49 +24,709 @@ __all__ = [
     ]
 
 
-# TODO(craigcitro): Delete this function with the switch to proto2.
 def CopyProtoMessage(message):
-  codec = protojson.ProtoJson()
-  return codec.decode_message(type(message), codec.encode_message(message))
+  """Make a deep copy of message, without serializing it."""
+  return _CopyValue(message)
+
+
+def _CopyValue(value):
+  """Deep copy a field value (including a message)."""
+  if isinstance(value, messages.Message):
+    result = type(value)()
+    for field in value.all_fields():
+      field_value = value.get_assigned_value(field.name)
+      if field_value is None:
+        continue
+      if field.repeated:
+        field_value = [_CopyValue(item) for item in field_value]
+      else:
+        field_value = _CopyValue(field_value)
+      setattr(result, field.name, field_value)
+    for key in value.all_unrecognized_fields():
+      field_value, variant = value.get_unrecognized_field_info(key)
+      result.set_unrecognized_field(key, _CopyValue(field_value), variant)
+    return result
+  if isinstance(value, list):
+    return [_CopyValue(item) for item in value]
+  if isinstance(value, dict):
+    return dict((key, _CopyValue(item)) for key, item in value.iteritems())
+  # Everything else a field can hold (strings, numbers, enums,
+  # datetimes) is immutable.
+  return value
 
 
 # XXX json.dumps(body_value, cls=ApiJsonEncoder)
 def MessageToJson(message, include_fields=None):
-  """Convert the given message to JSON."""
-  result = _ProtoJsonApilib.Get().encode_message(message)
-  return _IncludeFields(result, message, include_fields)
+  """Convert the given message to JSON.
+
+  Args:
+    message: the message to encode.
+    include_fields: (list of str, default: None) fields to write as
+        null, whether or not they are set. A dotted path such as
+        'a.b' names a field of a nested message, which is written as
+        an object even when it is unset.
+
+  Returns:
+    The JSON encoding of message.
+  """
+  codec = _MessageCodec.ForType(type(message))
+  nulls = None
+  if include_fields is not None:
+    nulls = _IncludeFieldsTree(type(message), include_fields)
+  message.check_initialized()
+  return json.dumps(codec.Encode(message, nulls=nulls))
 
 
 def JsonToMessage(message_type, message):
   """Convert the given JSON to a message of type message_type."""
-  return _ProtoJsonApilib.Get().decode_message(message_type, message)
+  if not message.strip():
+    return message_type()
+  result = _MessageCodec.ForType(message_type).Decode(json.loads(message))
+  result.check_initialized()
+  return result
+
+
+class _JsonStreamReader(object):
+  """Reads JSON values one at a time from a string or file-like object.
+
+  Only the structural characters of the enclosing object and array
+  are scanned here; each value inside them is decoded with
+  json.JSONDecoder.raw_decode as soon as it is complete, so at most
+  one value (plus one chunk of input) is held in memory at a time.
+  """
+
+  _WHITESPACE = ' \t\n\r'
+
+  def __init__(self, source, chunk_size=64 * 1024):
+    self.__decoder = json.JSONDecoder()
+    self.__chunk_size = chunk_size
+    if isinstance(source, basestring):
+      self.__stream = None
+      self.__buffer = source
+    else:
+      self.__stream = source
+      self.__buffer = ''
+    self.__pos = 0
+
+  def __Fill(self):
+    """Read another chunk of input, returning False at end of input."""
+    if self.__stream is None:
+      return False
+    chunk = self.__stream.read(self.__chunk_size)
+    if not chunk:
+      self.__stream = None
+      return False
+    self.__buffer = self.__buffer[self.__pos:] + chunk
+    self.__pos = 0
+    return True
+
+  def __SkipWhitespace(self):
+    while True:
+      while (self.__pos < len(self.__buffer) and
+             self.__buffer[self.__pos] in self._WHITESPACE):
+        self.__pos += 1
+      if self.__pos < len(self.__buffer) or not self.__Fill():
+        return
+
+  def Consume(self, char):
+    """Skip char (after any whitespace) if it is next, and return whether."""
+    self.__SkipWhitespace()
+    if self.__buffer[self.__pos:self.__pos + 1] == char:
+      self.__pos += 1
+      return True
+    return False
+
+  def Expect(self, char):
+    if not self.Consume(char):
+      raise exceptions.InvalidDataFromServerError(
+          'Invalid JSON: expected %r at %r' % (
+              char, self.__buffer[self.__pos:self.__pos + 20]))
+
+  def ReadValue(self):
+    """Decode the next complete JSON value."""
+    self.__SkipWhitespace()
+    while True:
+      try:
+        value, end = self.__decoder.raw_decode(self.__buffer, self.__pos)
+      except ValueError as e:
+        if not self.__Fill():
+          raise exceptions.InvalidDataFromServerError(
+              'Invalid JSON: %s' % e)
+        continue
+      # A number at the end of the buffer may continue in the next
+      # chunk, so only accept a value once something follows it.
+      if end < len(self.__buffer) or not self.__Fill():
+        self.__pos = end
+        return value
+      # Filling moved the buffer, so decode the value again.
+
+  def AtEnd(self):
+    self.__SkipWhitespace()
+    return self.__pos >= len(self.__buffer)
+
+
+class JsonItemStream(object):
+  """Incrementally decodes the items of a repeated field of a response.
+
+  Iterating over a JsonItemStream yields the values of the repeated
+  top-level field field_name of a JSON-encoded message_type, decoding
+  each item as it is reached. The dict for an item is discarded once
+  its message is built, so peak memory is roughly one item rather
+  than the entire parsed response.
+
+  The other top-level fields (such as nextPageToken) are collected
+  into envelope, a message_type with field_name left empty, which is
+  complete once iteration has finished.
+  """
+
+  def __init__(self, message_type, field_name, source):
+    """Create a stream of items.
+
+    Args:
+      message_type: the type of the encoded message.
+      field_name: (str) the name of a repeated field of message_type.
+      source: the JSON, as a string or a file-like object with a read
+          method.
+    """
+    try:
+      field = message_type.field_by_name(field_name)
+    except KeyError:
+      raise exceptions.InvalidUserInputError(
+          'No field named %s in message of type %s' % (
+              field_name, message_type.__name__))
+    if not field.repeated:
+      raise exceptions.InvalidUserInputError(
+          'Field %s of %s is not repeated' % (
+              field_name, message_type.__name__))
+    self.__message_type = message_type
+    self.__field = field
+    self.__source = source
+    self.__envelope = None
+    self.__started = False
+
+  @property
+  def field(self):
+    return self.__field
+
+  @property
+  def envelope(self):
+    if self.__envelope is None:
+      raise exceptions.InvalidUserInputError(
+          'Envelope is not available until iteration has finished')
+    return self.__envelope
+
+  def __iter__(self):
+    if self.__started:
+      raise exceptions.InvalidUserInputError(
+          'A JsonItemStream can only be iterated once')
+    self.__started = True
+    return self.__IterItems()
+
+  def __IterItems(self):
+    decode = _MessageCodec.ForType(self.__message_type).FieldDecoder(
+        self.__field.name)
+    is_message = isinstance(self.__field, messages.MessageField)
+    reader = _JsonStreamReader(self.__source)
+    # Drop our reference, so a consumed string can be freed.
+    self.__source = None
+    others = {}
+    if reader.AtEnd():
+      # An empty response body is an empty message, as in JsonToMessage.
+      self.__envelope = self.__message_type()
+      return
+    reader.Expect('{')
+    if not reader.Consume('}'):
+      while True:
+        key = reader.ReadValue()
+        reader.Expect(':')
+        if key == self.__field.name and reader.Consume('['):
+          if not reader.Consume(']'):
+            while True:
+              item = reader.ReadValue()
+              if is_message and not isinstance(item, (dict, type(None))):
+                raise exceptions.InvalidDataFromServerError(
+                    'Invalid item in field %s: %r' % (
+                        self.__field.name, item))
+              if item is not None:
+                yield self.__Decode(decode, item)
+              if reader.Consume(']'):
+                break
+              reader.Expect(',')
+        else:
+          others[key] = reader.ReadValue()
+        if reader.Consume('}'):
+          break
+        reader.Expect(',')
+    if not reader.AtEnd():
+      raise exceptions.InvalidDataFromServerError(
+          'Invalid JSON: trailing data after response')
+    self.__envelope = self.__Decode(
+        lambda d: JsonToMessage(self.__message_type, json.dumps(d)), others)
+
+  def __Decode(self, decode, value):
+    """Return decode(value), raising InvalidDataFromServerError on error."""
+    try:
+      return decode(value)
+    except (messages.ValidationError, messages.DecodeError) as e:
+      raise exceptions.InvalidDataFromServerError(
+          'Error decoding %r in response of type %s: %s' % (
+              value, self.__message_type.__name__, e))
+
+
+class FieldMask(object):
+  """A set of fields of a message type, to request a partial response.
+
+  The fields are given as dotted paths, such as 'items.id', and are
+  checked against message_type. A path selects everything below it,
+  so 'items' includes 'items.id'. Below a message whose unrecognized
+  fields are mapped with MapUnrecognizedFields, path components name
+  map keys and are not checked.
+
+  selector is the equivalent value for the standard fields parameter,
+  such as 'items(id,name),nextPageToken', and JsonToMessage decodes a
+  partial response, visiting only the selected fields.
+  """
+
+  def __init__(self, message_type, field_paths):
+    if isinstance(field_paths, basestring):
+      field_paths = [field_paths]
+    if not field_paths:
+      raise exceptions.InvalidUserInputError('No fields in field mask')
+    self.__message_type = message_type
+    self.__tree = {}
+    for path in field_paths:
+      self.__AddPath(path)
+    self.__selector = self.__FormatTree(self.__tree)
+
+  @property
+  def message_type(self):
+    return self.__message_type
+
+  @property
+  def selector(self):
+    return self.__selector
+
+  def __AddPath(self, path):
+    """Add the dotted path to the tree of selected fields."""
+    names = path.split('.')
+    tree = self.__tree
+    message_type = self.__message_type
+    for i, name in enumerate(names):
+      if message_type is not None:
+        if message_type in _UNRECOGNIZED_FIELD_MAPPINGS:
+          message_type = None
+        else:
+          try:
+            field = message_type.field_by_name(name)
+          except KeyError:
+            raise exceptions.InvalidUserInputError(
+                'No field named %s in message of type %s (in %s)' % (
+                    name, message_type.__name__, path))
+          if isinstance(field, messages.MessageField):
+            message_type = field.type
+          elif i < len(names) - 1:
+            raise exceptions.InvalidUserInputError(
+                'Field %s of %s has no subfields (in %s)' % (
+                    name, message_type.__name__, path))
+      if i == len(names) - 1:
+        # This path selects the whole subtree.
+        tree[name] = None
+      elif name not in tree:
+        tree[name] = {}
+      elif tree[name] is None:
+        # A shorter path already selects everything below here.
+        return
+      tree = tree[name]
+
+  @classmethod
+  def __FormatTree(cls, tree):
+    parts = []
+    for name, subtree in sorted(tree.iteritems()):
+      if subtree is None:
+        parts.append(name)
+      elif len(subtree) == 1:
+        parts.append('%s/%s' % (name, cls.__FormatTree(subtree)))
+      else:
+        parts.append('%s(%s)' % (name, cls.__FormatTree(subtree)))
+    return ','.join(parts)
+
+  def JsonToMessage(self, encoded_message):
+    """Decode a partial response, ignoring any fields not selected."""
+    if self.__message_type in _UNRECOGNIZED_FIELD_MAPPINGS:
+      return JsonToMessage(self.__message_type, encoded_message)
+    if not encoded_message.strip():
+      return self.__message_type()
+    try:
+      dictionary = json.loads(encoded_message)
+    except ValueError as e:
+      raise exceptions.InvalidDataFromServerError('Invalid JSON: %s' % e)
+    if not isinstance(dictionary, dict):
+      raise exceptions.InvalidDataFromServerError(
+          'Expected a JSON object, found %r' % type(dictionary))
+    message = self.__DecodeSelected(
+        self.__message_type, dictionary, self.__tree)
+    message.check_initialized()
+    return message
+
+  @classmethod
+  def __DecodeSelected(cls, message_type, dictionary, tree):
+    codec = _MessageCodec.ForType(message_type)
+    message = message_type()
+    for name, subtree in tree.iteritems():
+      value = dictionary.get(name)
+      if value is None or value == []:
+        continue
+      field = message_type.field_by_name(name)
+      if not isinstance(value, list):
+        value = [value]
+      decoded = [cls.__DecodeSelectedField(codec, field, item, subtree)
+                 for item in value]
+      if field.repeated:
+        setattr(message, name, decoded)
+      else:
+        setattr(message, name, decoded[-1])
+    return message
+
+  @classmethod
+  def __DecodeSelectedField(cls, codec, field, value, subtree):
+    decode = codec.FieldDecoder(field.name)
+    if (subtree is None or not isinstance(value, dict) or
+        not isinstance(field, messages.MessageField)):
+      return decode(value)
+    if field.type in _UNRECOGNIZED_FIELD_MAPPINGS:
+      return decode(dict(
+          (key, item) for key, item in value.iteritems() if key in subtree))
+    return cls.__DecodeSelected(field.type, value, subtree)
 
 
-# TODO(craigcitro): Do this directly, instead of via JSON.
 def DictToMessage(d, message_type):
   """Convert the given dictionary to a message of type message_type."""
-  return JsonToMessage(message_type, json.dumps(d))
+  message = _MessageCodec.ForType(message_type).Decode(d)
+  message.check_initialized()
+  return message
 
 
 def MessageToDict(message):
   """Convert the given message to a dictionary."""
-  return json.loads(MessageToJson(message))
+  message.check_initialized()
+  return _MessageCodec.ForType(type(message)).Encode(message)
+
+
+def _FindVariant(value):
+  """Find the messages.Variant to store an unrecognized value with."""
+  if isinstance(value, bool):
+    return messages.Variant.BOOL
+  elif isinstance(value, (int, long)):
+    return messages.Variant.INT64
+  elif isinstance(value, float):
+    return messages.Variant.DOUBLE
+  elif isinstance(value, basestring):
+    return messages.Variant.STRING
+  elif isinstance(value, (list, tuple)):
+    # Use the most general variant of any of the elements.
+    variants = [None, messages.Variant.INT64, messages.Variant.DOUBLE,
+                messages.Variant.STRING]
+    return variants[max([0] + [
+        variants.index(variant) for variant in map(_FindVariant, value)
+        if variant in variants])]
+  return None
+
+
+def _DecodeBytes(value):
+  try:
+    return base64.urlsafe_b64decode(str(value))
+  except TypeError:
+    pass
+  try:
+    return base64.b64decode(value)
+  except TypeError as e:
+    raise messages.DecodeError('Base64 decoding error: %s' % e)
+
+
+def _DecodeDateTime(value):
+  try:
+    return util.decode_datetime(value)
+  except ValueError as e:
+    raise messages.DecodeError(e)
+
+
+def _DecodeFloat(value):
+  if isinstance(value, (int, long, basestring)):
+    try:
+      return float(value)
+    except (OverflowError, ValueError):
+      pass
+  return value
 
 
-def _IncludeFields(encoded_message, message, include_fields):
-  """Add the requested fields to the encoded message."""
-  if include_fields is None:
-    return encoded_message
-  result = json.loads(encoded_message)
-  for field_name in include_fields:
+def _DecodeInteger(value):
+  if isinstance(value, basestring):
     try:
-      message.field_by_name(field_name)
-    except KeyError:
-      raise exceptions.InvalidDataError(
-          'No field named %s in message of type %s' % (
-              field_name, type(message)))
-    result[field_name] = None
-  return json.dumps(result)
+      return int(value)
+    except ValueError:
+      pass
+  return value
+
+
+def _EncodeDateTime(value):
+  return value.isoformat()
+
+
+def _CopyJsonValue(value):
+  """Copy a value from a dict, as a round trip through JSON would."""
+  if isinstance(value, (list, tuple)):
+    return [_CopyJsonValue(item) for item in value]
+  if isinstance(value, dict):
+    return dict((key if isinstance(key, basestring) else str(key),
+                 _CopyJsonValue(item)) for key, item in value.iteritems())
+  return value
+
+
+def _EncodeValue(value):
+  """Encode an unrecognized (or map) value, which carries no field."""
+  if isinstance(value, messages.Message):
+    return _MessageCodec.ForType(type(value)).Encode(value)
+  if isinstance(value, messages.Enum):
+    return str(value)
+  if isinstance(value, (list, tuple)):
+    return [_EncodeValue(item) for item in value]
+  return value
+
+
+class _MessageCodec(object):
+  """Converts one message type to and from dicts, as parsed from JSON.
+
+  The fields of the type are examined once, when its codec is first
+  needed, and each gets a converter to and from its JSON value (or
+  none, if the value is written as is). Codecs for nested message types
+  are compiled at the same time. Use ForType to get the codec for a
+  type, rather than creating one.
+  """
+
+  __codecs = {}
+  __compiling = {}
+  __lock = threading.RLock()
+
+  def __init__(self, message_type):
+    self.__message_type = message_type
+    self.__encoders = {}
+    self.__decoders = {}
+    self.__pairs = None
+
+  @classmethod
+  def ForType(cls, message_type):
+    """Return the codec for message_type, compiling it if needed."""
+    codec = cls.__codecs.get(message_type)
+    if codec is not None:
+      return codec
+    with cls.__lock:
+      codec = (cls.__codecs.get(message_type) or
+               cls.__compiling.get(message_type))
+      if codec is not None:
+        return codec
+      # Codecs are published only once every codec they refer to is
+      # compiled. Until then, a recursive type finds itself here.
+      outermost = not cls.__compiling
+      codec = cls.__compiling[message_type] = cls(message_type)
+      try:
+        codec.__Compile()
+        if outermost:
+          cls.__codecs.update(cls.__compiling)
+      finally:
+        if outermost:
+          cls.__compiling.clear()
+    return codec
+
+  def __Compile(self):
+    pairs_field = _UNRECOGNIZED_FIELD_MAPPINGS.get(self.__message_type)
+    for field in self.__message_type.all_fields():
+      codec = None
+      if isinstance(field, messages.BytesField):
+        encode, decode = base64.urlsafe_b64encode, _DecodeBytes
+      elif isinstance(field, messages.EnumField):
+        encode, decode = str, self.__EnumDecoder(field.type)
+      elif isinstance(field, message_types.DateTimeField):
+        encode, decode = _EncodeDateTime, _DecodeDateTime
+      elif (isinstance(field, messages.MessageField) and
+            issubclass(field.type, messages.Message)):
+        codec = self.ForType(field.type)
+        encode, decode = codec.Encode, codec.Decode
+      elif isinstance(field, messages.FloatField):
+        encode, decode = None, _DecodeFloat
+      elif isinstance(field, messages.IntegerField):
+        encode, decode = None, _DecodeInteger
+      else:
+        encode, decode = None, None
+      self.__decoders[field.name] = (field.name, field.repeated, decode)
+      if field.name == pairs_field:
+        if codec is None:
+          raise exceptions.InvalidUserInputError(
+              'Unrecognized fields must be mapped to a compound '
+              'message type.')
+        self.__pairs = (field.name, field.type)
+      else:
+        self.__encoders[field.name] = (field.repeated, encode, codec)
+
+  @staticmethod
+  def __EnumDecoder(enum_type):
+    def DecodeEnum(value):
+      try:
+        return enum_type(value)
+      except TypeError:
+        raise messages.DecodeError('Invalid enum value "%s"' % value)
+    return DecodeEnum
+
+  def FieldDecoder(self, field_name):
+    """Return a function decoding one JSON item of the given field."""
+    _, _, decode = self.__decoders[field_name]
+    return decode or (lambda value: value)
+
+  def Decode(self, dictionary):
+    """Decode dictionary (as parsed from JSON) into a message."""
+    message = self.__message_type()
+    decoders = self.__decoders
+    for key, value in dictionary.iteritems():
+      if not isinstance(key, basestring):
+        # JSON object keys are always strings.
+        key = str(key)
+      if value is None:
+        try:
+          message.reset(key)
+        except AttributeError:
+          pass  # This is an unrecognized field, skip it.
+        continue
+      entry = decoders.get(key)
+      if entry is None:
+        variant = _FindVariant(value)
+        if variant:
+          if key.isdigit():
+            key = int(key)
+          message.set_unrecognized_field(
+              key, _CopyJsonValue(value), variant)
+        else:
+          logging.warning('No variant found for unrecognized field: %s', key)
+        continue
+      name, repeated, decode = entry
+      if isinstance(value, (list, tuple)):
+        if not value:
+          continue
+        if decode is not None:
+          value = [decode(item) for item in value]
+        setattr(message, name, value if repeated else value[-1])
+      elif repeated:
+        setattr(message, name, [value if decode is None else decode(value)])
+      else:
+        setattr(message, name, value if decode is None else decode(value))
+    if self.__pairs is not None:
+      self.__MapUnrecognizedFields(message)
+    return message
+
+  def __MapUnrecognizedFields(self, message):
+    name, pair_type = self.__pairs
+    pairs = []
+    for key in message.all_unrecognized_fields():
+      value, _ = message.get_unrecognized_field_info(key)
+      pairs.append(pair_type(key=str(key), value=value))
+    setattr(message, name, pairs)
+    setattr(message, '_Message__unrecognized_fields', {})
+
+  def Encode(self, message, nulls=None):
+    """Encode message as a dictionary, as it would be encoded in JSON.
+
+    Args:
+      message: the message to encode.
+      nulls: (dict, default: None) a tree from _IncludeFieldsTree of
+          fields to write as null.
+
+    Returns:
+      The encoded dictionary.
+    """
+    result = {}
+    for name, (repeated, encode, _) in self.__encoders.iteritems():
+      value = message.get_assigned_value(name)
+      if value is None:
+        continue
+      if repeated:
+        if not value:
+          continue
+        if encode is None:
+          result[name] = list(value)
+        else:
+          result[name] = [encode(item) for item in value]
+      elif encode is None:
+        result[name] = value
+      else:
+        result[name] = encode(value)
+    for key in message.all_unrecognized_fields():
+      value, _ = message.get_unrecognized_field_info(key)
+      if not isinstance(key, basestring):
+        key = str(key)
+      result[key] = _EncodeValue(value)
+    if self.__pairs is not None:
+      # The pairs are written as members directly, rather than copying
+      # the message to remap them.
+      name, _ = self.__pairs
+      for pair in message.get_assigned_value(name) or ():
+        result[pair.key] = _EncodeValue(pair.value)
+    if nulls:
+      self.__EncodeNulls(message, nulls, result)
+    return result
+
+  def __EncodeNulls(self, message, nulls, result):
+    for name, subtree in nulls.iteritems():
+      if subtree is None:
+        result[name] = None
+        continue
+      _, _, codec = self.__encoders[name]
+      value = message.get_assigned_value(name)
+      if value is None:
+        # An unset message is written with just its nulls.
+        value = self.__message_type.field_by_name(name).type()
+      result[name] = codec.Encode(value, nulls=subtree)
+
+
+def _IncludeFieldsTree(message_type, include_fields):
+  """Parse include_fields into a tree of the fields to write as null.
+
+  Args:
+    message_type: the type of the message being encoded.
+    include_fields: (list of str) field names or dotted paths.
+
+  Returns:
+    A dict mapping each field name either to None, if the field is
+    written as null, or to the tree for the fields of its message.
+
+  Raises:
+    InvalidDataError: if a path does not name a field, or passes
+        through a field that is not a single message.
+  """
+  tree = {}
+  for path in include_fields:
+    node = tree
+    node_type = message_type
+    names = path.split('.')
+    for i, name in enumerate(names):
+      try:
+        field = node_type.field_by_name(name)
+      except KeyError:
+        raise exceptions.InvalidDataError(
+            'No field named %s in message of type %s' % (
+                path, message_type))
+      if i == len(names) - 1:
+        # A null for the whole field replaces any nulls inside it.
+        node[name] = None
+        break
+      if (field.repeated or
+          not isinstance(field, messages.MessageField) or
+          not issubclass(field.type, messages.Message)):
+        raise exceptions.InvalidDataError(
+            'Cannot include %s: field %s of %s is not a single message' % (
+                path, name, node_type.__name__))
+      if name in node and node[name] is None:
+        break
+      node = node.setdefault(name, {})
+      node_type = field.type
+  return tree
 
 
 class _ProtoJsonApilib(protojson.ProtoJson):
@@ -92,8 +757,7 @@ class _ProtoJsonApilib(protojson.ProtoJson):
     return field_value
 
   def encode_message(self, message):  # pylint: disable=invalid-name
-    message = _EncodeUnknownFields(message)
-    return super(_ProtoJsonApilib, self).encode_message(message)
+    return MessageToJson(message)
 
   def encode_field(self, field, value):
     """Encode the given value as JSON."""
@@ -106,8 +770,14 @@ class _ProtoJsonApilib(protojson.ProtoJson):
             return base64.urlsafe_b64encode(value)
       except TypeError:
         pass
-    if isinstance(field, messages.MessageField):
-      value = _EncodeUnknownFields(value)
+    if (isinstance(field, messages.MessageField) and
+        issubclass(field.type, messages.Message)):
+      # The codec writes mapped pairs as members directly, so the
+      # message is never copied to remap them.
+      codec = _MessageCodec.ForType(field.type)
+      if field.repeated:
+        return [codec.Encode(item) for item in value]
+      return codec.Encode(value)
     return super(_ProtoJsonApilib, self).encode_field(field, value)
 
 
@@ -146,25 +816,6 @@ def _DecodeUnknownFields(message):
   return message
 
 
-def _EncodeUnknownFields(message):
-  """Remap unknown fields in message out of message.source."""
-  source = _UNRECOGNIZED_FIELD_MAPPINGS.get(type(message))
-  if source is None:
-    return message
-  result = CopyProtoMessage(message)
-  pairs_field = message.field_by_name(source)
-  if not isinstance(pairs_field, messages.MessageField):
-    raise exceptions.InvalidUserInputError(
-        'Invalid pairs field %s' % pairs_field)
-  pairs_type = pairs_field.message_type
-  value_variant = pairs_type.field_by_name('value').variant
-  pairs = getattr(message, source)
-  for pair in pairs:
-    result.set_unrecognized_field(pair.key, pair.value, value_variant)
-  setattr(result, source, [])
-  return result
-
-
 def MapUnrecognizedFields(field_name):
   """Register field_name as a container for unrecognized fields in message."""
   def Register(cls):
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+"""Tests for encoding."""
+
+import datetime
+import json
+import StringIO
+import unittest
+
+from protorpc import message_types
+from protorpc import messages
+
+from apitools.base.py import encoding
+from apitools.base.py import exceptions
+from apitools.base.py.testing import fake_messages
+
+
+class _Stamped(messages.Message):
+  when = message_types.DateTimeField(1)
+  labels = messages.MessageField(fake_messages.Labels, 2, repeated=True)
+  ratio = messages.FloatField(3)
+  things = messages.MessageField(fake_messages.Thing, 4, repeated=True)
+
+
+class _Node(messages.Message):
+  name = messages.StringField(1)
+  children = messages.MessageField('_Node', 2, repeated=True)
+
+
+def _ViaJson(message_type, d):
+  """Decode d as the JSON path does, through the protojson codec."""
+  # pylint: disable=protected-access
+  return encoding._ProtoJsonApilib.Get().decode_message(
+      message_type, json.dumps(d))
+
+
+def _UnrecognizedFields(message):
+  """Return the unrecognized fields of message and its nested messages."""
+  result = {}
+  for key in message.all_unrecognized_fields():
+    result[key] = message.get_unrecognized_field_info(key)
+  for field in message.all_fields():
+    if isinstance(field, messages.MessageField):
+      values = message.get_assigned_value(field.name)
+      if not field.repeated:
+        values = [values]
+      for i, value in enumerate(values or ()):
+        if isinstance(value, messages.Message):
+          for key, info in _UnrecognizedFields(value).iteritems():
+            result['%s[%d].%s' % (field.name, i, key)] = info
+  return result
+
+
+class CopyProtoMessageTest(unittest.TestCase):
+
+  def __Thing(self):
+    thing = fake_messages.Thing(
+        id='t', color=fake_messages.Thing.ColorValueValuesEnum.BLUE,
+        data='\x00\xff', size=7, tags=['a', 'b'],
+        labels=fake_messages.Labels(additionalProperties=[
+            fake_messages.Labels.AdditionalProperty(key='k', value='v')]))
+    thing.set_unrecognized_field('ratio', 1.5, messages.Variant.DOUBLE)
+    thing.set_unrecognized_field(
+        'grid', [[1], [2]], messages.Variant.MESSAGE)
+    thing.set_unrecognized_field(
+        'nested', {'a': [1, 2]}, messages.Variant.MESSAGE)
+    return thing
+
+  def testCopyIsEqual(self):
+    thing = self.__Thing()
+    copy = encoding.CopyProtoMessage(thing)
+    self.assertIsNot(thing, copy)
+    self.assertEqual(thing, copy)
+    self.assertEqual(_UnrecognizedFields(thing), _UnrecognizedFields(copy))
+    self.assertEqual(fake_messages.Thing.ColorValueValuesEnum.BLUE,
+                     copy.color)
+    self.assertEqual('\x00\xff', copy.data)
+
+  def testUnsetFieldsStayUnset(self):
+    copy = encoding.CopyProtoMessage(fake_messages.Thing(id='t'))
+    self.assertIsNone(copy.get_assigned_value('labels'))
+    self.assertEqual([], copy.tags)
+    self.assertEqual('{"id": "t"}', encoding.MessageToJson(copy))
+
+  def testNestedAndRepeatedMessages(self):
+    stamped = _Stamped(
+        when=datetime.datetime(2020, 1, 2, 3, 4, 5), ratio=0.5,
+        things=[fake_messages.Thing(id='a'), fake_messages.Thing(id='b')])
+    node = _Node(name='root', children=[
+        _Node(name='a', children=[_Node(name='b')])])
+    for message in (stamped, node):
+      self.assertEqual(message, encoding.CopyProtoMessage(message))
+
+  def testCopyIsIndependent(self):
+    thing = self.__Thing()
+    copy = encoding.CopyProtoMessage(thing)
+    copy.tags.append('c')
+    copy.labels.additionalProperties[0].value = 'changed'
+    copy.labels.additionalProperties.append(
+        fake_messages.Labels.AdditionalProperty(key='x', value='y'))
+    copy.get_unrecognized_field_info('grid')[0][0].append(3)
+    copy.get_unrecognized_field_info('nested')[0]['a'].append(3)
+    self.assertEqual(['a', 'b'], thing.tags)
+    self.assertEqual(
+        [fake_messages.Labels.AdditionalProperty(key='k', value='v')],
+        thing.labels.additionalProperties)
+    self.assertEqual(_UnrecognizedFields(self.__Thing()),
+                     _UnrecognizedFields(thing))
+
+  def testRepeatedNestedMessagesAreIndependent(self):
+    node = _Node(name='root', children=[_Node(name='a')])
+    copy = encoding.CopyProtoMessage(node)
+    copy.children[0].name = 'b'
+    copy.children[0].children.append(_Node(name='c'))
+    self.assertEqual(_Node(name='root', children=[_Node(name='a')]), node)
+
+
+class DictToMessageTest(unittest.TestCase):
+
+  def assertMatchesJsonPath(self, message_type, d):
+    expected = _ViaJson(message_type, d)
+    actual = encoding.DictToMessage(d, message_type)
+    self.assertEqual(expected, actual)
+    self.assertEqual(_UnrecognizedFields(expected),
+                     _UnrecognizedFields(actual))
+    return actual
+
+  def testParityWithJsonPath(self):
+    cases = [
+        (fake_messages.Thing, {}),
+        (fake_messages.Thing, {
+            'id': 'a', 'color': 'BLUE', 'size': '7', 'data': 'aGk=',
+            'tags': ['x', 'y'], 'labels': {'k': 'v', '3': 'w'}}),
+        (fake_messages.Thing, {'id': None, 'tags': [], 'color': None}),
+        (fake_messages.Thing, {
+            'extra': 3, 'ratio': 1.5, 'flag': True, '12': 'twelve',
+            'nested': {'dropped': 1}, 'mixed': [1, 2.5], 'grid': [[1], [2]]}),
+        (fake_messages.Thing, {'labels': {1: 'x', 'a': 'b'}}),
+        (fake_messages.Thing, {7: 'seven', 'tags': ('a', 'b')}),
+        (fake_messages.Thing, {'size': [1, 2]}),
+        (fake_messages.Labels, {'a': 'b', '1': 'c'}),
+        (_Stamped, {
+            'when': '2020-01-02T03:04:05', 'ratio': 2,
+            'labels': [{'a': 'b'}, {}], 'things': ({'id': 't'},)}),
+        (_Node, {'name': 'a', 'children': [
+            {'name': 'b', 'children': [{'name': 'c', 'x': [1]}]}]}),
+    ]
+    for message_type, d in cases:
+      self.assertMatchesJsonPath(message_type, d)
+
+  def testIntegerKeyInMap(self):
+    thing = self.assertMatchesJsonPath(
+        fake_messages.Thing, {'labels': {1: 'x'}})
+    self.assertEqual([fake_messages.Labels.AdditionalProperty(
+        key='1', value='x')], thing.labels.additionalProperties)
+
+  def testTupleForRepeatedField(self):
+    thing = self.assertMatchesJsonPath(
+        fake_messages.Thing, {'tags': ('a', 'b')})
+    self.assertEqual(['a', 'b'], thing.tags)
+
+  def testUnrecognizedValuesAreCopied(self):
+    src = {'extra': [1, [2, 3]], 'more': (4, 5)}
+    thing = encoding.DictToMessage(src, fake_messages.Thing)
+    src['extra'].append(9)
+    src['extra'][1].append(9)
+    self.assertEqual(([1, [2, 3]], messages.Variant.INT64),
+                     thing.get_unrecognized_field_info('extra'))
+    self.assertEqual(([4, 5], messages.Variant.INT64),
+                     thing.get_unrecognized_field_info('more'))
+
+  def testRequiredFields(self):
+    self.assertRaises(messages.ValidationError, encoding.DictToMessage,
+                      {}, fake_messages.FakeThingsGetRequest)
+
+
+class MessageToDictTest(unittest.TestCase):
+
+  def assertMatchesJsonPath(self, message):
+    # pylint: disable=protected-access
+    expected = json.loads(
+        encoding._ProtoJsonApilib.Get().encode_message(message))
+    actual = encoding.MessageToDict(message)
+    self.assertEqual(expected, actual)
+    self.assertEqual(json.dumps(expected, sort_keys=True),
+                     json.dumps(actual, sort_keys=True))
+    return actual
+
+  def testParityWithJsonPath(self):
+    labels = encoding.DictToMessage({'k': 'v', '3': 'w'}, fake_messages.Labels)
+    thing = fake_messages.Thing(
+        id='a', color=fake_messages.Thing.ColorValueValuesEnum.RED,
+        data='\xff\x00', size=3, tags=['x'], labels=labels)
+    thing.set_unrecognized_field('extra', [1, 2.5], messages.Variant.DOUBLE)
+    cases = [
+        fake_messages.Thing(),
+        thing,
+        labels,
+        _Stamped(when=datetime.datetime(2020, 1, 2, 3, 4, 5), ratio=0.5,
+                 labels=[labels, fake_messages.Labels()], things=[thing]),
+        _Node(name='a', children=[_Node(name='b', children=[_Node()])]),
+    ]
+    for message in cases:
+      self.assertMatchesJsonPath(message)
+
+  def testNumericUnrecognizedKeys(self):
+    thing = encoding.DictToMessage({'7': 1}, fake_messages.Thing)
+    self.assertEqual([7], thing.all_unrecognized_fields())
+    self.assertEqual({'7': 1}, self.assertMatchesJsonPath(thing))
+    self.assertEqual(['7'], encoding.MessageToDict(thing).keys())
+    self.assertIsInstance(encoding.MessageToDict(thing).keys()[0], basestring)
+
+  def testResultIsIndependent(self):
+    thing = fake_messages.Thing(tags=['a'])
+    result = encoding.MessageToDict(thing)
+    result['tags'].append('b')
+    self.assertEqual(['a'], thing.tags)
+
+  def testMapIsNotModified(self):
+    labels = fake_messages.Labels(additionalProperties=[
+        fake_messages.Labels.AdditionalProperty(key='k', value='v')])
+    self.assertEqual({'k': 'v'}, encoding.MessageToDict(labels))
+    self.assertEqual([], labels.all_unrecognized_fields())
+    self.assertEqual(1, len(labels.additionalProperties))
+
+
+class _ChunkedFile(object):
+  """A file whose reads return at most chunk_size bytes."""
+
+  def __init__(self, content, chunk_size):
+    self.__file = StringIO.StringIO(content)
+    self.__chunk_size = chunk_size
+
+  def read(self, size=-1):  # pylint: disable=invalid-name
+    if size < 0 or size > self.__chunk_size:
+      size = self.__chunk_size
+    return self.__file.read(size)
+
+
+class JsonItemStreamTest(unittest.TestCase):
+
+  _ITEMS = [
+      {'id': 'a]"}{,', 'size': '123456789', 'tags': ['[', ']']},
+      {'id': u'\u00e9\\', 'labels': {'k': '{"v": [1]}'}},
+      {'color': 'BLUE', 'data': 'aGk='},
+      ]
+
+  def __Decode(self, source, field_name='items'):
+    stream = encoding.JsonItemStream(
+        fake_messages.ThingList, field_name, source)
+    return list(stream), stream.envelope
+
+  def __Expected(self, items):
+    return [encoding.DictToMessage(item, fake_messages.Thing)
+            for item in items]
+
+  def testChunkSizesAndKeyOrders(self):
+    expected = self.__Expected(self._ITEMS)
+    for content in [
+        json.dumps({'items': self._ITEMS, 'nextPageToken': 'n]"'}),
+        '{"nextPageToken": "n]\\"", "items": %s}' % json.dumps(self._ITEMS),
+        json.dumps({'items': self._ITEMS, 'nextPageToken': 'n]"'},
+                   indent=2),
+        ]:
+      for chunk_size in range(1, 65):
+        items, envelope = self.__Decode(_ChunkedFile(content, chunk_size))
+        self.assertEqual(expected, items)
+        self.assertEqual(
+            fake_messages.ThingList(nextPageToken='n]"'), envelope)
+      self.assertEqual((expected, fake_messages.ThingList(
+          nextPageToken='n]"')), self.__Decode(content))
+
+  def testNumberAtChunkBoundary(self):
+    content = '{"items": [{"size": 1234567}, {"size": 8}]}'
+    for chunk_size in range(1, len(content) + 1):
+      items, _ = self.__Decode(_ChunkedFile(content, chunk_size))
+      self.assertEqual([1234567, 8], [item.size for item in items])
+
+  def testEmptyResponses(self):
+    for content in ['', '  \n', '{}', '{"items": []}', '{"items": null}']:
+      items, envelope = self.__Decode(content)
+      self.assertEqual([], items)
+      self.assertEqual(
+          encoding.JsonToMessage(fake_messages.ThingList, content), envelope)
+
+  def testNullItemsSkipped(self):
+    items, _ = self.__Decode('{"items": [null, {"id": "a"}, null]}')
+    self.assertEqual([fake_messages.Thing(id='a')], items)
+
+  def testTruncatedInput(self):
+    content = json.dumps({'items': self._ITEMS, 'nextPageToken': 'n'})
+    for end in range(1, len(content)):
+      for source in [content[:end], _ChunkedFile(content[:end], 7)]:
+        self.assertRaises(exceptions.InvalidDataFromServerError,
+                          self.__Decode, source)
+
+  def testInvalidInput(self):
+    for content in ['[]', '{"items": [1]}', '{"items": [{}] "a": 1}',
+                    '{"items": []} x', '{"items": [}']:
+      self.assertRaises(exceptions.InvalidDataFromServerError,
+                        self.__Decode, content)
+
+  def testBadItemInStream(self):
+    for bad_item in ['{"size": "abc"}', '{"color": "GREEN"}',
+                     '{"tags": {"a": 1}}']:
+      stream = encoding.JsonItemStream(
+          fake_messages.ThingList, 'items',
+          '{"items": [{"id": "a"}, %s, {"id": "b"}]}' % bad_item)
+      items = iter(stream)
+      self.assertEqual(fake_messages.Thing(id='a'), next(items))
+      self.assertRaises(exceptions.InvalidDataFromServerError, next, items)
+
+  def testBadEnvelope(self):
+    self.assertRaises(exceptions.InvalidDataFromServerError, self.__Decode,
+                      '{"items": [], "nextPageToken": 5}')
+
+  def testInvalidField(self):
+    self.assertRaises(exceptions.InvalidUserInputError, self.__Decode,
+                      '{}', field_name='missing')
+    self.assertRaises(exceptions.InvalidUserInputError, self.__Decode,
+                      '{}', field_name='nextPageToken')
+
+  def testEnvelopeAndIteration(self):
+    stream = encoding.JsonItemStream(
+        fake_messages.ThingList, 'items', '{"items": [{"id": "a"}]}')
+    self.assertRaises(exceptions.InvalidUserInputError,
+                      getattr, stream, 'envelope')
+    items = iter(stream)
+    self.assertEqual(fake_messages.Thing(id='a'), next(items))
+    self.assertRaises(exceptions.InvalidUserInputError,
+                      getattr, stream, 'envelope')
+    self.assertRaises(StopIteration, next, items)
+    self.assertEqual(fake_messages.ThingList(), stream.envelope)
+    self.assertRaises(exceptions.InvalidUserInputError, iter, stream)
+
+
+class MessageToJsonTest(unittest.TestCase):
+
+  def testRoundTrip(self):
+    thing = fake_messages.Thing(
+        id='a', color=fake_messages.Thing.ColorValueValuesEnum.BLUE,
+        data='\xff\x00', tags=['x'], labels=encoding.DictToMessage(
+            {'k': 'v'}, fake_messages.Labels))
+    self.assertEqual(thing, encoding.JsonToMessage(
+        fake_messages.Thing, encoding.MessageToJson(thing)))
+
+  def testIncludeFields(self):
+    thing = fake_messages.Thing(id='a')
+    self.assertEqual(
+        {'id': 'a', 'size': None, 'labels': {'additionalProperties': None}},
+        json.loads(encoding.MessageToJson(thing, include_fields=[
+            'size', 'labels.additionalProperties'])))
+    self.assertRaises(exceptions.InvalidDataError, encoding.MessageToJson,
+                      thing, include_fields=['missing'])
+    self.assertRaises(exceptions.InvalidDataError, encoding.MessageToJson,
+                      thing, include_fields=['id.length'])
+
+  def testEmptyJson(self):
+    self.assertEqual(fake_messages.Thing(),
+                     encoding.JsonToMessage(fake_messages.Thing, ' '))
+
+
+class FieldMaskTest(unittest.TestCase):
+
+  def __Selector(self, field_paths, message_type=fake_messages.ThingList):
+    return encoding.FieldMask(message_type, field_paths).selector
+
+  def testSelector(self):
+    self.assertEqual('nextPageToken', self.__Selector('nextPageToken'))
+    self.assertEqual('items/id,nextPageToken',
+                     self.__Selector(['nextPageToken', 'items.id']))
+    self.assertEqual('items(id,size),nextPageToken', self.__Selector(
+        ['items.id', 'items.size', 'nextPageToken']))
+    self.assertEqual('items(id,labels/k1)', self.__Selector(
+        ['items.labels.k1', 'items.id']))
+
+  def testShorterPathSelectsSubtree(self):
+    self.assertEqual('items', self.__Selector(['items.id', 'items']))
+    self.assertEqual('items', self.__Selector(['items', 'items.id']))
+    self.assertEqual('items/labels', self.__Selector(
+        ['items.labels', 'items.labels.k1']))
+
+  def testMapKeysNotChecked(self):
+    self.assertEqual('any(key,other)', self.__Selector(
+        ['any.key', 'any.other'], message_type=fake_messages.Labels))
+
+  def testInvalidPaths(self):
+    for field_paths in [[], 'missing', ['items.missing'], ['items.id.x'],
+                        ['nextPageToken.x']]:
+      self.assertRaises(exceptions.InvalidUserInputError,
+                        encoding.FieldMask, fake_messages.ThingList,
+                        field_paths)
+
+  def testProperties(self):
+    mask = encoding.FieldMask(fake_messages.ThingList, ['items.id'])
+    self.assertIs(fake_messages.ThingList, mask.message_type)
+    self.assertEqual('items/id', mask.selector)
+
+  def testJsonToMessageKeepsSelectedFields(self):
+    mask = encoding.FieldMask(
+        fake_messages.ThingList,
+        ['items.id', 'items.labels.k1', 'nextPageToken'])
+    content = json.dumps({
+        'items': [{'id': 'a', 'size': '1', 'labels': {'k1': 'v1', 'k2': 'v2'}},
+                  {'id': 'b', 'tags': ['t']}],
+        'nextPageToken': 'n', 'extra': 1})
+    self.assertEqual(encoding.DictToMessage({
+        'items': [{'id': 'a', 'labels': {'k1': 'v1'}}, {'id': 'b'}],
+        'nextPageToken': 'n'}, fake_messages.ThingList),
+                     mask.JsonToMessage(content))
+
+  def testJsonToMessageDecodesSelectedSubtree(self):
+    mask = encoding.FieldMask(fake_messages.ThingList, ['items'])
+    content = json.dumps({'items': [{'id': 'a', 'color': 'RED'}],
+                          'nextPageToken': 'n'})
+    self.assertEqual(
+        fake_messages.ThingList(items=[fake_messages.Thing(
+            id='a', color=fake_messages.Thing.ColorValueValuesEnum.RED)]),
+        mask.JsonToMessage(content))
+
+  def testJsonToMessageEmptyAndInvalid(self):
+    mask = encoding.FieldMask(fake_messages.ThingList, ['items.id'])
+    self.assertEqual(fake_messages.ThingList(), mask.JsonToMessage(' '))
+    self.assertEqual(fake_messages.ThingList(),
+                     mask.JsonToMessage('{"items": [], "other": 1}'))
+    for content in ['{', '[]', '"items"']:
+      self.assertRaises(exceptions.InvalidDataFromServerError,
+                        mask.JsonToMessage, content)
+
+  def testJsonToMessageForMap(self):
+    mask = encoding.FieldMask(fake_messages.Labels, ['k1'])
+    # A map at the top level is decoded whole.
+    self.assertEqual(
+        encoding.DictToMessage({'k1': 'v1', 'k2': 'v2'}, fake_messages.Labels),
+        mask.JsonToMessage('{"k1": "v1", "k2": "v2"}'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -76,3 +76,11 @@ class TransferError(CommunicationError):
 
 class TransferInvalidError(TransferError):
   """The given transfer is invalid."""
+
+
+class RateLimitExceededError(Error):
+  """A request was refused by a client-side rate limiter."""
+
+
+class CircuitOpenError(CommunicationError):
+  """A request was refused because the circuit to its host is open."""
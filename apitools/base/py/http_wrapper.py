@@ -0,0 +1,1048 @@
+#!/usr/bin/env python
+"""HTTP transport helpers for apitools clients."""
+
+import collections
+import contextlib
+import email.utils
+import gzip
+import hashlib
+import httplib
+import logging
+import os
+import random
+import StringIO
+import sys
+import tempfile
+import threading
+import time
+import urllib
+import urlparse
+
+import httplib2
+
+try:
+  import fcntl
+except ImportError:
+  # File-backed rate limiters are only available on POSIX systems.
+  fcntl = None
+
+from apitools.base.py import exceptions
+
+__all__ = [
+    'CircuitBreaker',
+    'CircuitBreakerGroup',
+    'FileCacheBackend',
+    'FileRateLimiter',
+    'HttpPool',
+    'HttpPoolStats',
+    'RateLimiter',
+    'RedirectCache',
+    'Request',
+    'RequestLogger',
+    'ResponseCache',
+    'ResponseCacheEntry',
+    'ResponseCacheStats',
+    'RetryBudget',
+    'RetryPolicy',
+    'SingleFlight',
+    ]
+
+# Longest URL we send with a GET; longer requests are sent as a POST
+# with an X-HTTP-Method-Override header (as apiclient does).
+MAX_URL_LENGTH = 2048
+
+# 308 doesn't have a name in httplib.
+PERMANENT_REDIRECT_STATUSES = frozenset((httplib.MOVED_PERMANENTLY, 308))
+
+# HTTP verbs which can safely be repeated.
+IDEMPOTENT_METHODS = frozenset(('DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT'))
+
+
+def EncodeQuery(query_params):
+  """Encode a dict of query parameters as a URL query string."""
+  items = []
+  for key, value in query_params.iteritems():
+    if not isinstance(value, (list, tuple)):
+      value = (value,)
+    for item in value:
+      if isinstance(item, unicode):
+        item = item.encode('utf_8')
+      items.append((key, item))
+  return urllib.urlencode(items)
+
+
+def GzipContent(content, compresslevel=6):
+  """Return content, compressed with gzip."""
+  buf = StringIO.StringIO()
+  with gzip.GzipFile(fileobj=buf, mode='wb',
+                     compresslevel=compresslevel) as gzip_file:
+    gzip_file.write(content)
+  return buf.getvalue()
+
+
+def _DecompressContent(response_info, content):
+  """Decompress a gzipped response, if the http object didn't."""
+  # httplib2 decompresses responses itself, and removes the
+  # content-encoding header when it does.
+  if response_info.get('content-encoding') != 'gzip' or not content:
+    return content
+  try:
+    content = gzip.GzipFile(fileobj=StringIO.StringIO(content)).read()
+  except (IOError, EOFError) as e:
+    raise exceptions.CommunicationError(
+        'Error decompressing gzip response: %s' % e)
+  del response_info['content-encoding']
+  response_info['content-length'] = str(len(content))
+  return content
+
+
+class Request(object):
+  """A single HTTP request, sent directly through an http object.
+
+  Request has the attributes and execute method of the apiclient
+  HttpRequest used by generated clients, without any of the
+  machinery for models and resumable uploads.
+  """
+
+  def __init__(self, http, postproc, uri, method='GET', body=None,
+               headers=None):
+    self.http = http
+    self.postproc = postproc
+    self.uri = uri
+    self.method = method
+    self.body = body
+    self.headers = headers or {}
+
+  def __WireRequest(self):
+    """Return the (uri, method, body, headers) to send for this request.
+
+    A GET with a URL longer than MAX_URL_LENGTH is sent as a POST with
+    its query in the body. The request itself keeps its GET method, so
+    it is still retried, cached and coalesced as a GET.
+    """
+    if len(self.uri) <= MAX_URL_LENGTH or self.method != 'GET':
+      return self.uri, self.method, self.body, self.headers
+    parsed = urlparse.urlsplit(self.uri)
+    uri = urlparse.urlunsplit(
+        (parsed.scheme, parsed.netloc, parsed.path, '', ''))
+    headers = dict(self.headers)
+    headers['x-http-method-override'] = 'GET'
+    headers['content-type'] = 'application/x-www-form-urlencoded'
+    return uri, 'POST', parsed.query, headers
+
+  def execute(self):  # pylint: disable=invalid-name
+    """Send this request, and decode the response with postproc.
+
+    Returns:
+      The result of postproc on a successful response.
+
+    Redirects are not followed, but raised as an HttpError like any
+    other status.
+
+    Raises:
+      exceptions.HttpError: the response status was not 2xx.
+    """
+    uri, method, body, headers = self.__WireRequest()
+    try:
+      response_info, content = self.http.request(
+          str(uri), method=str(method), body=body, headers=headers,
+          redirections=0)
+    except httplib2.RedirectLimit as e:
+      # Redirects are returned to the caller, which follows them itself
+      # (so that it can cache and limit them).
+      response_info, content = e.response, e.content
+    content = _DecompressContent(response_info, content)
+    if response_info.status >= 300:
+      raise exceptions.HttpError(response_info, content, uri=self.uri)
+    return self.postproc(response_info, content)
+
+
+class HttpPoolStats(collections.namedtuple(
+    'HttpPoolStats', ['hits', 'misses', 'size', 'idle'])):
+  """Usage counters for an HttpPool.
+
+  Fields:
+    hits: number of requests that reused an idle connection.
+    misses: number of requests that had to create a new connection.
+    size: number of connections created by the pool.
+    idle: number of connections currently waiting to be reused.
+  """
+  __slots__ = ()
+
+
+class HttpPool(object):
+  """A bounded pool of httplib2.Http objects, safe to share across threads.
+
+  httplib2.Http is not thread-safe, so HttpPool checks out a separate
+  Http object (along with its keep-alive connections) for each
+  in-flight request, and returns it to the pool when the request
+  completes. All pooled objects share the same credentials.
+
+  HttpPool provides the request method of httplib2.Http, so it can be
+  used anywhere an Http object is expected.
+  """
+
+  def __init__(self, max_size=10, credentials=None, http_factory=None):
+    if max_size < 1:
+      raise exceptions.ConfigurationValueError(
+          'Invalid HttpPool size: %s' % max_size)
+    self.__max_size = max_size
+    self.__credentials = credentials
+    self.__http_factory = http_factory or httplib2.Http
+    self.__idle = []
+    self.__size = 0
+    self.__hits = 0
+    self.__misses = 0
+    self.__lock = threading.Lock()
+    # Bounds the number of connections checked out at once.
+    self.__available = threading.BoundedSemaphore(max_size)
+
+  @property
+  def max_size(self):
+    return self.__max_size
+
+  @property
+  def credentials(self):
+    return self.__credentials
+
+  @property
+  def stats(self):
+    with self.__lock:
+      return HttpPoolStats(hits=self.__hits, misses=self.__misses,
+                           size=self.__size, idle=len(self.__idle))
+
+  def __NewHttp(self):
+    http = self.__http_factory()
+    if self.__credentials is not None:
+      http = self.__credentials.authorize(http)
+    return http
+
+  def __Checkout(self):
+    self.__available.acquire()
+    with self.__lock:
+      if self.__idle:
+        self.__hits += 1
+        # Reuse the most recently returned connection, which is the
+        # most likely to still be open.
+        return self.__idle.pop()
+      self.__misses += 1
+    try:
+      http = self.__NewHttp()
+    except Exception:
+      self.__available.release()
+      raise
+    with self.__lock:
+      self.__size += 1
+    return http
+
+  def __Checkin(self, http):
+    with self.__lock:
+      self.__idle.append(http)
+    self.__available.release()
+
+  @contextlib.contextmanager
+  def Connection(self):
+    """Check out an Http object for the duration of the with block."""
+    http = self.__Checkout()
+    try:
+      yield http
+    finally:
+      self.__Checkin(http)
+
+  def request(self, *args, **kwds):  # pylint: disable=invalid-name
+    """Make a request with a pooled Http object; see httplib2.Http."""
+    with self.Connection() as http:
+      return http.request(*args, **kwds)
+
+
+class RetryBudget(object):
+  """A token bucket that limits retries across many calls.
+
+  Each failed attempt withdraws a token, and each successful call
+  deposits token_ratio tokens. Retries are only allowed while more
+  than half of max_tokens remain, so a backend that is failing most
+  requests sees at most a small fraction of extra retry traffic.
+  """
+
+  def __init__(self, max_tokens=100, token_ratio=0.1):
+    self.__max_tokens = float(max_tokens)
+    self.__token_ratio = token_ratio
+    self.__tokens = self.__max_tokens
+    self.__lock = threading.Lock()
+
+  @property
+  def tokens(self):
+    return self.__tokens
+
+  def RecordSuccess(self):
+    with self.__lock:
+      self.__tokens = min(self.__max_tokens,
+                          self.__tokens + self.__token_ratio)
+
+  def RecordFailure(self):
+    """Record a failed attempt, and return whether a retry is allowed."""
+    with self.__lock:
+      self.__tokens = max(0.0, self.__tokens - 1)
+      return self.__tokens > self.__max_tokens / 2
+
+
+class RetryPolicy(object):
+  """Decides whether, and after how long, to retry a failed request.
+
+  Delays grow exponentially from initial_delay by multiplier up to
+  max_delay, with up to jitter (as a fraction of the delay) removed
+  at random. A Retry-After header from the server takes precedence
+  over the computed delay, but is also limited to max_delay.
+
+  Idempotent requests (by HTTP verb) are retried on any status in
+  retryable_statuses and on connection errors. Other requests are
+  only retried on statuses in non_idempotent_statuses, which indicate
+  that the server did not process the request.
+  """
+
+  def __init__(self, max_retries=5, initial_delay=1.0, max_delay=60.0,
+               multiplier=2.0, jitter=0.5,
+               retryable_statuses=(429, 500, 502, 503, 504),
+               non_idempotent_statuses=(429,), budget=None,
+               sleep=time.sleep):
+    self.__max_retries = max_retries
+    self.__initial_delay = initial_delay
+    self.__max_delay = max_delay
+    self.__multiplier = multiplier
+    self.__jitter = jitter
+    self.__retryable_statuses = frozenset(retryable_statuses)
+    self.__non_idempotent_statuses = frozenset(non_idempotent_statuses)
+    self.__budget = budget
+    self.__sleep = sleep
+
+  @property
+  def max_retries(self):
+    return self.__max_retries
+
+  @property
+  def budget(self):
+    return self.__budget
+
+  def ShouldRetry(self, http_method, status, attempts):
+    """Determine whether to retry a failed attempt.
+
+    Args:
+      http_method: (str) HTTP verb of the request.
+      status: (int) HTTP status of the response, or None if the
+          attempt failed with a connection error.
+      attempts: (int) number of attempts made so far.
+
+    Returns:
+      True iff the request should be retried.
+    """
+    if http_method.upper() in IDEMPOTENT_METHODS:
+      retryable = status is None or status in self.__retryable_statuses
+    else:
+      retryable = status in self.__non_idempotent_statuses
+    if not retryable or attempts > self.__max_retries:
+      return False
+    if self.__budget is not None and not self.__budget.RecordFailure():
+      logging.warning('Retry budget exhausted, not retrying')
+      return False
+    return True
+
+  def RecordSuccess(self):
+    if self.__budget is not None:
+      self.__budget.RecordSuccess()
+
+  def ComputeDelay(self, attempts, retry_after=None):
+    """Return the number of seconds to wait before the next attempt."""
+    server_delay = _ParseRetryAfter(retry_after)
+    if server_delay is not None:
+      return min(self.__max_delay, server_delay)
+    delay = min(self.__max_delay,
+                self.__initial_delay * self.__multiplier ** (attempts - 1))
+    return delay * (1 - self.__jitter * random.random())
+
+  def Backoff(self, attempts, retry_after=None):
+    """Sleep before the next attempt."""
+    delay = self.ComputeDelay(attempts, retry_after=retry_after)
+    logging.info('Retrying in %.2f seconds (attempt %d)', delay, attempts)
+    self.__sleep(delay)
+
+
+def _ParseRetryAfter(retry_after):
+  """Convert a Retry-After header value to seconds, or None."""
+  if not retry_after:
+    return None
+  try:
+    return max(0, int(retry_after))
+  except ValueError:
+    pass
+  parsed = email.utils.parsedate_tz(retry_after)
+  if parsed is None:
+    return None
+  return max(0, email.utils.mktime_tz(parsed) - time.time())
+
+
+class RedirectCache(object):
+  """An LRU cache of permanent redirect targets.
+
+  When a URL answers with a permanent redirect (301 or 308), later
+  requests for that URL can be sent straight to the target instead
+  of repeating the redirect round trip. The least recently used
+  entries are evicted beyond max_size.
+  """
+
+  def __init__(self, max_size=100):
+    self.__max_size = max_size
+    self.__targets = collections.OrderedDict()
+    self.__lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.__targets)
+
+  def Add(self, url, target):
+    with self.__lock:
+      self.__targets.pop(url, None)
+      self.__targets[url] = target
+      while len(self.__targets) > self.__max_size:
+        self.__targets.popitem(last=False)
+
+  def Lookup(self, url):
+    """Return the final cached target for url, or url if there is none."""
+    with self.__lock:
+      seen = set()
+      while url in self.__targets and url not in seen:
+        seen.add(url)
+        # Reinsert to mark this entry as most recently used.
+        target = self.__targets.pop(url)
+        self.__targets[url] = target
+        url = target
+      return url
+
+  def Clear(self):
+    with self.__lock:
+      self.__targets.clear()
+
+
+class RequestLogger(object):
+  """Logs the HTTP requests and responses made by a client.
+
+  Nothing is formatted unless the logger is enabled for level, and
+  only a sample_rate fraction of calls are logged. Bodies can be
+  redacted, either entirely (redact_bodies=True) or by passing a
+  function which maps a body to the string to log.
+  """
+
+  # Headers which are never logged.
+  REDACTED_HEADERS = frozenset(('authorization', 'cookie', 'set-cookie'))
+
+  def __init__(self, log_request=True, log_response=True, sample_rate=1.0,
+               redact_bodies=False, logger=None, level=logging.INFO):
+    self.__log_request = log_request
+    self.__log_response = log_response
+    self.__sample_rate = sample_rate
+    self.__redact_bodies = redact_bodies
+    self.__logger = logger or logging.getLogger('apitools.http')
+    self.__level = level
+
+  def Sample(self):
+    """Determine whether to log the next call."""
+    if not (self.__log_request or self.__log_response):
+      return False
+    if not self.__logger.isEnabledFor(self.__level):
+      return False
+    return self.__sample_rate >= 1 or random.random() < self.__sample_rate
+
+  def __FormatHeaders(self, headers):
+    return ', '.join(
+        '%s: %s' % (name, '<redacted>' if name.lower() in
+                    self.REDACTED_HEADERS else value)
+        for name, value in sorted(headers.iteritems()))
+
+  def __FormatBody(self, body):
+    if not body:
+      return '<empty>'
+    if callable(self.__redact_bodies):
+      return self.__redact_bodies(body)
+    if self.__redact_bodies:
+      return '<redacted %d bytes>' % len(body)
+    return body
+
+  def LogRequest(self, http_request):
+    if not self.__log_request:
+      return
+    self.__logger.log(
+        self.__level, 'Request: %s %s\nHeaders: %s\nBody: %s',
+        http_request.method, http_request.uri,
+        self.__FormatHeaders(http_request.headers),
+        self.__FormatBody(http_request.body))
+
+  def LogResponse(self, http_request, response_info, content):
+    if not self.__log_response:
+      return
+    self.__logger.log(
+        self.__level, 'Response: %s for %s %s\nHeaders: %s\nBody: %s',
+        response_info.status, http_request.method, http_request.uri,
+        self.__FormatHeaders(response_info),
+        self.__FormatBody(content))
+
+  def WrapPostproc(self, http_request, postproc):
+    """Return postproc, wrapped to log each successful response."""
+    def LoggingPostproc(response_info, content):
+      self.LogResponse(http_request, response_info, content)
+      return postproc(response_info, content)
+    return LoggingPostproc
+
+
+class ResponseCacheEntry(collections.namedtuple(
+    'ResponseCacheEntry', ['etag', 'content', 'result', 'stored_at'])):
+  """A cached response.
+
+  Fields:
+    etag: the ETag header of the response.
+    content: the body of the response.
+    result: the decoded response, or None if it has not been decoded
+        (as for entries read from a backend).
+    stored_at: time at which the response was stored.
+  """
+  __slots__ = ()
+
+
+class ResponseCacheStats(collections.namedtuple(
+    'ResponseCacheStats', ['hits', 'misses', 'size'])):
+  """Usage counters for a ResponseCache.
+
+  Fields:
+    hits: number of requests answered from the cache after a 304.
+    misses: number of requests that needed a full response.
+    size: number of entries held in memory.
+  """
+  __slots__ = ()
+
+
+class FileCacheBackend(object):
+  """Stores ResponseCache entries as files in a directory.
+
+  A FileCacheBackend lets short-lived processes (such as command line
+  tools) share cached responses. Only the ETag and body of each
+  response are stored; they are decoded again when first reused.
+  """
+
+  def __init__(self, directory):
+    self.__directory = directory
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  @property
+  def directory(self):
+    return self.__directory
+
+  def __Path(self, key):
+    return os.path.join(self.__directory, hashlib.sha1(key).hexdigest())
+
+  def Get(self, key):
+    """Return the ResponseCacheEntry stored for key, or None."""
+    try:
+      with open(self.__Path(key), 'rb') as f:
+        stored_key = f.readline()[:-1]
+        etag = f.readline()[:-1]
+        stored_at = float(f.readline())
+        content = f.read()
+    except (IOError, ValueError):
+      return None
+    if stored_key != key:
+      return None
+    return ResponseCacheEntry(etag=etag, content=content, result=None,
+                              stored_at=stored_at)
+
+  def Put(self, key, entry):
+    # Write to a temporary file and rename it into place, so
+    # concurrent readers never see a partial entry.
+    fd, temp_path = tempfile.mkstemp(dir=self.__directory)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write('%s\n%s\n%r\n' % (key, entry.etag, entry.stored_at))
+        f.write(entry.content)
+      os.rename(temp_path, self.__Path(key))
+    except (IOError, OSError) as e:
+      logging.warning('Could not write response cache entry: %s', e)
+      try:
+        os.remove(temp_path)
+      except OSError:
+        pass
+
+  def Delete(self, key):
+    try:
+      os.remove(self.__Path(key))
+    except OSError:
+      pass
+
+
+class ResponseCache(object):
+  """An LRU cache of GET responses, revalidated with their ETags.
+
+  Each entry holds the ETag, body and decoded result of a response,
+  keyed by the URL and headers of the request. When a request has an
+  entry, it is sent with If-None-Match, and a 304 response is answered
+  from the entry instead of decoding a new body.
+
+  Only 200 responses with an ETag, and without Cache-Control: no-store,
+  are stored (see IsStorable). Entries are evicted beyond max_entries,
+  or when their bodies total more than max_bytes, least recently used
+  first. Entries older than ttl seconds are discarded. With a backend (such as a
+  FileCacheBackend), entries are also written through to it, and
+  entries missing from memory are looked up there.
+  """
+
+  def __init__(self, max_entries=1000, max_bytes=None, ttl=None,
+               backend=None, clock=time.time):
+    self.__max_entries = max_entries
+    self.__max_bytes = max_bytes
+    self.__ttl = ttl
+    self.__backend = backend
+    self.__clock = clock
+    self.__entries = collections.OrderedDict()
+    self.__bytes = 0
+    self.__hits = 0
+    self.__misses = 0
+    self.__lock = threading.Lock()
+
+  @property
+  def stats(self):
+    with self.__lock:
+      return ResponseCacheStats(hits=self.__hits, misses=self.__misses,
+                                size=len(self.__entries))
+
+  @staticmethod
+  def IsStorable(response_info):
+    """Determine whether the response with response_info may be stored."""
+    if response_info.status != httplib.OK or not response_info.get('etag'):
+      return False
+    cache_control = response_info.get('cache-control', '')
+    return 'no-store' not in [
+        directive.strip().lower() for directive in cache_control.split(',')]
+
+  @staticmethod
+  def MakeKey(uri, headers):
+    """Compute the cache key for a request."""
+    lines = [uri]
+    lines.extend('%s: %s' % (name.lower(), value)
+                 for name, value in sorted(headers.iteritems())
+                 if name.lower() != 'if-none-match')
+    return '\t'.join(lines)
+
+  def __IsExpired(self, entry):
+    return (self.__ttl is not None and
+            self.__clock() - entry.stored_at > self.__ttl)
+
+  def __Remove(self, key):
+    entry = self.__entries.pop(key, None)
+    if entry is not None:
+      self.__bytes -= len(entry.content)
+
+  def __Insert(self, key, entry):
+    self.__Remove(key)
+    self.__entries[key] = entry
+    self.__bytes += len(entry.content)
+    while self.__entries and (
+        len(self.__entries) > self.__max_entries or (
+            self.__max_bytes is not None and
+            self.__bytes > self.__max_bytes)):
+      _, evicted = self.__entries.popitem(last=False)
+      self.__bytes -= len(evicted.content)
+
+  def Lookup(self, key):
+    """Return the unexpired ResponseCacheEntry for key, or None."""
+    with self.__lock:
+      entry = self.__entries.get(key)
+      if entry is not None:
+        # Reinsert to mark this entry as most recently used.
+        self.__entries[key] = self.__entries.pop(key)
+    if entry is None and self.__backend is not None:
+      entry = self.__backend.Get(key)
+      if entry is not None:
+        with self.__lock:
+          self.__Insert(key, entry)
+    if entry is not None and self.__IsExpired(entry):
+      self.Delete(key)
+      return None
+    return entry
+
+  def Store(self, key, etag, content, result=None):
+    """Store a response for key, replacing any existing entry."""
+    entry = ResponseCacheEntry(etag=etag, content=content, result=result,
+                               stored_at=self.__clock())
+    with self.__lock:
+      self.__Insert(key, entry)
+    if self.__backend is not None:
+      self.__backend.Put(key, entry._replace(result=None))
+
+  def Update(self, key, result):
+    """Record the decoded result for an existing entry."""
+    with self.__lock:
+      entry = self.__entries.get(key)
+      if entry is not None:
+        self.__entries[key] = entry._replace(result=result)
+
+  def Delete(self, key):
+    with self.__lock:
+      self.__Remove(key)
+    if self.__backend is not None:
+      self.__backend.Delete(key)
+
+  def Clear(self):
+    with self.__lock:
+      self.__entries.clear()
+      self.__bytes = 0
+
+  def RecordHit(self):
+    with self.__lock:
+      self.__hits += 1
+
+  def RecordMiss(self):
+    with self.__lock:
+      self.__misses += 1
+
+
+class RateLimiter(object):
+  """A token bucket which limits the rate of requests.
+
+  The bucket holds up to burst tokens, and refills at rate tokens per
+  second; each request takes a token. When the bucket is empty,
+  Acquire either waits for a token (if block is set, for at most
+  max_wait seconds in total) or raises
+  exceptions.RateLimitExceededError. A RateLimiter can be shared by
+  any number of threads, clients and methods.
+  """
+
+  def __init__(self, rate, burst=None, block=True, max_wait=None,
+               clock=time.time, sleep=time.sleep):
+    if rate <= 0:
+      raise exceptions.ConfigurationValueError(
+          'Invalid rate limit: %s' % rate)
+    self.__rate = float(rate)
+    self.__burst = float(burst if burst is not None else max(rate, 1))
+    self.__block = block
+    self.__max_wait = max_wait
+    self.__clock = clock
+    self.__sleep = sleep
+    self.__tokens = self.__burst
+    self.__updated = None
+    self.__lock = threading.Lock()
+
+  @property
+  def rate(self):
+    return self.__rate
+
+  @property
+  def burst(self):
+    return self.__burst
+
+  def _Refill(self, tokens, updated, now):
+    """Return the tokens in a bucket last updated at updated."""
+    if updated is None:
+      return self.__burst
+    return min(self.__burst, tokens + max(0, now - updated) * self.__rate)
+
+  def _TryTake(self, tokens, now):
+    """Take tokens if available, else return the seconds to wait."""
+    with self.__lock:
+      self.__tokens = self._Refill(self.__tokens, self.__updated, now)
+      self.__updated = now
+      if self.__tokens >= tokens:
+        self.__tokens -= tokens
+        return 0
+      return (tokens - self.__tokens) / self.__rate
+
+  def Acquire(self, tokens=1):
+    """Take tokens from the bucket, waiting for them if necessary.
+
+    Args:
+      tokens: (int, default: 1) number of tokens to take.
+
+    Returns:
+      The number of seconds spent waiting.
+
+    Raises:
+      exceptions.RateLimitExceededError: the tokens are not available
+          and this limiter doesn't block (or would wait too long).
+    """
+    if tokens > self.__burst:
+      raise exceptions.InvalidUserInputError(
+          'Cannot acquire %s tokens from a bucket of size %s' % (
+              tokens, self.__burst))
+    waited = 0
+    while True:
+      delay = self._TryTake(tokens, self.__clock())
+      if not delay:
+        return waited
+      if not self.__block or (self.__max_wait is not None and
+                              waited + delay > self.__max_wait):
+        raise exceptions.RateLimitExceededError(
+            'Rate limit of %s requests per second exceeded' % self.__rate)
+      self.__sleep(delay)
+      waited += delay
+
+
+class FileRateLimiter(RateLimiter):
+  """A RateLimiter whose bucket is shared through a file.
+
+  Every process which creates a FileRateLimiter with the same path
+  draws from the same bucket; the file is locked while the bucket is
+  updated. This requires fcntl, so is only available on POSIX systems.
+  """
+
+  def __init__(self, path, rate, **kwds):
+    if fcntl is None:
+      raise exceptions.ConfigurationValueError(
+          'FileRateLimiter requires fcntl, which is not available')
+    super(FileRateLimiter, self).__init__(rate, **kwds)
+    self.__path = path
+    # Threads in this process also need to take turns, since the file
+    # lock is held by the process.
+    self.__lock = threading.Lock()
+
+  @property
+  def path(self):
+    return self.__path
+
+  def _TryTake(self, tokens, now):
+    with self.__lock:
+      fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o644)
+      try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+          available, updated = float(self.burst), None
+          state = os.read(fd, 100).split()
+          if len(state) == 2:
+            try:
+              available, updated = float(state[0]), float(state[1])
+            except ValueError:
+              pass
+          available = self._Refill(available, updated, now)
+          delay = 0
+          if available >= tokens:
+            available -= tokens
+          else:
+            delay = (tokens - available) / self.rate
+          os.lseek(fd, 0, os.SEEK_SET)
+          os.ftruncate(fd, 0)
+          os.write(fd, '%r %r' % (available, now))
+          return delay
+        finally:
+          fcntl.flock(fd, fcntl.LOCK_UN)
+      finally:
+        os.close(fd)
+
+
+class _Flight(object):
+  """A call in progress in a SingleFlight."""
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.exc_info = None
+    self.waiters = 0
+
+
+class SingleFlight(object):
+  """Coalesces identical calls which are in progress at the same time.
+
+  While a call for a key is in progress, later calls for the same key
+  wait for it to finish and receive its result (or exception) instead
+  of repeating the work.
+  """
+
+  def __init__(self):
+    self.__flights = {}
+    self.__lock = threading.Lock()
+
+  @property
+  def waiting(self):
+    """The number of callers waiting for another caller's result."""
+    with self.__lock:
+      return sum(flight.waiters for flight in self.__flights.itervalues())
+
+  def Do(self, key, function):
+    """Call function, unless a call for key is already in progress.
+
+    Args:
+      key: a hashable key identifying the call.
+      function: a function of no arguments, which makes the call.
+
+    Returns:
+      A pair (result, shared), where shared is True if the result was
+      (or may still be) given to more than one caller, in which case
+      it must not be modified.
+    """
+    with self.__lock:
+      flight = self.__flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = self.__flights[key] = _Flight()
+      else:
+        flight.waiters += 1
+    if not leader:
+      flight.done.wait()
+      if flight.exc_info is not None:
+        raise flight.exc_info[0], flight.exc_info[1], flight.exc_info[2]
+      return flight.result, True
+    try:
+      flight.result = function()
+    except:  # pylint: disable=bare-except
+      flight.exc_info = sys.exc_info()
+      raise
+    finally:
+      with self.__lock:
+        del self.__flights[key]
+        shared = flight.waiters > 0
+      flight.done.set()
+    return flight.result, shared
+
+
+class CircuitBreaker(object):
+  """Fails fast while a host is failing, instead of waiting on it.
+
+  The circuit starts closed. After failure_threshold consecutive
+  failures (connection errors, timeouts or 5xx responses) it opens,
+  and Allow raises exceptions.CircuitOpenError without any request
+  being sent. After reset_timeout seconds the circuit is half open:
+  up to half_open_probes requests are let through as probes, and the
+  first to succeed closes the circuit, while a failure opens it again.
+  If no probe reports back within reset_timeout, new probes are
+  allowed.
+
+  listener, if given, is called as listener(breaker, old_state,
+  new_state) on every transition.
+  """
+
+  CLOSED = 'closed'
+  OPEN = 'open'
+  HALF_OPEN = 'half_open'
+
+  def __init__(self, failure_threshold=5, reset_timeout=30.0,
+               half_open_probes=1, name=None, listener=None,
+               clock=time.time):
+    self.__failure_threshold = failure_threshold
+    self.__reset_timeout = reset_timeout
+    self.__half_open_probes = half_open_probes
+    self.__name = name
+    self.__listener = listener
+    self.__clock = clock
+    self.__state = self.CLOSED
+    self.__failures = 0
+    self.__opened_at = None
+    self.__probes_started_at = None
+    self.__probes = 0
+    self.__lock = threading.Lock()
+
+  @property
+  def name(self):
+    return self.__name
+
+  @property
+  def state(self):
+    return self.__state
+
+  @property
+  def consecutive_failures(self):
+    return self.__failures
+
+  def __Transition(self, new_state):
+    """Change state; must be called with the lock held."""
+    old_state = self.__state
+    self.__state = new_state
+    if new_state == self.OPEN:
+      self.__opened_at = self.__clock()
+    elif new_state == self.HALF_OPEN:
+      self.__probes_started_at = self.__clock()
+      self.__probes = 0
+    else:
+      self.__failures = 0
+    return old_state
+
+  def __Notify(self, old_state, new_state):
+    if old_state == new_state:
+      return
+    logging.warning('Circuit for %s changed from %s to %s',
+                    self.__name or 'host', old_state, new_state)
+    if self.__listener is not None:
+      self.__listener(self, old_state, new_state)
+
+  def Allow(self):
+    """Check whether a request may be sent now.
+
+    Raises:
+      exceptions.CircuitOpenError: the circuit is open, or half open
+          with all probes in flight.
+    """
+    with self.__lock:
+      old_state = new_state = self.__state
+      now = self.__clock()
+      if (self.__state == self.OPEN and
+          now - self.__opened_at >= self.__reset_timeout):
+        self.__Transition(self.HALF_OPEN)
+        new_state = self.HALF_OPEN
+      elif (self.__state == self.HALF_OPEN and
+            now - self.__probes_started_at >= self.__reset_timeout):
+        # The probes never reported back, so start over.
+        self.__probes_started_at = now
+        self.__probes = 0
+      allowed = self.__state == self.CLOSED
+      if (self.__state == self.HALF_OPEN and
+          self.__probes < self.__half_open_probes):
+        self.__probes += 1
+        allowed = True
+    self.__Notify(old_state, new_state)
+    if not allowed:
+      raise exceptions.CircuitOpenError(
+          'Circuit for %s is %s; not sending request' % (
+              self.__name or 'host', new_state))
+
+  def RecordSuccess(self):
+    with self.__lock:
+      self.__failures = 0
+      old_state = self.__state
+      if old_state != self.CLOSED:
+        self.__Transition(self.CLOSED)
+    self.__Notify(old_state, self.CLOSED)
+
+  def RecordFailure(self):
+    with self.__lock:
+      self.__failures += 1
+      old_state = new_state = self.__state
+      if (old_state == self.HALF_OPEN or (
+          old_state == self.CLOSED and
+          self.__failures >= self.__failure_threshold)):
+        self.__Transition(self.OPEN)
+        new_state = self.OPEN
+    self.__Notify(old_state, new_state)
+
+  def Reset(self):
+    """Close the circuit, regardless of its state."""
+    self.RecordSuccess()
+
+
+class CircuitBreakerGroup(object):
+  """A CircuitBreaker for each host, shared by every client using it.
+
+  The arguments are passed to each new CircuitBreaker.
+  """
+
+  def __init__(self, **breaker_kwds):
+    self.__breaker_kwds = breaker_kwds
+    self.__breakers = {}
+    self.__lock = threading.Lock()
+
+  def Get(self, host):
+    """Return the CircuitBreaker for host, creating it if necessary."""
+    with self.__lock:
+      breaker = self.__breakers.get(host)
+      if breaker is None:
+        breaker = self.__breakers[host] = CircuitBreaker(
+            name=host, **self.__breaker_kwds)
+      return breaker
+
+  @property
+  def states(self):
+    """A dict mapping each host to the state of its circuit."""
+    with self.__lock:
+      return dict((host, breaker.state)
+                  for host, breaker in self.__breakers.iteritems())
@@ -0,0 +1,720 @@
+#!/usr/bin/env python
+"""Tests for http_wrapper."""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import httplib2
+
+from apitools.base.py import exceptions
+from apitools.base.py import http_wrapper
+from apitools.base.py.testing import fake_server
+
+
+class _FakeHttp(object):
+  """Stands in for httplib2.Http, recording concurrent requests."""
+
+  def __init__(self, tracker):
+    self.tracker = tracker
+
+  def request(self, uri, **unused_kwds):  # pylint: disable=invalid-name
+    self.tracker.Enter()
+    try:
+      self.tracker.release.wait()
+    finally:
+      self.tracker.Exit()
+    return {'status': '200'}, uri
+
+
+class _Tracker(object):
+  """Counts the requests in flight across _FakeHttp objects."""
+
+  def __init__(self):
+    self.release = threading.Event()
+    self.active = 0
+    self.max_active = 0
+    self.created = 0
+    self.__lock = threading.Lock()
+
+  def NewHttp(self):
+    with self.__lock:
+      self.created += 1
+    return _FakeHttp(self)
+
+  def Enter(self):
+    with self.__lock:
+      self.active += 1
+      self.max_active = max(self.max_active, self.active)
+
+  def Exit(self):
+    with self.__lock:
+      self.active -= 1
+
+
+class _FakeCredentials(object):
+
+  def __init__(self):
+    self.authorized = []
+
+  def authorize(self, http):  # pylint: disable=invalid-name
+    self.authorized.append(http)
+    return http
+
+
+class _ScriptedHttp(object):
+  """Stands in for httplib2.Http, answering with a fixed response."""
+
+  def __init__(self, headers, content):
+    self.response = httplib2.Response(headers)
+    self.content = content
+
+  # pylint: disable=invalid-name
+  def request(self, *unused_args, **unused_kwds):
+    return self.response, self.content
+
+
+class RequestTest(unittest.TestCase):
+
+  def __Execute(self, headers, content):
+    request = http_wrapper.Request(
+        _ScriptedHttp(headers, content), lambda _, content: content,
+        'http://www.example.com/')
+    return request.execute()
+
+  def testGzipResponseDecompressed(self):
+    # httplib2 decompresses responses itself, but other http objects
+    # may not.
+    self.assertEqual('{"id": "t"}', self.__Execute(
+        {'status': '200', 'content-encoding': 'gzip'},
+        http_wrapper.GzipContent('{"id": "t"}')))
+
+  def testInvalidGzipResponse(self):
+    self.assertRaises(
+        exceptions.CommunicationError, self.__Execute,
+        {'status': '200', 'content-encoding': 'gzip'}, 'not gzip')
+
+  def testUncompressedResponse(self):
+    self.assertEqual('plain', self.__Execute({'status': '200'}, 'plain'))
+
+
+class _CapturingHandler(logging.Handler):
+  """Keeps the messages logged to it."""
+
+  def __init__(self):
+    logging.Handler.__init__(self)
+    self.messages = []
+
+  def emit(self, record):
+    self.messages.append(record.getMessage())
+
+
+class RequestLoggerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.handler = _CapturingHandler()
+    self.logger = logging.getLogger('apitools.http.test')
+    self.logger.propagate = False
+    self.logger.setLevel(logging.INFO)
+    self.logger.addHandler(self.handler)
+    self.addCleanup(self.logger.removeHandler, self.handler)
+    self.request = http_wrapper.Request(
+        None, None, 'http://www.example.com/things', method='POST',
+        body='{"id": "t"}',
+        headers={'Authorization': 'Bearer secret', 'x-custom': 'value'})
+    self.response_info = httplib2.Response(
+        {'status': '200', 'set-cookie': 'session=secret'})
+
+  def __Log(self, **kwds):
+    request_logger = http_wrapper.RequestLogger(logger=self.logger, **kwds)
+    self.assertTrue(request_logger.Sample())
+    request_logger.LogRequest(self.request)
+    request_logger.LogResponse(
+        self.request, self.response_info, '{"id": "t"}')
+    return self.handler.messages
+
+  def testLogsRequestAndResponse(self):
+    request_message, response_message = self.__Log()
+    self.assertIn('Request: POST http://www.example.com/things',
+                  request_message)
+    self.assertIn('x-custom: value', request_message)
+    self.assertIn('Body: {"id": "t"}', request_message)
+    self.assertIn('Response: 200 for POST http://www.example.com/things',
+                  response_message)
+    self.assertIn('Body: {"id": "t"}', response_message)
+
+  def testHeadersRedacted(self):
+    request_message, response_message = self.__Log()
+    self.assertIn('Authorization: <redacted>', request_message)
+    self.assertIn('set-cookie: <redacted>', response_message)
+    self.assertNotIn('secret', request_message + response_message)
+
+  def testBodiesRedacted(self):
+    request_message, response_message = self.__Log(redact_bodies=True)
+    self.assertIn('Body: <redacted 11 bytes>', request_message)
+    self.assertNotIn('"t"', request_message + response_message)
+
+  def testBodiesRedactedByFunction(self):
+    messages = self.__Log(redact_bodies=lambda body: body.upper())
+    for message in messages:
+      self.assertIn('Body: {"ID": "T"}', message)
+
+  def testOnlyResponses(self):
+    response_message, = self.__Log(log_request=False)
+    self.assertTrue(response_message.startswith('Response: '))
+
+  def testNotSampledWhenLevelDisabled(self):
+    self.logger.setLevel(logging.WARNING)
+    request_logger = http_wrapper.RequestLogger(logger=self.logger)
+    self.assertFalse(request_logger.Sample())
+    self.assertFalse(http_wrapper.RequestLogger(
+        log_request=False, log_response=False,
+        logger=self.logger).Sample())
+
+
+class HttpPoolTest(unittest.TestCase):
+
+  def testInvalidSize(self):
+    self.assertRaises(exceptions.ConfigurationValueError,
+                      http_wrapper.HttpPool, max_size=0)
+
+  def testReusesIdleConnection(self):
+    tracker = _Tracker()
+    tracker.release.set()
+    pool = http_wrapper.HttpPool(max_size=2, http_factory=tracker.NewHttp)
+    for _ in range(3):
+      pool.request('http://example.com/')
+    self.assertEqual(http_wrapper.HttpPoolStats(
+        hits=2, misses=1, size=1, idle=1), pool.stats)
+
+  def testBoundsConcurrentCheckout(self):
+    tracker = _Tracker()
+    credentials = _FakeCredentials()
+    pool = http_wrapper.HttpPool(max_size=3, credentials=credentials,
+                                 http_factory=tracker.NewHttp)
+    threads = [threading.Thread(target=pool.request,
+                                args=('http://example.com/%d' % i,))
+               for i in range(8)]
+    for thread in threads:
+      thread.start()
+    fake_server.WaitFor(lambda: tracker.active == 3)
+    # The other requests wait for a connection instead of creating one.
+    time.sleep(0.05)
+    self.assertEqual(3, tracker.active)
+    self.assertEqual(3, pool.stats.size)
+    tracker.release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(3, tracker.max_active)
+    self.assertEqual(3, tracker.created)
+    self.assertEqual(3, len(credentials.authorized))
+    self.assertEqual(http_wrapper.HttpPoolStats(
+        hits=5, misses=3, size=3, idle=3), pool.stats)
+
+  def testFactoryErrorReleasesSlot(self):
+    tracker = _Tracker()
+    tracker.release.set()
+    failures = [ValueError('no connection')]
+
+    def Factory():
+      if failures:
+        raise failures.pop()
+      return tracker.NewHttp()
+    pool = http_wrapper.HttpPool(max_size=1, http_factory=Factory)
+    self.assertRaises(ValueError, pool.request, 'http://example.com/')
+    # With the slot released, the next request doesn't block.
+    pool.request('http://example.com/')
+    self.assertEqual(http_wrapper.HttpPoolStats(
+        hits=0, misses=2, size=1, idle=1), pool.stats)
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+  def testComputeDelay(self):
+    policy = http_wrapper.RetryPolicy(
+        initial_delay=1.0, max_delay=10.0, multiplier=2.0, jitter=0)
+    self.assertEqual([1.0, 2.0, 4.0, 8.0, 10.0, 10.0],
+                     [policy.ComputeDelay(i) for i in range(1, 7)])
+
+  def testComputeDelayJitter(self):
+    policy = http_wrapper.RetryPolicy(initial_delay=4.0, jitter=0.5)
+    for _ in range(20):
+      self.assertTrue(2.0 <= policy.ComputeDelay(1) <= 4.0)
+
+  def testRetryAfter(self):
+    policy = http_wrapper.RetryPolicy(max_delay=60.0, jitter=0)
+    self.assertEqual(7, policy.ComputeDelay(1, retry_after='7'))
+    self.assertEqual(0, policy.ComputeDelay(1, retry_after='-3'))
+    self.assertEqual(60.0, policy.ComputeDelay(1, retry_after='86400'))
+    # An unparseable value falls back to the computed delay.
+    self.assertEqual(1.0, policy.ComputeDelay(1, retry_after='soon'))
+
+  def testShouldRetry(self):
+    policy = http_wrapper.RetryPolicy(max_retries=2)
+    self.assertTrue(policy.ShouldRetry('GET', 503, 1))
+    self.assertTrue(policy.ShouldRetry('get', None, 2))
+    self.assertFalse(policy.ShouldRetry('GET', 503, 3))
+    self.assertFalse(policy.ShouldRetry('GET', 404, 1))
+    self.assertFalse(policy.ShouldRetry('POST', 503, 1))
+    self.assertFalse(policy.ShouldRetry('POST', None, 1))
+    self.assertTrue(policy.ShouldRetry('POST', 429, 1))
+
+
+class _FakeClock(object):
+
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+class RedirectCacheTest(unittest.TestCase):
+
+  def testLookupFollowsChain(self):
+    cache = http_wrapper.RedirectCache()
+    self.assertEqual('http://a/', cache.Lookup('http://a/'))
+    cache.Add('http://a/', 'http://b/')
+    cache.Add('http://b/', 'http://c/')
+    self.assertEqual('http://c/', cache.Lookup('http://a/'))
+    self.assertEqual('http://c/', cache.Lookup('http://b/'))
+    self.assertEqual(2, len(cache))
+
+  def testLookupStopsAtCycle(self):
+    cache = http_wrapper.RedirectCache()
+    cache.Add('http://a/', 'http://b/')
+    cache.Add('http://b/', 'http://a/')
+    self.assertEqual('http://a/', cache.Lookup('http://a/'))
+
+  def testEvictsLeastRecentlyUsed(self):
+    cache = http_wrapper.RedirectCache(max_size=2)
+    cache.Add('http://a/', 'http://a2/')
+    cache.Add('http://b/', 'http://b2/')
+    cache.Lookup('http://a/')
+    cache.Add('http://c/', 'http://c2/')
+    self.assertEqual(2, len(cache))
+    self.assertEqual('http://a2/', cache.Lookup('http://a/'))
+    self.assertEqual('http://b/', cache.Lookup('http://b/'))
+    cache.Clear()
+    self.assertEqual(0, len(cache))
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = _FakeClock()
+
+  def __NewCache(self, **kwds):
+    return http_wrapper.ResponseCache(clock=self.clock, **kwds)
+
+  def testStoreAndLookup(self):
+    cache = self.__NewCache()
+    self.assertIsNone(cache.Lookup('a'))
+    cache.Store('a', '"v1"', 'content', result='result')
+    entry = cache.Lookup('a')
+    self.assertEqual(('"v1"', 'content', 'result', 1000.0), entry)
+    cache.Store('a', '"v2"', 'new content')
+    self.assertEqual('"v2"', cache.Lookup('a').etag)
+    cache.Update('a', 'new result')
+    self.assertEqual('new result', cache.Lookup('a').result)
+    cache.Delete('a')
+    self.assertIsNone(cache.Lookup('a'))
+
+  def testTtlExpiry(self):
+    cache = self.__NewCache(ttl=60)
+    cache.Store('a', '"v1"', 'content')
+    self.clock.now += 60
+    self.assertIsNotNone(cache.Lookup('a'))
+    self.clock.now += 1
+    self.assertIsNone(cache.Lookup('a'))
+    self.assertEqual(0, cache.stats.size)
+
+  def testEvictsLeastRecentlyUsed(self):
+    cache = self.__NewCache(max_entries=2)
+    cache.Store('a', '"a"', 'a')
+    cache.Store('b', '"b"', 'b')
+    cache.Lookup('a')
+    cache.Store('c', '"c"', 'c')
+    self.assertIsNotNone(cache.Lookup('a'))
+    self.assertIsNone(cache.Lookup('b'))
+    self.assertIsNotNone(cache.Lookup('c'))
+
+  def testEvictsBeyondMaxBytes(self):
+    cache = self.__NewCache(max_bytes=10)
+    cache.Store('a', '"a"', 'x' * 6)
+    cache.Store('b', '"b"', 'x' * 4)
+    self.assertEqual(2, cache.stats.size)
+    cache.Store('c', '"c"', 'x')
+    self.assertIsNone(cache.Lookup('a'))
+    self.assertEqual(2, cache.stats.size)
+    # An entry larger than max_bytes is not kept at all.
+    cache.Store('d', '"d"', 'x' * 11)
+    self.assertEqual(0, cache.stats.size)
+
+  def testStats(self):
+    cache = self.__NewCache()
+    cache.RecordMiss()
+    cache.RecordMiss()
+    cache.RecordHit()
+    cache.Store('a', '"a"', 'a')
+    self.assertEqual(http_wrapper.ResponseCacheStats(
+        hits=1, misses=2, size=1), cache.stats)
+
+  def testMakeKeyIgnoresIfNoneMatch(self):
+    make_key = http_wrapper.ResponseCache.MakeKey
+    self.assertEqual(
+        make_key('http://a/', {'accept': 'application/json'}),
+        make_key('http://a/', {'Accept': 'application/json',
+                               'if-none-match': '"v1"'}))
+    self.assertNotEqual(make_key('http://a/', {}),
+                        make_key('http://b/', {}))
+    self.assertNotEqual(make_key('http://a/', {}),
+                        make_key('http://a/', {'accept-encoding': 'gzip'}))
+
+  def testIsStorable(self):
+    is_storable = http_wrapper.ResponseCache.IsStorable
+    self.assertTrue(is_storable(httplib2.Response(
+        {'status': '200', 'etag': '"v1"'})))
+    self.assertTrue(is_storable(httplib2.Response(
+        {'status': '200', 'etag': '"v1"', 'cache-control': 'private'})))
+    self.assertFalse(is_storable(httplib2.Response({'status': '200'})))
+    self.assertFalse(is_storable(httplib2.Response(
+        {'status': '203', 'etag': '"v1"'})))
+    self.assertFalse(is_storable(httplib2.Response(
+        {'status': '200', 'etag': '"v1"',
+         'cache-control': 'private, No-Store'})))
+
+
+class FileCacheBackendTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.clock = _FakeClock()
+
+  def __NewCache(self, **kwds):
+    return http_wrapper.ResponseCache(
+        backend=http_wrapper.FileCacheBackend(self.directory),
+        clock=self.clock, **kwds)
+
+  def testRoundTrip(self):
+    self.__NewCache().Store('http://a/\taccept: */*', '"v1"', '{\n}\n',
+                            result='result')
+    # A new cache (as in another process) finds the entry on disk,
+    # without its decoded result.
+    entry = self.__NewCache().Lookup('http://a/\taccept: */*')
+    self.assertEqual(('"v1"', '{\n}\n', None, 1000.0), entry)
+
+  def testCreatesDirectory(self):
+    directory = os.path.join(self.directory, 'cache')
+    http_wrapper.FileCacheBackend(directory)
+    self.assertTrue(os.path.isdir(directory))
+
+  def testDelete(self):
+    self.__NewCache().Store('a', '"v1"', 'content')
+    self.__NewCache().Delete('a')
+    self.assertIsNone(self.__NewCache().Lookup('a'))
+    self.assertEqual([], os.listdir(self.directory))
+
+  def testExpiredOnDisk(self):
+    self.__NewCache().Store('a', '"v1"', 'content')
+    self.clock.now += 61
+    self.assertIsNone(self.__NewCache(ttl=60).Lookup('a'))
+    self.assertEqual([], os.listdir(self.directory))
+
+  def testCorruptFile(self):
+    self.__NewCache().Store('a', '"v1"', 'content')
+    path, = [os.path.join(self.directory, name)
+             for name in os.listdir(self.directory)]
+    with open(path, 'wb') as f:
+      f.write('a\n"v1"\nnot a time\n')
+    cache = self.__NewCache()
+    self.assertIsNone(cache.Lookup('a'))
+    # The entry can be stored again.
+    cache.Store('a', '"v2"', 'content')
+    self.assertEqual('"v2"', self.__NewCache().Lookup('a').etag)
+
+  def testTruncatedFile(self):
+    self.__NewCache().Store('a', '"v1"', 'content')
+    path, = [os.path.join(self.directory, name)
+             for name in os.listdir(self.directory)]
+    with open(path, 'wb') as f:
+      f.write('a\n')
+    self.assertIsNone(self.__NewCache().Lookup('a'))
+
+
+class RateLimiterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = _FakeClock()
+    self.sleeps = []
+
+  def __Sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.clock.now += seconds
+
+  def __NewLimiter(self, rate, **kwds):
+    return http_wrapper.RateLimiter(
+        rate, clock=self.clock, sleep=self.__Sleep, **kwds)
+
+  def testInvalidRate(self):
+    self.assertRaises(exceptions.ConfigurationValueError,
+                      http_wrapper.RateLimiter, 0)
+
+  def testBurst(self):
+    limiter = self.__NewLimiter(2, burst=3)
+    for _ in range(3):
+      self.assertEqual(0, limiter.Acquire())
+    self.assertEqual([], self.sleeps)
+    self.assertEqual(0.5, limiter.Acquire())
+    self.assertEqual([0.5], self.sleeps)
+
+  def testDefaultBurst(self):
+    self.assertEqual(5, self.__NewLimiter(5).burst)
+    self.assertEqual(1, self.__NewLimiter(0.5).burst)
+
+  def testRefill(self):
+    limiter = self.__NewLimiter(2, burst=2)
+    limiter.Acquire(2)
+    self.clock.now += 0.5
+    # One token has been added since.
+    limiter.Acquire()
+    self.assertEqual([], self.sleeps)
+    # The bucket never holds more than burst tokens.
+    self.clock.now += 60
+    limiter.Acquire(2)
+    self.assertEqual(0.5, limiter.Acquire())
+
+  def testBlocksUntilTokensAvailable(self):
+    limiter = self.__NewLimiter(1, burst=2)
+    limiter.Acquire(2)
+    self.assertEqual(2, limiter.Acquire(2))
+    self.assertEqual([2], self.sleeps)
+    self.assertEqual(1002.0, self.clock.now)
+
+  def testNonBlocking(self):
+    limiter = self.__NewLimiter(1, block=False)
+    limiter.Acquire()
+    self.assertRaises(exceptions.RateLimitExceededError, limiter.Acquire)
+    self.assertEqual([], self.sleeps)
+    self.clock.now += 1
+    limiter.Acquire()
+
+  def testMaxWait(self):
+    limiter = self.__NewLimiter(1, burst=3, max_wait=2)
+    limiter.Acquire(3)
+    self.assertRaises(exceptions.RateLimitExceededError, limiter.Acquire, 3)
+    self.assertEqual(2, limiter.Acquire(2))
+
+  def testTooManyTokens(self):
+    limiter = self.__NewLimiter(1, burst=2)
+    self.assertRaises(exceptions.InvalidUserInputError, limiter.Acquire, 3)
+
+
+class FileRateLimiterTest(unittest.TestCase):
+
+  def setUp(self):
+    if http_wrapper.fcntl is None:
+      self.skipTest('FileRateLimiter requires fcntl')
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    self.path = os.path.join(directory, 'bucket')
+    self.clock = _FakeClock()
+
+  def __NewLimiter(self, **kwds):
+    return http_wrapper.FileRateLimiter(
+        self.path, 1, burst=2, clock=self.clock, **kwds)
+
+  def testLimitersShareBucket(self):
+    first = self.__NewLimiter(block=False)
+    second = self.__NewLimiter(block=False)
+    first.Acquire()
+    second.Acquire()
+    self.assertRaises(exceptions.RateLimitExceededError, first.Acquire)
+    self.assertRaises(exceptions.RateLimitExceededError, second.Acquire)
+    self.clock.now += 1
+    second.Acquire()
+    self.assertRaises(exceptions.RateLimitExceededError, first.Acquire)
+
+  def testBlocksOnOtherLimitersTokens(self):
+    sleeps = []
+
+    def Sleep(seconds):
+      sleeps.append(seconds)
+      self.clock.now += seconds
+    self.__NewLimiter().Acquire(2)
+    self.assertEqual(1, self.__NewLimiter(sleep=Sleep).Acquire())
+    self.assertEqual([1], sleeps)
+
+  def testCorruptFile(self):
+    with open(self.path, 'w') as f:
+      f.write('garbage')
+    limiter = self.__NewLimiter(block=False)
+    # A bucket that can't be read starts full.
+    limiter.Acquire(2)
+    self.assertRaises(exceptions.RateLimitExceededError, limiter.Acquire)
+
+
+class SingleFlightTest(unittest.TestCase):
+
+  def setUp(self):
+    self.single_flight = http_wrapper.SingleFlight()
+    self.started = threading.Event()
+    self.release = threading.Event()
+    self.calls = 0
+
+  def __Call(self, result=None, exception=None):
+    self.calls += 1
+    self.started.set()
+    self.release.wait()
+    if exception is not None:
+      raise exception
+    return result
+
+  def __DoConcurrently(self, function, count):
+    """Call Do from count threads while the first call is in progress."""
+    outcomes = []
+
+    def Do():
+      try:
+        outcomes.append(self.single_flight.Do('key', function))
+      except ValueError as e:
+        outcomes.append(e)
+    threads = [threading.Thread(target=Do) for _ in range(count)]
+    threads[0].start()
+    self.started.wait()
+    for thread in threads[1:]:
+      thread.start()
+    fake_server.WaitFor(lambda: self.single_flight.waiting == count - 1)
+    self.release.set()
+    for thread in threads:
+      thread.join()
+    return outcomes
+
+  def testConcurrentCallsShareResult(self):
+    result = object()
+    outcomes = self.__DoConcurrently(
+        lambda: self.__Call(result=result), 4)
+    self.assertEqual(1, self.calls)
+    self.assertEqual([(result, True)] * 4, outcomes)
+    self.assertEqual(0, self.single_flight.waiting)
+
+  def testExceptionReachesWaiters(self):
+    error = ValueError('failed')
+    outcomes = self.__DoConcurrently(
+        lambda: self.__Call(exception=error), 3)
+    self.assertEqual(1, self.calls)
+    self.assertEqual([error] * 3, outcomes)
+    # The failed call is not remembered.
+    self.release.set()
+    self.assertEqual(('ok', False), self.single_flight.Do(
+        'key', lambda: self.__Call(result='ok')))
+
+  def testSequentialCallsNotShared(self):
+    self.release.set()
+    for _ in range(2):
+      self.assertEqual(('ok', False), self.single_flight.Do(
+          'key', lambda: self.__Call(result='ok')))
+    self.assertEqual(2, self.calls)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = _FakeClock()
+    self.transitions = []
+    self.breaker = http_wrapper.CircuitBreaker(
+        failure_threshold=3, reset_timeout=30.0, name='example.com',
+        listener=self.__Listen, clock=self.clock)
+
+  def __Listen(self, breaker, old_state, new_state):
+    self.assertIs(self.breaker, breaker)
+    self.transitions.append((old_state, new_state))
+
+  def __Open(self):
+    for _ in range(3):
+      self.breaker.Allow()
+      self.breaker.RecordFailure()
+
+  def testOpensAfterConsecutiveFailures(self):
+    for _ in range(2):
+      self.breaker.Allow()
+      self.breaker.RecordFailure()
+    self.breaker.RecordSuccess()
+    self.assertEqual(0, self.breaker.consecutive_failures)
+    self.__Open()
+    self.assertEqual(http_wrapper.CircuitBreaker.OPEN, self.breaker.state)
+    self.assertRaises(exceptions.CircuitOpenError, self.breaker.Allow)
+    self.assertEqual([('closed', 'open')], self.transitions)
+
+  def testFullCycle(self):
+    self.__Open()
+    self.clock.now += 29
+    self.assertRaises(exceptions.CircuitOpenError, self.breaker.Allow)
+    self.clock.now += 1
+    # The first request after reset_timeout is let through as a probe,
+    # and a second is refused while it is in flight.
+    self.breaker.Allow()
+    self.assertEqual(http_wrapper.CircuitBreaker.HALF_OPEN,
+                     self.breaker.state)
+    self.assertRaises(exceptions.CircuitOpenError, self.breaker.Allow)
+    self.breaker.RecordSuccess()
+    self.assertEqual(http_wrapper.CircuitBreaker.CLOSED, self.breaker.state)
+    self.breaker.Allow()
+    self.assertEqual([('closed', 'open'), ('open', 'half_open'),
+                      ('half_open', 'closed')], self.transitions)
+
+  def testFailedProbeReopens(self):
+    self.__Open()
+    self.clock.now += 30
+    self.breaker.Allow()
+    self.breaker.RecordFailure()
+    self.assertEqual(http_wrapper.CircuitBreaker.OPEN, self.breaker.state)
+    self.assertRaises(exceptions.CircuitOpenError, self.breaker.Allow)
+    self.assertEqual([('closed', 'open'), ('open', 'half_open'),
+                      ('half_open', 'open')], self.transitions)
+
+  def testLostProbeIsReplaced(self):
+    self.__Open()
+    self.clock.now += 30
+    self.breaker.Allow()
+    self.assertRaises(exceptions.CircuitOpenError, self.breaker.Allow)
+    # The probe never reports back, so another is let through.
+    self.clock.now += 30
+    self.breaker.Allow()
+    self.assertRaises(exceptions.CircuitOpenError, self.breaker.Allow)
+
+  def testMultipleProbes(self):
+    breaker = http_wrapper.CircuitBreaker(
+        failure_threshold=1, reset_timeout=10.0, half_open_probes=2,
+        clock=self.clock)
+    breaker.RecordFailure()
+    self.clock.now += 10
+    breaker.Allow()
+    breaker.Allow()
+    self.assertRaises(exceptions.CircuitOpenError, breaker.Allow)
+
+  def testReset(self):
+    self.__Open()
+    self.breaker.Reset()
+    self.assertEqual(http_wrapper.CircuitBreaker.CLOSED, self.breaker.state)
+    self.breaker.Allow()
+
+  def testGroup(self):
+    group = http_wrapper.CircuitBreakerGroup(
+        failure_threshold=1, clock=self.clock)
+    breaker = group.Get('a.example.com')
+    self.assertIs(breaker, group.Get('a.example.com'))
+    self.assertEqual('a.example.com', breaker.name)
+    breaker.RecordFailure()
+    group.Get('b.example.com')
+    self.assertEqual({'a.example.com': 'open', 'b.example.com': 'closed'},
+                     group.states)
+
+
+if __name__ == '__main__':
+  unittest.main()
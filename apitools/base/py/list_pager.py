@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""Iterators over the results of paginated list methods."""
+
+import collections
+import sys
+import threading
+
+from apitools.base.py import encoding
+from apitools.base.py import exceptions
+
+__all__ = [
+    'ListPager',
+    'YieldFromList',
+    ]
+
+
+class _PageBuffer(object):
+  """A bounded queue of pages, fed by a background fetching thread."""
+
+  def __init__(self, max_pages):
+    self.__max_pages = max_pages
+    self.__entries = collections.deque()
+    self.__closed = False
+    self.__cond = threading.Condition()
+
+  def WaitForSpace(self):
+    """Block until another page fits; return False if the buffer closed."""
+    with self.__cond:
+      while len(self.__entries) >= self.__max_pages and not self.__closed:
+        self.__cond.wait()
+      return not self.__closed
+
+  def Put(self, entry):
+    with self.__cond:
+      self.__entries.append(entry)
+      self.__cond.notify_all()
+
+  def Get(self):
+    with self.__cond:
+      while not self.__entries:
+        self.__cond.wait()
+      entry = self.__entries.popleft()
+      self.__cond.notify_all()
+      return entry
+
+  def Close(self):
+    with self.__cond:
+      self.__closed = True
+      self.__entries.clear()
+      self.__cond.notify_all()
+
+
+class ListPager(object):
+  """Lazily iterates over the items of every page of a list method.
+
+  Pages are requested one at a time, following the next page token of
+  each response until there is none (or limit items have been
+  produced), and the items of each page are yielded in order.
+
+  With prefetch, the next page is fetched on a background thread while
+  the caller works through the current one. At most max_buffered_pages
+  pages are fetched ahead of the caller. The background thread sends
+  its requests over the client's concurrent http object (as async
+  calls do), so the caller can keep using the client meanwhile. The
+  exception is a client created with a custom http object, which the
+  background thread shares; its callers should not make other requests
+  with the client while iterating.
+  """
+
+  def __init__(self, service, method_config, request, field,
+               global_params=None, limit=None, prefetch=False,
+               max_buffered_pages=1, current_token_attribute='pageToken',
+               next_token_attribute='nextPageToken'):
+    """Create a new pager.
+
+    Args:
+      service: (BaseApiService) the service containing the method.
+      method_config: (ApiMethodInfo) configuration for the method.
+      request: the request message for the first page; it is copied,
+          not modified.
+      field: (str) the repeated field of the response to iterate over.
+      global_params: (StandardQueryParameters, default: None) global
+          arguments for every page.
+      limit: (int, default: None) maximum number of items to produce.
+      prefetch: (bool, default: False) fetch pages in the background.
+      max_buffered_pages: (int, default: 1) with prefetch, the maximum
+          number of pages fetched ahead of the caller.
+      current_token_attribute: (str, default: 'pageToken') the page
+          token field of the request.
+      next_token_attribute: (str, default: 'nextPageToken') the next
+          page token field of the response.
+    """
+    # pylint: disable=protected-access
+    call_plan = service._GetCallPlan(method_config)
+    self.__CheckField(call_plan.request_type, current_token_attribute)
+    self.__CheckField(call_plan.response_type, next_token_attribute)
+    if not self.__CheckField(call_plan.response_type, field).repeated:
+      raise exceptions.InvalidUserInputError(
+          'Field %s of %s is not repeated' % (
+              field, call_plan.response_type.__name__))
+    if max_buffered_pages < 1:
+      raise exceptions.InvalidUserInputError(
+          'Invalid max_buffered_pages: %s' % max_buffered_pages)
+    # The fetching thread shouldn't share the client's http object,
+    # which need not be thread-safe.
+    self.__http = None
+    if prefetch:
+      try:
+        self.__http = service._client._GetConcurrentHttp()
+      except exceptions.ConfigurationValueError:
+        # A custom http object can't be replaced, so it is shared.
+        pass
+    self.__service = service
+    self.__method_config = method_config
+    self.__request = request
+    self.__field = field
+    self.__global_params = global_params
+    self.__limit = limit
+    self.__prefetch = prefetch
+    self.__max_buffered_pages = max_buffered_pages
+    self.__current_token_attribute = current_token_attribute
+    self.__next_token_attribute = next_token_attribute
+
+  @staticmethod
+  def __CheckField(message_type, field_name):
+    try:
+      return message_type.field_by_name(field_name)
+    except KeyError:
+      raise exceptions.InvalidUserInputError(
+          'No field named %s in message of type %s' % (
+              field_name, message_type.__name__))
+
+  def __iter__(self):
+    return self.__IterItems()
+
+  def __Pages(self):
+    """Fetch each page in turn, as it is requested."""
+    request = encoding.CopyProtoMessage(self.__request)
+    while True:
+      response = self.__service._RunMethod(  # pylint: disable=protected-access
+          self.__method_config, request, global_params=self.__global_params,
+          http=self.__http)
+      yield response
+      token = getattr(response, self.__next_token_attribute)
+      if not token:
+        return
+      setattr(request, self.__current_token_attribute, token)
+
+  def __PrefetchedPages(self):
+    """Fetch pages on a background thread, ahead of the caller."""
+    page_buffer = _PageBuffer(self.__max_buffered_pages)
+
+    def FetchPages():
+      pages = self.__Pages()
+      while page_buffer.WaitForSpace():
+        try:
+          page = next(pages)
+        except StopIteration:
+          page_buffer.Put((None, None))
+          return
+        except Exception:  # pylint: disable=broad-except
+          page_buffer.Put((None, sys.exc_info()))
+          return
+        page_buffer.Put((page, None))
+
+    fetcher = threading.Thread(target=FetchPages, name='apitools-list-pager')
+    fetcher.daemon = True
+    fetcher.start()
+    try:
+      while True:
+        page, exc_info = page_buffer.Get()
+        if page is None:
+          if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+          return
+        yield page
+    finally:
+      # Stops the fetcher if the caller stops iterating early.
+      page_buffer.Close()
+
+  def __IterItems(self):
+    if self.__limit is not None and self.__limit <= 0:
+      return
+    if self.__prefetch:
+      pages = self.__PrefetchedPages()
+    else:
+      pages = self.__Pages()
+    count = 0
+    try:
+      for page in pages:
+        for item in getattr(page, self.__field):
+          yield item
+          count += 1
+          if count == self.__limit:
+            return
+    finally:
+      pages.close()
+
+
+def YieldFromList(service, request, method='List', field='items',
+                  global_params=None, limit=None, prefetch=False,
+                  max_buffered_pages=1,
+                  current_token_attribute='pageToken',
+                  next_token_attribute='nextPageToken'):
+  """Iterate over the items of every page of service.method.
+
+  Args:
+    service: (BaseApiService) the service containing method.
+    request: the request message for the first page.
+    method: (str, default: 'List') the name of the list method.
+    field: (str, default: 'items') the repeated field of the response
+        to iterate over.
+    global_params: (StandardQueryParameters, default: None) global
+        arguments for every page.
+    limit: (int, default: None) maximum number of items to produce.
+    prefetch: (bool, default: False) fetch the next page on a
+        background thread while the caller works on the current one.
+    max_buffered_pages: (int, default: 1) with prefetch, the maximum
+        number of pages fetched ahead of the caller.
+    current_token_attribute: (str, default: 'pageToken') the page
+        token field of the request.
+    next_token_attribute: (str, default: 'nextPageToken') the next page
+        token field of the response.
+
+  Returns:
+    A ListPager, which yields the items lazily.
+  """
+  method_config = service.GetMethodConfig(method)
+  if method_config is None:
+    raise exceptions.InvalidUserInputError(
+        'No method %s found in service %s' % (
+            method, type(service).__name__))
+  return ListPager(
+      service, method_config, request, field, global_params=global_params,
+      limit=limit, prefetch=prefetch, max_buffered_pages=max_buffered_pages,
+      current_token_attribute=current_token_attribute,
+      next_token_attribute=next_token_attribute)
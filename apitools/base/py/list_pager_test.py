@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""Tests for list_pager, against a local fake server."""
+
+import json
+import threading
+import time
+import unittest
+import urlparse
+
+import httplib2
+
+from apitools.base.py import exceptions
+from apitools.base.py import list_pager
+from apitools.base.py.testing import fake_client
+from apitools.base.py.testing import fake_messages as messages
+from apitools.base.py.testing import fake_server
+
+_ITEMS_PER_PAGE = 3
+
+
+def _Page(request, last_page=None):
+  """Answer a list request with the page named by its pageToken."""
+  query = urlparse.parse_qs(urlparse.urlsplit(request.path).query)
+  page = int(query.get('pageToken', ['0'])[0])
+  result = {'items': [{'id': '%d-%d' % (page, i)}
+                      for i in range(_ITEMS_PER_PAGE)]}
+  if last_page is None or page < last_page:
+    result['nextPageToken'] = str(page + 1)
+  return 200, {}, json.dumps(result)
+
+
+def _ItemIds(pages):
+  return ['%d-%d' % (page, i)
+          for page in range(pages) for i in range(_ITEMS_PER_PAGE)]
+
+
+def _PagerThreads():
+  return [thread for thread in threading.enumerate()
+          if thread.name == 'apitools-list-pager']
+
+
+class ListPagerTest(fake_server.FakeServerTestCase):
+
+  def __StartServer(self, handler):
+    server = self.StartServer(handler)
+    return server, self.NewClient(
+        fake_client.FakeV1, server, http_pool_size=2)
+
+  def __Request(self):
+    return messages.FakeThingsListRequest(project='p')
+
+  def testAllPages(self):
+    _, client = self.__StartServer(lambda r: _Page(r, last_page=2))
+    request = self.__Request()
+    items = list(client.things.ListAll(request))
+    self.assertEqual(_ItemIds(3), [item.id for item in items])
+    # The caller's request is not modified.
+    self.assertEqual(self.__Request(), request)
+
+  def testResponseFields(self):
+    server, client = self.__StartServer(lambda r: _Page(r, last_page=2))
+    client.things.SetResponseFields('List', ['items.id'])
+    items = list(client.things.ListAll(self.__Request()))
+    # The mask keeps nextPageToken, so every page is fetched.
+    self.assertEqual(_ItemIds(3), [item.id for item in items])
+    for request in server.requests:
+      query = urlparse.parse_qs(urlparse.urlsplit(request.path).query)
+      self.assertEqual(['items/id,nextPageToken'], query['fields'])
+
+  def testLimit(self):
+    server, client = self.__StartServer(_Page)
+    items = list(client.things.ListAll(self.__Request(), limit=4))
+    self.assertEqual(_ItemIds(2)[:4], [item.id for item in items])
+    self.assertEqual(2, len(server.requests))
+
+  def testPrefetchAllPages(self):
+    _, client = self.__StartServer(lambda r: _Page(r, last_page=4))
+    items = client.things.ListAll(
+        self.__Request(), prefetch=True, max_buffered_pages=2)
+    self.assertEqual(_ItemIds(5), [item.id for item in items])
+    fake_server.WaitFor(lambda: not _PagerThreads())
+
+  def testPrefetchStopsWhenCallerStops(self):
+    server, client = self.__StartServer(_Page)
+    items = iter(client.things.ListAll(
+        self.__Request(), prefetch=True, max_buffered_pages=1))
+    for _ in range(_ITEMS_PER_PAGE + 1):
+      next(items)
+    # Close the iterator, as breaking out of a for loop over it would.
+    items.close()
+    fake_server.WaitFor(lambda: not _PagerThreads())
+    requests = len(server.requests)
+    # Two pages were consumed, at most one was buffered, and at most
+    # one more was in flight.
+    self.assertLessEqual(requests, 4)
+    time.sleep(0.05)
+    self.assertEqual(requests, len(server.requests))
+
+  def testPrefetchRaisesErrors(self):
+    def Handler(request):
+      if 'pageToken=1' in request.path:
+        return 500, {}, 'broken'
+      return _Page(request)
+    _, client = self.__StartServer(Handler)
+    items = iter(client.things.ListAll(self.__Request(), prefetch=True))
+    for _ in range(_ITEMS_PER_PAGE):
+      next(items)
+    self.assertRaises(exceptions.HttpError, next, items)
+    fake_server.WaitFor(lambda: not _PagerThreads())
+
+  def testPrefetchOnDefaultClient(self):
+    def Handler(request):
+      if request.path.split('?', 1)[0].endswith('/things'):
+        return _Page(request, last_page=3)
+      return fake_server.EchoId(request)
+    server = self.StartServer(Handler)
+    client = self.NewClient(fake_client.FakeV1, server)
+    items = iter(client.things.ListAll(
+        self.__Request(), prefetch=True, max_buffered_pages=2))
+    ids = [next(items).id]
+    # The caller uses the client while the fetcher is still working.
+    for i in range(3):
+      self.assertEqual(messages.Thing(id='t%d' % i), client.things.Get(
+          messages.FakeThingsGetRequest(project='p', thing='t%d' % i)))
+    ids.extend(item.id for item in items)
+    self.assertEqual(_ItemIds(4), ids)
+    # Every page was fetched over the client's pool, not its own http.
+    # pylint: disable=protected-access
+    stats = client._GetConcurrentHttp().stats
+    self.assertEqual(4, stats.hits + stats.misses)
+    self.assertEqual(7, len(server.requests))
+
+  def testPrefetchSharesCustomHttp(self):
+    server = self.StartServer(lambda r: _Page(r, last_page=1))
+    uris = []
+
+    class RecordingHttp(httplib2.Http):
+
+      def request(self, uri, *args, **kwds):  # pylint: disable=arguments-differ
+        uris.append(uri)
+        return super(RecordingHttp, self).request(uri, *args, **kwds)
+    client = self.NewClient(fake_client.FakeV1, server, http=RecordingHttp())
+    items = client.things.ListAll(self.__Request(), prefetch=True)
+    self.assertEqual(_ItemIds(2), [item.id for item in items])
+    self.assertEqual(2, len(uris))
+
+  def testYieldFromListChecksFields(self):
+    _, client = self.__StartServer(_Page)
+    self.assertRaises(exceptions.InvalidUserInputError,
+                      list_pager.YieldFromList, client.things,
+                      self.__Request(), field='nextPageToken')
+    self.assertRaises(exceptions.InvalidUserInputError,
+                      list_pager.YieldFromList, client.things,
+                      self.__Request(), method='Missing')
+
+
+if __name__ == '__main__':
+  unittest.main()
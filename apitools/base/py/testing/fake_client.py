@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""A client for the fake API used in tests, as the generator writes it."""
+
+from apitools.base.py import base_api
+from apitools.base.py.testing import fake_messages as messages
+
+
+class FakeV1(base_api.BaseApiClient):
+  """Client for the fake API, version v1."""
+
+  MESSAGES_MODULE = messages
+
+  _PACKAGE = u'fake'
+  _SCOPES = [u'https://www.googleapis.com/auth/fake']
+  _VERSION = u'v1'
+  _CLIENT_ID = 'CLIENT_ID'
+  _CLIENT_SECRET = 'CLIENT_SECRET'
+  _USER_AGENT = 'fake-test'
+  _CLIENT_CLASS_NAME = u'FakeV1'
+  _URL_VERSION = u'v1'
+
+  def __init__(self, url, credentials=None,
+               get_credentials=False, http=None, model=None,
+               log_request=False, log_response=False,
+               default_global_params=None, http_pool_size=None):
+    """Create a new fake handle, for the server at url."""
+    super(FakeV1, self).__init__(
+        url, credentials=credentials,
+        get_credentials=get_credentials, http=http, model=model,
+        log_request=log_request, log_response=log_response,
+        default_global_params=default_global_params,
+        http_pool_size=http_pool_size)
+    self.things = self.ThingsService(self)
+
+  class ThingsService(base_api.BaseApiService):
+    """Service class for the things resource."""
+
+    _METHOD_CONFIGS = base_api.FreezeConfigs({
+        'Get': base_api.ApiMethodInfo(
+            http_method=u'GET',
+            method_id=u'fake.things.get',
+            ordered_params=[u'project', u'thing'],
+            path_params=[u'project', u'thing'],
+            query_params=[],
+            relative_path=u'projects/{project}/things/{thing}',
+            request_field='',
+            request_type_name=u'FakeThingsGetRequest',
+            response_type_name=u'Thing',
+            supports_download=False,
+        ),
+        'Insert': base_api.ApiMethodInfo(
+            http_method=u'POST',
+            method_id=u'fake.things.insert',
+            ordered_params=[u'project'],
+            path_params=[u'project'],
+            query_params=[],
+            relative_path=u'projects/{project}/things',
+            request_field=u'thing',
+            request_type_name=u'FakeThingsInsertRequest',
+            response_type_name=u'Thing',
+            supports_download=False,
+        ),
+        'List': base_api.ApiMethodInfo(
+            http_method=u'GET',
+            method_id=u'fake.things.list',
+            ordered_params=[u'project'],
+            path_params=[u'project'],
+            query_params=[u'maxResults', u'pageToken'],
+            relative_path=u'projects/{project}/things',
+            request_field='',
+            request_type_name=u'FakeThingsListRequest',
+            response_type_name=u'ThingList',
+            supports_download=False,
+        ),
+    })
+
+    def Get(self, request, global_params=None):
+      config = self.GetMethodConfig('Get')
+      return self._RunMethod(
+          config, request, global_params=global_params)
+
+    def GetAsync(self, request, global_params=None):
+      config = self.GetMethodConfig('Get')
+      return self._RunMethodAsync(
+          config, request, global_params=global_params)
+
+    def Insert(self, request, global_params=None):
+      config = self.GetMethodConfig('Insert')
+      return self._RunMethod(
+          config, request, global_params=global_params)
+
+    def List(self, request, global_params=None):
+      config = self.GetMethodConfig('List')
+      return self._RunMethod(
+          config, request, global_params=global_params)
+
+    def ListAll(self, request, global_params=None, limit=None,
+                prefetch=False, max_buffered_pages=1):
+      config = self.GetMethodConfig('List')
+      return self._RunMethodPaged(
+          config, request, 'items', global_params=global_params,
+          limit=limit, prefetch=prefetch,
+          max_buffered_pages=max_buffered_pages)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""Messages for the fake API used in tests, as the generator writes them."""
+
+from protorpc import messages
+
+from apitools.base.py import encoding
+
+
+class StandardQueryParameters(messages.Message):
+  """Query parameters accepted by all methods.
+
+  Fields:
+    alt: Data format for the response.
+    fields: Selector specifying which fields to include in a partial
+        response.
+    key: API key.
+    prettyPrint: Returns response with indentations and line breaks.
+  """
+
+  class AltValueValuesEnum(messages.Enum):
+    """Data format for the response."""
+    json = 0
+
+  alt = messages.EnumField('AltValueValuesEnum', 1, default=u'json')
+  fields = messages.StringField(2)
+  key = messages.StringField(3)
+  prettyPrint = messages.BooleanField(4, default=True)
+
+
+@encoding.MapUnrecognizedFields('additionalProperties')
+class Labels(messages.Message):
+  """A map of label names to values.
+
+  Fields:
+    additionalProperties: The labels.
+  """
+
+  class AdditionalProperty(messages.Message):
+    """A single label.
+
+    Fields:
+      key: Name of the label.
+      value: Value of the label.
+    """
+    key = messages.StringField(1)
+    value = messages.StringField(2)
+
+  additionalProperties = messages.MessageField(
+      'AdditionalProperty', 1, repeated=True)
+
+
+class Thing(messages.Message):
+  """A thing.
+
+  Enums:
+    ColorValueValuesEnum: The color of the thing.
+
+  Fields:
+    color: The color of the thing.
+    data: Opaque data.
+    id: The id of the thing.
+    labels: Labels on the thing.
+    size: The size of the thing.
+    tags: Tags on the thing.
+  """
+
+  class ColorValueValuesEnum(messages.Enum):
+    """The color of the thing."""
+    RED = 0
+    BLUE = 1
+
+  color = messages.EnumField('ColorValueValuesEnum', 1)
+  data = messages.BytesField(2)
+  id = messages.StringField(3)
+  labels = messages.MessageField('Labels', 4)
+  size = messages.IntegerField(5)
+  tags = messages.StringField(6, repeated=True)
+
+
+class ThingList(messages.Message):
+  """A page of things.
+
+  Fields:
+    items: The things.
+    nextPageToken: Token for the next page, if any.
+  """
+  items = messages.MessageField('Thing', 1, repeated=True)
+  nextPageToken = messages.StringField(2)
+
+
+class FakeThingsGetRequest(messages.Message):
+  """A FakeThingsGetRequest object.
+
+  Fields:
+    project: The project.
+    thing: The thing.
+  """
+  project = messages.StringField(1, required=True)
+  thing = messages.StringField(2, required=True)
+
+
+class FakeThingsInsertRequest(messages.Message):
+  """A FakeThingsInsertRequest object.
+
+  Fields:
+    project: The project.
+    thing: A Thing resource to be passed as the request body.
+  """
+  project = messages.StringField(1, required=True)
+  thing = messages.MessageField('Thing', 2)
+
+
+class FakeThingsListRequest(messages.Message):
+  """A FakeThingsListRequest object.
+
+  Fields:
+    maxResults: Maximum number of things to return.
+    pageToken: Token for the page to return.
+    project: The project.
+  """
+  maxResults = messages.IntegerField(1, variant=messages.Variant.UINT32)
+  pageToken = messages.StringField(2)
+  project = messages.StringField(3, required=True)
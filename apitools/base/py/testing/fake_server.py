@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""A local HTTP server that answers requests from a script, for tests."""
+
+import BaseHTTPServer
+import collections
+import json
+import SocketServer
+import threading
+import time
+import unittest
+
+__all__ = [
+    'EchoId',
+    'FakeServer',
+    'FakeServerTestCase',
+    'RecordedRequest',
+    'WaitFor',
+    ]
+
+
+class RecordedRequest(collections.namedtuple(
+    'RecordedRequest', ['method', 'path', 'headers', 'body'])):
+  """A request received by a FakeServer.
+
+  Fields:
+    method: (str) the HTTP verb.
+    path: (str) the path and query of the request.
+    headers: (dict) the request headers, with lowercase names.
+    body: (str) the request body.
+  """
+  __slots__ = ()
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Passes every request to the FakeServer that owns the server."""
+
+  def __Handle(self):
+    length = int(self.headers.get('content-length') or 0)
+    request = RecordedRequest(
+        method=self.command, path=self.path,
+        headers=dict((k.lower(), v) for k, v in self.headers.items()),
+        body=self.rfile.read(length))
+    status, headers, body = self.server.fake_server.Respond(request)
+    self.send_response(status)
+    for name, value in headers.iteritems():
+      self.send_header(name, value)
+    self.send_header('content-length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  do_DELETE = do_GET = do_PATCH = do_POST = do_PUT = __Handle
+
+  def log_message(self, *args):  # pylint: disable=arguments-differ
+    pass
+
+
+class _ThreadingHttpServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+
+class FakeServer(object):
+  """An HTTP server on localhost, answering requests from a script.
+
+  Responses are queued with AddResponse, and each request is answered
+  with the next one in order. Once the script runs out, requests are
+  passed to the default handler, if one is set, or answered with a
+  500. Every request is recorded in requests.
+
+  A FakeServer is used as a context manager, which starts and stops
+  the server.
+  """
+
+  def __init__(self, default_handler=None):
+    self.__script = collections.deque()
+    self.__requests = []
+    self.__lock = threading.Lock()
+    self.__default_handler = default_handler
+    self.__httpd = None
+    self.__thread = None
+
+  @property
+  def url(self):
+    return 'http://%s:%d/' % self.__httpd.server_address
+
+  @property
+  def requests(self):
+    with self.__lock:
+      return list(self.__requests)
+
+  def AddResponse(self, status=200, body='', headers=None):
+    """Queue the response to send to the next unanswered request."""
+    with self.__lock:
+      self.__script.append((status, dict(headers or {}), body))
+
+  def Respond(self, request):
+    """Record request, and return its (status, headers, body)."""
+    with self.__lock:
+      self.__requests.append(request)
+      if self.__script:
+        return self.__script.popleft()
+    if self.__default_handler is not None:
+      return self.__default_handler(request)
+    return 500, {}, 'No response scripted for %s %s' % (
+        request.method, request.path)
+
+  def Start(self):
+    self.__httpd = _ThreadingHttpServer(('127.0.0.1', 0), _Handler)
+    self.__httpd.fake_server = self
+    # A short poll interval keeps Stop quick.
+    self.__thread = threading.Thread(
+        target=self.__httpd.serve_forever, kwargs={'poll_interval': 0.01})
+    self.__thread.daemon = True
+    self.__thread.start()
+
+  def Stop(self):
+    self.__httpd.shutdown()
+    self.__httpd.server_close()
+    self.__thread.join()
+
+  def __enter__(self):
+    self.Start()
+    return self
+
+  def __exit__(self, *unused_exc_info):
+    self.Stop()
+
+
+def EchoId(request):
+  """Answer with a JSON object whose id is the last segment of the path."""
+  path = request.path.split('?', 1)[0]
+  return 200, {'content-type': 'application/json'}, json.dumps(
+      {'id': path.rsplit('/', 1)[-1]})
+
+
+def WaitFor(condition, timeout=5.0):
+  """Poll until condition() is true; fail after timeout seconds."""
+  deadline = time.time() + timeout
+  while not condition():
+    if time.time() > deadline:
+      raise AssertionError('Timed out waiting for condition')
+    time.sleep(0.001)
+
+
+class FakeServerTestCase(unittest.TestCase):
+  """A test case which starts FakeServers and clients, and stops them."""
+
+  def StartServer(self, default_handler=None):
+    """Start a FakeServer, which is stopped when the test finishes."""
+    server = FakeServer(default_handler=default_handler)
+    server.Start()
+    self.addCleanup(server.Stop)
+    return server
+
+  def NewClient(self, client_class, server, **kwds):
+    """Create a client_class for server, shut down when the test finishes."""
+    client = client_class(server.url, **kwds)
+    self.addCleanup(client.ShutdownExecutor)
+    return client
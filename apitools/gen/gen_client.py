@@ -124,9 +124,12 @@ def _WriteBaseFiles(codegen):
   with util.Chdir(codegen.outdir):
     _CopyLocalFile('app2.py')
     _CopyLocalFile('base_api.py')
+    _CopyLocalFile('batch.py')
     _CopyLocalFile('base_cli.py')
     _CopyLocalFile('credentials_lib.py')
     _CopyLocalFile('exceptions.py')
+    _CopyLocalFile('http_wrapper.py')
+    _CopyLocalFile('list_pager.py')
 
 
 def _WriteProtoFiles(codegen):
@@ -6,6 +6,7 @@ import logging
 import re
 import textwrap
 
+from protorpc import descriptor
 
 from apitools.base.py import base_api
 from apitools.gen import util
@@ -28,6 +29,8 @@ class ServiceRegistry(object):
     self.__root_package_dir = root_package_dir
     self.__base_files_package = base_files_package
     self.__all_scopes = set(self.__client_info.scopes)
+    # Maps method ids of paginated methods to the field they list.
+    self.__pager_fields = {}
 
   def Validate(self):
     self.__message_registry.Validate()
@@ -67,12 +70,79 @@ class ServiceRegistry(object):
     printer('  (%s) The response message.', method_info.response_type_name)
     printer('"""')
 
+  def __PrintAsyncDocstring(self, printer, method_info, method_name):
+    """Print a docstring for the non-blocking variant of a method."""
+    printer('"""Non-blocking variant of %s.', method_name)
+    printer()
+    printer('The request is sent from the client\'s executor, over its')
+    printer('http pool (or, unless the client was created with a custom')
+    printer('http object, a pool created on first use).')
+    printer('Each call in flight occupies one of the executor\'s threads;')
+    printer('at most client.async_max_workers (by default, the size of')
+    printer('the http pool) run at once, and later calls are queued.')
+    printer()
+    printer('Args:')
+    printer('  request: (%s) input message', method_info.request_type_name)
+    printer('  global_params: (StandardQueryParameters, default: None) '
+            'global arguments')
+    printer('Returns:')
+    printer('  A future for the (%s) response message.',
+            method_info.response_type_name)
+    printer('"""')
+
+  def __PrintPagedDocstring(self, printer, method_info, method_name,
+                            field):
+    """Print a docstring for the auto-paginating variant of a method."""
+    printer('"""Iterate over the %s of every page of %s.', field, method_name)
+    printer()
+    printer('Args:')
+    printer('  request: (%s) input message for the first page',
+            method_info.request_type_name)
+    printer('  global_params: (StandardQueryParameters, default: None) '
+            'global arguments')
+    printer('  limit: (int, default: None) maximum number of items')
+    printer('  prefetch: (bool, default: False) fetch the next page in')
+    printer('      the background while the current one is processed')
+    printer('  max_buffered_pages: (int, default: 1) maximum number of')
+    printer('      pages fetched ahead when prefetching')
+    printer('Returns:')
+    printer('  An iterator over the %s of each (%s) response.',
+            field, method_info.response_type_name)
+    printer('"""')
+
+  def __WriteConfigs(self, printer, attr_name, configs, config_class):
+    """Write a class-level dict mapping method names to frozen configs."""
+    if not configs:
+      return
+    printer()
+    printer('%s = base_api.FreezeConfigs({', attr_name)
+    with printer.Indent(indent='    '):
+      for method_name, config in configs:
+        printer("'%s': base_api.%s(", method_name, config_class)
+        with printer.Indent(indent='    '):
+          attrs = sorted(x.name for x in config.all_fields())
+          for attr in attrs:
+            if attr in ('upload_config', 'description'):
+              continue
+            printer('%s=%r,', attr, getattr(config, attr))
+        printer('),')
+    printer('})')
+
   def __WriteSingleService(self, printer, name, method_info_map):
     printer()
     class_name = self.__GetServiceClassName(name)
     printer('class %s(base_api.BaseApiService):', class_name)
     with printer.Indent():
       printer('"""Service class for the %s resource."""', name)
+      self.__WriteConfigs(
+          printer, '_METHOD_CONFIGS', method_info_map.items(),
+          'ApiMethodInfo')
+      self.__WriteConfigs(
+          printer, '_UPLOAD_CONFIGS',
+          [(method_name, method_info.upload_config)
+           for method_name, method_info in method_info_map.iteritems()
+           if method_info.upload_config is not None],
+          'ApiUploadInfo')
       for method_name, method_info in method_info_map.iteritems():
         printer()
         params = ['self', 'request', 'global_params=None']
@@ -83,23 +153,9 @@ class ServiceRegistry(object):
         printer('def %s(%s):', method_name, ', '.join(params))
         with printer.Indent():
           self.__PrintDocstring(printer, method_info, method_name, name)
-          printer('config = base_api.ApiMethodInfo(')
-          with printer.Indent(indent='    '):
-            attrs = sorted(x.name for x in method_info.all_fields())
-            for attr in attrs:
-              if attr in ('upload_config', 'description'):
-                continue
-              printer('%s=%r,', attr, getattr(method_info, attr))
-          printer(')')
-
-          upload_config = method_info.upload_config
-          if upload_config is not None:
-            printer('upload_config = base_api.ApiUploadInfo(')
-            with printer.Indent(indent='    '):
-              attrs = sorted(x.name for x in upload_config.all_fields())
-              for attr in attrs:
-                printer('%s=%r,', attr, getattr(upload_config, attr))
-            printer(')')
+          printer("config = self.GetMethodConfig('%s')", method_name)
+          if method_info.upload_config is not None:
+            printer("upload_config = self.GetUploadConfig('%s')", method_name)
 
           arg_lines = ['config, request, global_params=global_params']
           if method_info.upload_config:
@@ -112,6 +168,39 @@ class ServiceRegistry(object):
               printer('%s,', line)
             printer('%s)', arg_lines[-1])
 
+        # Media transfers are stateful, so they are only available
+        # through the synchronous methods.
+        async_name = '%sAsync' % method_name
+        if not (method_info.upload_config or method_info.supports_download or
+                async_name in method_info_map):
+          printer()
+          printer('def %s(self, request, global_params=None):', async_name)
+          with printer.Indent():
+            self.__PrintAsyncDocstring(printer, method_info, method_name)
+            printer("config = self.GetMethodConfig('%s')", method_name)
+            printer('return self._RunMethodAsync(')
+            with printer.Indent(indent='    '):
+              printer('config, request, global_params=global_params)')
+
+        pager_field = self.__pager_fields.get(method_info.method_id)
+        paged_name = '%sAll' % method_name
+        if pager_field is not None and paged_name not in method_info_map:
+          printer()
+          printer('def %s(self, request, global_params=None, limit=None,',
+                  paged_name)
+          printer('     %sprefetch=False, max_buffered_pages=1):',
+                  ' ' * len(paged_name))
+          with printer.Indent():
+            self.__PrintPagedDocstring(
+                printer, method_info, method_name, pager_field)
+            printer("config = self.GetMethodConfig('%s')", method_name)
+            printer('return self._RunMethodPaged(')
+            with printer.Indent(indent='    '):
+              printer("config, request, '%s', global_params=global_params,",
+                      pager_field)
+              printer('limit=limit, prefetch=prefetch,')
+              printer('max_buffered_pages=max_buffered_pages)')
+
   def __WriteProtoServiceDeclaration(self, printer, name, method_info_map):
     """Write a single service declaration to a proto file."""
     printer()
@@ -169,7 +258,7 @@ class ServiceRegistry(object):
       printer("def __init__(self, url='', credentials=None,")
       printer('             get_credentials=True, http=None, model=None,')
       printer('             log_request=False, log_response=False,')
-      printer('             default_global_params=None):')
+      printer('             default_global_params=None, http_pool_size=None):')
       with printer.Indent():
         printer('"""Create a new %s handle."""', client_info.package)
         printer('url = url or %r', self.__base_url)
@@ -177,7 +266,8 @@ class ServiceRegistry(object):
         printer('    url, credentials=credentials,')
         printer('    get_credentials=get_credentials, http=http, model=model,')
         printer('    log_request=log_request, log_response=log_response,')
-        printer('    default_global_params=default_global_params)')
+        printer('    default_global_params=default_global_params,')
+        printer('    http_pool_size=http_pool_size)')
         for name in self.__service_method_info_map.iterkeys():
           printer('self.%s = self.%s(self)',
                   name, self.__GetServiceClassName(name))
@@ -321,6 +411,24 @@ class ServiceRegistry(object):
     method_info.query_params.sort()
     return method_info
 
+  def __ComputePagerField(self, request, response):
+    """Find the repeated field to page through, if this method pages."""
+    request_message = self.__message_registry.LookupDescriptor(request)
+    response_message = self.__message_registry.LookupDescriptor(response)
+    if request_message is None or response_message is None:
+      return None
+    if ('pageToken' not in [f.name for f in request_message.fields] or
+        'nextPageToken' not in [f.name for f in response_message.fields]):
+      return None
+    repeated = descriptor.FieldDescriptor.Label.REPEATED
+    repeated_fields = [f.name for f in response_message.fields
+                       if f.field_descriptor.label == repeated]
+    if 'items' in repeated_fields:
+      return 'items'
+    if len(repeated_fields) == 1:
+      return repeated_fields[0]
+    return None
+
   def __BodyFieldName(self, body_type):
     if body_type is None:
       return ''
@@ -373,6 +481,10 @@ class ServiceRegistry(object):
 
       method_info_map[method_name] = self.__ComputeMethodInfo(
           method_description, request, response, request_field)
+      pager_field = self.__ComputePagerField(request, response)
+      if pager_field is not None:
+        self.__pager_fields[method_info_map[method_name].method_id] = (
+            pager_field)
       self.__command_registry.AddCommandForMethod(
           service_name, method_name, method_info_map[method_name],
           request, response)
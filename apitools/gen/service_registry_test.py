@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""Tests for the services written by service_registry."""
+
+import json
+import StringIO
+import sys
+import types
+import unittest
+import urlparse
+
+from apitools.base.py import base_api
+from apitools.base.py.testing import fake_server
+from apitools.gen import gen_client_lib
+from apitools.gen import util
+
+_DISCOVERY_DOC = {
+    'name': 'fake',
+    'version': 'v1',
+    'rootUrl': 'https://www.example.com/',
+    'servicePath': 'fake/v1/',
+    'description': 'A fake API.',
+    'parameters': {
+        'alt': {'type': 'string', 'default': 'json', 'enum': ['json'],
+                'enumDescriptions': ['JSON'], 'location': 'query'},
+        },
+    'schemas': {
+        'Thing': {
+            'id': 'Thing',
+            'type': 'object',
+            'properties': {'id': {'type': 'string'}},
+            },
+        'ThingList': {
+            'id': 'ThingList',
+            'type': 'object',
+            'properties': {
+                'items': {'type': 'array', 'items': {'$ref': 'Thing'}},
+                'nextPageToken': {'type': 'string'},
+                },
+            },
+        },
+    'resources': {
+        'things': {
+            'methods': {
+                'get': {
+                    'id': 'fake.things.get',
+                    'path': 'things/{thing}',
+                    'httpMethod': 'GET',
+                    'parameters': {
+                        'thing': {'type': 'string', 'required': True,
+                                  'location': 'path'},
+                        },
+                    'parameterOrder': ['thing'],
+                    'response': {'$ref': 'Thing'},
+                    },
+                'list': {
+                    'id': 'fake.things.list',
+                    'path': 'things',
+                    'httpMethod': 'GET',
+                    'parameters': {
+                        'pageToken': {'type': 'string',
+                                      'location': 'query'},
+                        },
+                    'response': {'$ref': 'ThingList'},
+                    },
+                'insert': {
+                    'id': 'fake.things.insert',
+                    'path': 'things',
+                    'httpMethod': 'POST',
+                    'request': {'$ref': 'Thing'},
+                    'response': {'$ref': 'Thing'},
+                    'supportsMediaUpload': True,
+                    'mediaUpload': {
+                        'accept': ['*/*'],
+                        'maxSize': '1MB',
+                        'protocols': {
+                            'simple': {'multipart': True,
+                                       'path': '/upload/fake/v1/things'},
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    }
+
+
+def _Generate(write_method):
+  names = util.Names([])
+  client_info = util.ClientInfo.Create(
+      _DISCOVERY_DOC, ['https://www.googleapis.com/auth/fake'], 'CLIENT_ID',
+      'CLIENT_SECRET', 'fake-test', names, None)
+  generator = gen_client_lib.DescriptorGenerator(
+      _DISCOVERY_DOC, client_info, names, 'fake', '/nonexistent')
+  out = StringIO.StringIO()
+  getattr(generator, write_method)(out)
+  return out.getvalue()
+
+
+def _LoadGeneratedClient():
+  """Execute the generated messages and client, and return both modules."""
+  messages_module = types.ModuleType('fake_v1_messages')
+  exec _Generate('WriteMessagesFile') in messages_module.__dict__
+  # protorpc resolves message field types by importing their module.
+  sys.modules[messages_module.__name__] = messages_module
+  client_module = types.ModuleType('fake_v1_client')
+  client_module.base_api = base_api
+  client_module.messages = messages_module
+  exec _Generate('WriteClientLibrary') in client_module.__dict__
+  return client_module, messages_module
+
+
+def _Page(request):
+  """Answer a list request with the page named by its pageToken."""
+  query = urlparse.parse_qs(urlparse.urlsplit(request.path).query)
+  page = int(query.get('pageToken', ['0'])[0])
+  result = {'items': [{'id': '%d-%d' % (page, i)} for i in range(2)]}
+  if page < 2:
+    result['nextPageToken'] = str(page + 1)
+  return 200, {}, json.dumps(result)
+
+
+class AsyncMethodTest(fake_server.FakeServerTestCase):
+
+  def testAsyncMethodWritten(self):
+    source = _Generate('WriteClientLibrary')
+    self.assertIn('def GetAsync(self, request, global_params=None):', source)
+    self.assertIn('http pool (or, unless the client was created', source)
+    self.assertIn('at most client.async_max_workers', source)
+
+  def testAsyncMethodOnDefaultClient(self):
+    # Hold on to the modules, since their globals are cleared when
+    # they are freed.
+    client_module, messages_module = _LoadGeneratedClient()
+    server = self.StartServer(fake_server.EchoId)
+    client = self.NewClient(
+        client_module.FakeV1, server, get_credentials=False)
+    future = client.things.GetAsync(
+        messages_module.FakeThingsGetRequest(thing='t1'))
+    self.assertEqual(messages_module.Thing(id='t1'), future.result(timeout=5))
+    request, = server.requests
+    self.assertEqual(('GET', '/things/t1?alt=json'),
+                     (request.method, request.path))
+
+
+class MethodConfigTest(unittest.TestCase):
+
+  def testConfigsWritten(self):
+    source = _Generate('WriteClientLibrary')
+    self.assertIn('_METHOD_CONFIGS = base_api.FreezeConfigs({', source)
+    self.assertIn('_UPLOAD_CONFIGS = base_api.FreezeConfigs({', source)
+
+  def testConfigsFrozen(self):
+    client_module, _ = _LoadGeneratedClient()
+    client = client_module.FakeV1(get_credentials=False)
+    service = client.things
+    config = service.GetMethodConfig('Get')
+    self.assertEqual('fake.things.get', config.method_id)
+    self.assertEqual(('thing',), config.path_params)
+    # Every call, and every client, shares the one frozen config.
+    self.assertIs(config, service.GetMethodConfig('Get'))
+    self.assertIs(config, client_module.FakeV1(
+        get_credentials=False).things.GetMethodConfig('Get'))
+    self.assertRaises(AttributeError, setattr, config, 'method_id', 'x')
+
+    upload_config = service.GetUploadConfig('Insert')
+    self.assertEqual(('*/*',), upload_config.accept)
+    self.assertEqual(1 << 20, upload_config.max_size)
+    self.assertEqual('/upload/fake/v1/things', upload_config.simple_path)
+    self.assertIs(upload_config, service.GetUploadConfig('Insert'))
+    self.assertRaises(AttributeError, setattr, upload_config, 'max_size', 1)
+    self.assertIsNone(service.GetUploadConfig('Get'))
+
+
+class PagedMethodTest(fake_server.FakeServerTestCase):
+
+  def testPagedMethodWritten(self):
+    source = _Generate('WriteClientLibrary')
+    self.assertIn('def ListAll(self, request, global_params=None, limit=None,',
+                  source)
+    # Get has no pageToken, so it gets no paged variant.
+    self.assertEqual(1, source.count('All(self, request'))
+
+  def testPagedMethod(self):
+    client_module, messages_module = _LoadGeneratedClient()
+    server = self.StartServer(_Page)
+    client = self.NewClient(client_module.FakeV1, server,
+                            get_credentials=False, http_pool_size=2)
+    expected = ['%d-%d' % (page, i) for page in range(3) for i in range(2)]
+    for prefetch in (False, True):
+      sent = len(server.requests)
+      items = client.things.ListAll(
+          messages_module.FakeThingsListRequest(), prefetch=prefetch)
+      self.assertEqual(expected, [item.id for item in items])
+      queries = [urlparse.parse_qs(urlparse.urlsplit(request.path).query)
+                 for request in server.requests[sent:]]
+      self.assertEqual([None, '1', '2'], sorted(
+          query.get('pageToken', [None])[0] for query in queries))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -27,6 +27,7 @@ import setuptools
 # Python version and OS.
 REQUIRED_PACKAGES = [
     'ez-setup==0.9',
+    'futures==2.1.6',
     'google-api-python-client==1.2',
     'google-apputils==0.4.0',
     'protorpc==0.9.1',